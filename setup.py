@@ -0,0 +1,17 @@
+# Build configuration for the compiled parts of starling, everything else is declared in pyproject.toml.
+# The clock_nanosleep based Rate loop is POSIX only (and missing on macOS), elsewhere starling.rate falls back to pure Python.
+import sys
+from setuptools import setup, Extension
+
+ext_modules = []
+if sys.platform.startswith("linux"):
+    try:
+        from Cython.Build import cythonize
+        ext_modules = cythonize(
+            [Extension("starling._rate", ["starling/_rate.pyx"], optional=True)],
+            compiler_directives={"language_level": "3"},
+        )
+    except ImportError:
+        pass
+
+setup(ext_modules=ext_modules)
@@ -2,6 +2,7 @@ from .nexus import StarlingNexus
 from .subscription import NexusSubscriber
 from .publication import NexusPublisher
 from .snapshot_logger import SnapshotCollector
+from .aio import AsyncNexusSubscriber, AsyncNexusPublisher
 
 import msgspec
 
@@ -10,11 +11,14 @@ __all__ = [
     "NexusSubscriber",
     "NexusPublisher",
     "SnapshotCollector",
+    "AsyncNexusSubscriber",
+    "AsyncNexusPublisher",
     "msgspec",
     "nexus",
     "subscription",
     "publication",
     "snapshot_logger",
+    "aio",
 ]
 
 __version__ = "0.1.0a"
\ No newline at end of file
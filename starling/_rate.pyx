@@ -2,6 +2,9 @@ from libc.stdint cimport int64_t
 from posix.time cimport timespec, clock_gettime, CLOCK_MONOTONIC, clock_nanosleep, TIMER_ABSTIME
 from libc.stdio cimport printf
 
+cdef enum:
+    HIST_BUCKETS = 32
+
 cdef inline int64_t to_nsec(timespec ts):
     return (ts.tv_sec * 1_000_000_000) + ts.tv_nsec
 
@@ -14,15 +17,30 @@ cdef inline timespec to_timespec(int64_t ns):
     ts.tv_nsec = ns % 1_000_000_000
     return ts
 
+cdef inline int hist_bucket(int64_t late_ns):
+    # Bucket 0 holds lateness under 1us, bucket i holds [2^(i-1), 2^i) us
+    cdef int64_t late_us = late_ns // 1000
+    cdef int bucket = 0
+    while late_us > 0 and bucket < HIST_BUCKETS - 1:
+        late_us >>= 1
+        bucket += 1
+    return bucket
+
 cdef class Rate:
     cdef int64_t period_ns  # in nanoseconds
     cdef int64_t tol_ns  # in nanoseconds
     cdef timespec now
     cdef timespec sched
-    cdef double rate  # in Hz
+    cdef readonly double rate  # in Hz
     cdef double tolerance  # in %
-    cdef bint slow
+    cdef readonly bint slow
     cdef bint verbose
+    # Overrun statistics
+    cdef int64_t iterations
+    cdef int64_t missed
+    cdef int64_t max_late_ns
+    cdef int64_t total_late_ns
+    cdef int64_t hist[HIST_BUCKETS]
 
     def __cinit__(self):
         self.period_ns = 0
@@ -33,6 +51,7 @@ cdef class Rate:
         self.tolerance = 0.0
         self.slow = False
         self.verbose = False
+        self.reset_stats()
         self.reset()
 
     def __init__(self, double rate, double tolerance=0.1, bint verbose=True): # rate in Hz, tolerance in %
@@ -43,18 +62,37 @@ cdef class Rate:
         self.period_ns = <int64_t>(1e9 / self.rate)  # Convert rate to period in nanoseconds
         self.tol_ns = <int64_t>(self.tolerance * self.period_ns)  # Convert tolerance to nanoseconds
 
-    cdef reset(self): # Reset the loop to start at the current time
+    cpdef reset(self): # Reset the loop to start at the current time
         clock_gettime(CLOCK_MONOTONIC, &self.now)
         self.sched = self.now
 
+    cpdef reset_stats(self):
+        cdef int i
+        self.iterations = 0
+        self.missed = 0
+        self.max_late_ns = 0
+        self.total_late_ns = 0
+        for i in range(HIST_BUCKETS):
+            self.hist[i] = 0
+
+    cdef void record(self, int64_t late_ns):
+        self.iterations += 1
+        self.total_late_ns += late_ns
+        if late_ns > self.max_late_ns:
+            self.max_late_ns = late_ns
+        self.hist[hist_bucket(late_ns)] += 1
+
     cpdef sleep(self):
         self.sched = to_timespec(to_nsec(self.sched) + self.period_ns)
         clock_gettime(CLOCK_MONOTONIC, &self.now)
-        
+
         cdef int64_t now_nsec = to_nsec(self.now)
         cdef int64_t sched_nsec = to_nsec(self.sched)
+        cdef timespec woke
 
         if now_nsec > sched_nsec:
+            self.missed += 1
+            self.record(now_nsec - sched_nsec)
             if (now_nsec - sched_nsec) > self.tol_ns: # If we're behind by more than the tolerance, we are slow
                 if self.verbose: printf("WARNING: Loop slower than desired\n")
                 self.slow = True
@@ -66,7 +104,21 @@ cdef class Rate:
         self.slow = False
         with nogil:
             clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &self.sched, NULL)
+            clock_gettime(CLOCK_MONOTONIC, &woke)
+        self.record(to_nsec(woke) - sched_nsec)
         return to_sec(self.now)
 
+    def stats(self):
+        """Overrun statistics since creation or the last `reset_stats()`. Lateness is how long after its deadline each
+        iteration was released, either because the loop body overran (a missed deadline) or from wake-up jitter.
+        The histogram is a list of (upper_bound_seconds, count) pairs with power of two microsecond bucket bounds."""
+        return {
+            'iterations': self.iterations,
+            'missed': self.missed,
+            'max_lateness': self.max_late_ns / 1e9,
+            'mean_lateness': (self.total_late_ns / self.iterations / 1e9) if self.iterations else 0.0,
+            'histogram': [((1 << i) / 1e6, self.hist[i]) for i in range(HIST_BUCKETS)],
+        }
+
     def __call__(self):
-        return self.sleep()
\ No newline at end of file
+        return self.sleep()
@@ -0,0 +1,377 @@
+# asyncio versions of the nexus publisher and subscriber. Discovery, receiving and dispatch all happen as tasks inside a single
+# event loop, so messages reach coroutines without crossing a thread boundary or a queue.Queue.
+import asyncio
+import inspect
+import traceback
+import uuid
+from typing import AsyncIterator, Union
+
+import zmq
+import zmq.asyncio
+
+import starling.simpleudp
+from starling.direct import DIRECT_TOPIC, DIRECT_RAW, DirectPeers
+from starling.discovery import NexusTracker, TRANSPORTS
+from starling.sequence import Sequencer, SequenceStats
+from starling.shm import SHM_AVAILABLE, ShmRings
+import starling.schema
+from starling.matching import TopicMatcher
+from starling.publication import NexusPublisher, PublisherTopic, TypedPublisherTopic
+from starling.subscription import validate_topic
+
+MEDIUM = 10_000
+NEXUS_PORT = 8899
+
+STOP = object() # Sentinel put on a sink's queue when it is unsubscribed
+
+
+def _log_task_exception(task: asyncio.Task):
+    """Done callback printing the exception a background task died with, which would otherwise never be retrieved."""
+    if task.cancelled(): return
+    exc = task.exception()
+    if exc is not None:
+        traceback.print_exception(type(exc), exc, exc.__traceback__)
+
+
+class AsyncPublisherTopic(PublisherTopic):
+    """A topic handle for `AsyncNexusPublisher`, whose `send` is awaited like the publisher's."""
+    __slots__ = ()
+
+    async def send(self, message: bytes, copy: bool=True, track: bool=False):
+        """Publish a message on this topic, see `AsyncNexusPublisher.send`."""
+        return await self.publisher._send_raw(self.raw, message, copy, track)
+
+
+class AsyncTypedPublisherTopic(TypedPublisherTopic):
+    """A typed topic handle for `AsyncNexusPublisher`, see `TypedPublisherTopic`."""
+    __slots__ = ()
+
+    async def send(self, message, copy: bool=True, track: bool=False):
+        """Encode and publish a `schema` instance on this topic."""
+        return await self.publisher._send_raw(self.raw, self.encode(message), copy, track)
+
+
+class _NexusDiscovery():
+    """Listens for nexus heartbeats (the same UDP protocol as `simpleudp.UDPBroadcaster`) from the event loop, calling
+    `on_home_changed()` whenever the home nexus (see `NexusTracker`) changes, and forgets nexuses that go quiet."""
+    def __init__(self, on_home_changed: callable, ctx: zmq.asyncio.Context=None, transports: tuple=TRANSPORTS):
+        self.loop = asyncio.get_running_loop()
+        self.udp = starling.simpleudp.UDPBroadcaster(port=NEXUS_PORT)
+        self.udp.sock.setblocking(False)
+        self.tracker = NexusTracker(ctx, transports)
+        self.nexus = self.tracker.nexus
+        self.on_home_changed = on_home_changed
+        self.loop.add_reader(self.udp.sock.fileno(), self._on_heartbeat)
+        self.watchdog_task = self.loop.create_task(self._watchdog_loop())
+        self.watchdog_task.add_done_callback(_log_task_exception)
+
+    def _on_heartbeat(self):
+        try:
+            message, addr = self.udp.recv()
+        except BlockingIOError:
+            return
+        if self.tracker.heard(message, addr):
+            self.on_home_changed()
+
+    async def _watchdog_loop(self):
+        """Infrequently checks for stale nexus entries and removes them."""
+        while True:
+            await asyncio.sleep(1)
+            if self.tracker.expire():
+                self.on_home_changed()
+
+    async def wait_for_nexus(self, poll_interval: float=0.1):
+        while not self.nexus:
+            await asyncio.sleep(poll_interval)
+
+    def close(self):
+        self.loop.remove_reader(self.udp.sock.fileno())
+        self.watchdog_task.cancel()
+        self.udp.sock.close()
+
+
+class AsyncNexusPublisher():
+    """The asyncio counterpart of `NexusPublisher`. Must be created from inside a running event loop.
+
+    ```python
+    pub = AsyncNexusPublisher()
+    await pub.wait_for_nexus()
+    await pub.send("imu.thigh.data", msg)
+    ```
+    """
+    # Topic validation and encoding is shared with the threaded publisher
+    _encode_topic = NexusPublisher._encode_topic
+    _route = NexusPublisher._route
+
+    def __init__(self, ctx: zmq.asyncio.Context=None, transports: tuple=TRANSPORTS, sequence: bool=False):
+        self.ctx = ctx if ctx else zmq.asyncio.Context.instance()
+        self.pub = self.ctx.socket(zmq.PUB)
+        self.encoded_topics = {}
+        self.sequencer = Sequencer(uuid.uuid4().hex[:8]) if sequence else None
+        self.endpoint = None
+        self.endpoints = []
+        self.pubs = [self.pub]
+        self.shards = 1
+        self.routes = {}
+        self.discovery = _NexusDiscovery(self._connect_to_nexus, self.ctx, transports)
+        self.nexus = self.discovery.nexus
+
+    def _connect_to_nexus(self):
+        endpoints = self.discovery.tracker.endpoints('sub_port')
+        if endpoints == self.endpoints: return
+        for sock, endpoint in zip(self.pubs, self.endpoints):
+            sock.disconnect(endpoint)
+        while len(self.pubs) < len(endpoints):
+            self.pubs.append(self.ctx.socket(zmq.PUB))
+        for sock, endpoint in zip(self.pubs, endpoints):
+            sock.connect(endpoint)
+        self.routes = {}
+        self.shards = max(len(endpoints), 1)
+        self.endpoints = endpoints
+        self.endpoint = endpoints[0] if endpoints else None
+
+    async def wait_for_nexus(self):
+        """Wait until at least one nexus has been discovered."""
+        await self.discovery.wait_for_nexus()
+
+    def topic(self, topic: str) -> AsyncPublisherTopic:
+        """Return a pre-validated handle for publishing on `topic`, see `NexusPublisher.topic`. Its sends are awaited,
+        `await handle.send(msg)`. Direct topics are only published by the threaded `NexusPublisher`."""
+        return AsyncPublisherTopic(self, topic)
+
+    def typed_topic(self, topic: str, schema: type) -> AsyncTypedPublisherTopic:
+        """Return a handle for publishing `schema` instances on `topic`, see `NexusPublisher.typed_topic`."""
+        handle = AsyncTypedPublisherTopic(self, self.topic(topic).name, schema)
+        starling.schema.register(topic, schema)
+        return handle
+
+    def _send_raw(self, raw_topic: bytes, message: bytes, copy: bool=True, track: bool=False):
+        if track and copy:
+            raise ValueError("track=True requires copy=False, copied messages can be reused as soon as send returns")
+        sock = self.pub if self.shards == 1 else self._route(raw_topic)
+        if self.sequencer is None:
+            return sock.send_multipart([raw_topic, message], copy=copy, track=track)
+        return sock.send_multipart([raw_topic, self.sequencer.header(raw_topic), message], copy=copy, track=track)
+
+    async def send(self, topic: Union[str, PublisherTopic], message: bytes, copy: bool=True, track: bool=False):
+        """Publish a message on a specific topic, see `NexusPublisher.send`."""
+        raw = topic.raw if isinstance(topic, PublisherTopic) else self._encode_topic(topic)
+        return await self._send_raw(raw, message, copy, track)
+
+    async def send_many(self, messages, copy: bool=True) -> int:
+        """Publish a batch of (topic, message) pairs. Returns the number of messages sent."""
+        count = 0
+        for topic, message in messages:
+            raw = topic.raw if isinstance(topic, PublisherTopic) else self._encode_topic(topic)
+            await self._send_raw(raw, message, copy)
+            count += 1
+        return count
+
+    def close(self):
+        self.discovery.close()
+        for sock in self.pubs:
+            sock.close()
+
+
+class AsyncNexusSubscriber():
+    """The asyncio counterpart of `NexusSubscriber`. Must be created from inside a running event loop.
+
+    Messages can be consumed either as an async iterator, or through callbacks which may be plain functions or coroutine functions.
+    Each stream or callback has its own bounded asyncio.Queue, and messages arriving while it is full are dropped (see `stats`).
+
+    ```python
+    sub = AsyncNexusSubscriber()
+    async for msg, topic in sub.stream("imu.#"):
+        ...
+    ```
+    """
+    def __init__(self, ctx: zmq.asyncio.Context=None, queue_size: int=MEDIUM, zero_copy: bool=False, transports: tuple=TRANSPORTS):
+        self.loop = asyncio.get_running_loop()
+        self.ctx = ctx if ctx else zmq.asyncio.Context.instance()
+        self.sub = self.ctx.socket(zmq.SUB)
+        self.sub.setsockopt_string(zmq.SUBSCRIBE, DIRECT_TOPIC)
+        # Direct topics (see `NexusPublisher.topic`) arrive on their own socket, connected to each direct publisher we want
+        self.direct = self.ctx.socket(zmq.SUB)
+        self.shm = self.ctx.socket(zmq.SUB) # Descriptors from direct publishers' shared memory rings on this host
+        self.rings = ShmRings()
+        self.direct_peers = DirectPeers(shm=SHM_AVAILABLE)
+        self.queue_size = queue_size
+        self.zero_copy = zero_copy
+
+        self.subscriptions = {} # pattern -> {'zmq_topic': str, 'sinks': [sink, ...], 'sequenced': {topic: dropped}}
+        self.matcher = TopicMatcher()
+        self.sequences = SequenceStats()
+
+        self.endpoint = None
+        self.endpoints = []
+        self.discovery = _NexusDiscovery(self._connect_to_nexus, self.ctx, transports)
+        self.nexus = self.discovery.nexus
+        self.recv_task = self.loop.create_task(self._recv_loop(self.sub))
+        self.direct_task = self.loop.create_task(self._recv_loop(self.direct))
+        self.shm_task = self.loop.create_task(self._recv_loop(self.shm))
+        for task in (self.recv_task, self.direct_task, self.shm_task):
+            task.add_done_callback(_log_task_exception)
+
+    def _connect_to_nexus(self):
+        endpoints = self.discovery.tracker.endpoints('pub_port')
+        if endpoints == self.endpoints: return
+        for endpoint in self.endpoints:
+            self.sub.disconnect(endpoint)
+        for endpoint in endpoints: # Every shard of a sharded nexus
+            self.sub.connect(endpoint)
+        self.endpoints = endpoints
+        self.endpoint = endpoints[0] if endpoints else None
+
+    async def wait_for_nexus(self):
+        """Wait until at least one nexus has been discovered."""
+        await self.discovery.wait_for_nexus()
+
+    async def _recv_loop(self, sock: zmq.asyncio.Socket):
+        while True:
+            message = await sock.recv_multipart(copy=not self.zero_copy)
+            frames = len(message)
+            if frames != 2 and frames != 3: continue  # Skip if the message is empty or malformed
+            if self.zero_copy:
+                raw_topic, data = message[0].bytes, message[-1].buffer
+            else:
+                raw_topic, data = message[0], message[-1]
+            if sock is self.shm:
+                data = self.rings.view(data)
+            elif raw_topic == DIRECT_RAW:
+                self._direct_advertised(data)
+            topic, sub_topics = self.matcher.resolve(raw_topic)
+            sequenced = self.sequences.add(topic, message[1]) if frames == 3 else None
+            if data is None: continue # Overwritten in shared memory before we got to it
+            for sub_topic in sub_topics:
+                info = self.subscriptions.get(sub_topic)
+                if info is None: continue
+                dropped = 0
+                for sink in info['sinks']:
+                    sink['received'] += 1
+                    try:
+                        sink['queue'].put_nowait((data, topic))
+                    except asyncio.QueueFull:
+                        sink['dropped'] += 1
+                        dropped += 1
+                if sequenced is not None:
+                    info['sequenced'][topic] = info['sequenced'].get(topic, 0) + dropped
+
+    def _direct_advertised(self, data):
+        for peer in self.direct_peers.expire():
+            (self.shm if peer['shm'] else self.direct).disconnect(peer['endpoint'])
+            if peer['shm']:
+                self.rings.detach(peer['shm'])
+        peer = self.direct_peers.heard(data, self.matcher)
+        if peer is None: return
+        if peer['shm']:
+            try:
+                self.rings.attach(peer['shm'])
+            except FileNotFoundError: # Already gone, the publisher is shutting down
+                peer['connected'] = False
+                return
+        (self.shm if peer['shm'] else self.direct).connect(peer['endpoint'])
+
+    def _add_sink(self, topic: str) -> dict:
+        if not validate_topic(topic):
+            raise ValueError(f"Invalid topic name: {topic}")
+        info = self.subscriptions.get(topic)
+        if info is None:
+            if ('*' in topic) or ('#' in topic):
+                first_wildcard = min(i for i in (topic.find('*'), topic.find('#')) if i != -1)
+                zmq_topic = topic[:first_wildcard-1] if first_wildcard > 0 else ''
+            else:
+                zmq_topic = topic
+            for sock in (self.sub, self.direct, self.shm):
+                sock.setsockopt_string(zmq.SUBSCRIBE, zmq_topic)
+            info = self.subscriptions[topic] = {'zmq_topic': zmq_topic, 'sinks': [], 'sequenced': {}}
+            self.matcher.add(topic)
+        sink = {'queue': asyncio.Queue(maxsize=self.queue_size), 'received': 0, 'dropped': 0, 'task': None}
+        info['sinks'].append(sink)
+        return sink
+
+    def _remove_sink(self, topic: str, sink: dict):
+        info = self.subscriptions.get(topic)
+        if info is None or sink not in info['sinks']: return
+        info['sinks'].remove(sink)
+        if not info['sinks']:
+            self.matcher.remove(topic)
+            for sock in (self.sub, self.direct, self.shm):
+                sock.setsockopt_string(zmq.UNSUBSCRIBE, info['zmq_topic'])
+            del self.subscriptions[topic]
+
+    async def stream(self, topic: str, schema: type=None) -> AsyncIterator[tuple]:
+        """Yield (msg, topic) pairs for every message matching `topic`, until the consumer stops iterating. With a `schema`
+        messages are decoded into it, see `NexusSubscriber.subscribe`."""
+        sink = self._add_sink(topic)
+        decode = starling.schema.decoder(schema).decode if schema is not None else None
+        try:
+            while True:
+                item = await sink['queue'].get()
+                if item is STOP: return
+                yield (decode(item[0]), item[1]) if decode else item
+        finally:
+            self._remove_sink(topic, sink)
+
+    def subscribe(self, topic: str, callback: callable, schema: type=None):
+        """Call `callback(msg, topic)` for every message matching `topic`. Coroutine functions are awaited, one message at a time.
+        With a `schema` messages are decoded into it, see `NexusSubscriber.subscribe`."""
+        sink = self._add_sink(topic)
+        is_coroutine = inspect.iscoroutinefunction(callback)
+        decode = starling.schema.decoder(schema).decode if schema is not None else None
+
+        async def _topic_listen():
+            while True:
+                item = await sink['queue'].get()
+                if item is STOP: return
+                try: # One failing message mustn't end the subscription, like `starling.dispatch._run_callback`
+                    if decode:
+                        item = (decode(item[0]), item[1])
+                    if is_coroutine:
+                        await callback(*item)
+                    else:
+                        callback(*item)
+                except Exception:
+                    traceback.print_exc()
+        sink['task'] = self.loop.create_task(_topic_listen())
+        sink['task'].add_done_callback(_log_task_exception)
+
+    def unsubscribe(self, topic: str):
+        """Stop every stream and callback registered on `topic`."""
+        info = self.subscriptions.get(topic)
+        if info is None: return
+        for sink in list(info['sinks']):
+            self._remove_sink(topic, sink)
+            if sink['task'] is not None:
+                sink['task'].cancel()
+            else: # Wake the stream so it returns after what it already has queued, making room for the sentinel if needed
+                while True:
+                    try:
+                        sink['queue'].put_nowait(STOP)
+                        break
+                    except asyncio.QueueFull:
+                        sink['queue'].get_nowait()
+
+    def stats(self) -> dict:
+        """Per subscription counters, summed over every stream and callback on it: 'received', 'queued' and 'dropped'.
+        Sequenced topics are listed under 'topics', see `NexusSubscriber.stats`."""
+        stats = {}
+        for sub_topic, info in self.subscriptions.items():
+            stats[sub_topic] = {'received': sum(s['received'] for s in info['sinks']),
+                                'queued': sum(s['queue'].qsize() for s in info['sinks']),
+                                'dropped': sum(s['dropped'] for s in info['sinks'])}
+            if info['sequenced']:
+                stats[sub_topic]['topics'] = {topic: dict(self.sequences.summary(topic), dropped=dropped)
+                                              for topic, dropped in info['sequenced'].items()}
+        return stats
+
+    def close(self):
+        for topic in list(self.subscriptions):
+            self.unsubscribe(topic)
+        self.recv_task.cancel()
+        self.direct_task.cancel()
+        self.shm_task.cancel()
+        self.discovery.close()
+        self.sub.close()
+        self.direct.close()
+        self.shm.close()
+        self.rings.close()
@@ -0,0 +1,438 @@
+# A chunked, indexed, multi-topic recording format ("bag") for raw starling messages.
+#
+# File layout (all integers little endian):
+#   MAGIC                                      8 bytes, "STRLBAG" and the format version
+#   chunk*                                     CHUNK_HEADER followed by the compressed chunk body
+#   index                                      msgpack encoded Index
+#   TRAILER                                    offset of the index, TRAILER_MAGIC
+#
+# A chunk body is a table of its records followed by their payloads, back to back:
+#   BODY_HEADER                                record count n, topic table length
+#   topic table                                the chunk's topics, NUL separated
+#   receive times (int64[n] ns), topic numbers (uint16[n]), payload lengths (uint32[n])
+#   payloads
+# Chunks are compressed independently, so a reader can use the index to decompress only the chunks overlapping the topics
+# and time window it wants, and the record table lets it filter and locate a chunk's records with NumPy rather than walking them.
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from functools import lru_cache
+from operator import attrgetter
+import mmap
+import struct
+import time
+
+import msgspec
+import numpy as np
+
+from starling.compression import get_codec, Codec
+from starling.matching import TopicMatcher
+
+VERSION = 1
+MAGIC = b"STRLBAG%d" % VERSION
+TRAILER_MAGIC = b"STRLIDX1"
+CHUNK_MAGIC = b"CHNK"
+CHUNK_HEADER = struct.Struct("<4sB3xIIIqq") # magic, codec id, compressed size, raw size, records, start ns, end ns
+BODY_HEADER = struct.Struct("<II") # records, topic table length
+RECORD_SIZE = 8 + 2 + 4 # Per record bytes in the record table
+TRAILER = struct.Struct("<Q8s")
+
+CODEC_IDS = {'none': 0, 'gzip': 1, 'zstd': 2, 'lz4': 3}
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+
+CHUNK_SIZE = 1 << 20 # Uncompressed bytes buffered by `Writer.write` before a chunk is written
+
+
+class TopicRange(msgspec.Struct, array_like=True):
+    count: int
+    start: int # ns
+    end: int # ns
+
+
+class ChunkInfo(msgspec.Struct, array_like=True):
+    offset: int # of the chunk header
+    size: int # compressed body size
+    count: int
+    start: int # ns
+    end: int # ns
+    topics: Dict[str, TopicRange]
+
+
+class Index(msgspec.Struct):
+    version: int = VERSION
+    chunks: List[ChunkInfo] = []
+    topics: Dict[str, TopicRange] = {}
+
+
+def _merge_range(ranges: dict, topic: str, count: int, start: int, end: int):
+    current = ranges.get(topic)
+    if current is None:
+        ranges[topic] = TopicRange(count, start, end)
+    else:
+        current.count += count
+        current.start = min(current.start, start)
+        current.end = max(current.end, end)
+
+
+def encode_records(records: Iterable[Tuple[str, int, bytes]]) -> Tuple[bytes, dict, int, int, int]:
+    """Pack (topic, receive time ns, payload) records into an uncompressed chunk body.
+    Returns (body, per topic ranges, record count, start ns, end ns)."""
+    topic_numbers = {}
+    times, numbers, lengths, payloads = [], [], [], []
+    for topic, t_ns, payload in records:
+        number = topic_numbers.get(topic)
+        if number is None:
+            number = topic_numbers[topic] = len(topic_numbers)
+        times.append(t_ns)
+        numbers.append(number)
+        lengths.append(len(payload))
+        payloads.append(payload)
+    if not times:
+        return BODY_HEADER.pack(0, 0), {}, 0, 0, 0
+    times = np.array(times, dtype='<i8')
+    numbers = np.array(numbers, dtype='<u2')
+    topic_table = b'\0'.join(topic.encode('utf-8') for topic in topic_numbers)
+    topics = {}
+    for topic, number in topic_numbers.items():
+        topic_times = times[numbers == number]
+        topics[topic] = TopicRange(len(topic_times), int(topic_times.min()), int(topic_times.max()))
+    body = b''.join([BODY_HEADER.pack(len(times), len(topic_table)), topic_table, times.tobytes(), numbers.tobytes(),
+                     np.array(lengths, dtype='<u4').tobytes(), *payloads])
+    return body, topics, len(times), int(times.min()), int(times.max())
+
+
+class Records():
+    """The record table of an uncompressed chunk body, with NumPy arrays of each record's receive time (ns), topic number
+    (an index into `topics`) and payload location in `body`."""
+    __slots__ = ('body', 'topics', 'times', 'numbers', 'starts', 'ends')
+
+    def __init__(self, body):
+        self.body = memoryview(body)
+        count, table_size = BODY_HEADER.unpack_from(self.body, 0)
+        offset = BODY_HEADER.size
+        self.topics = bytes(self.body[offset:offset + table_size]).decode('utf-8').split('\0') if count else []
+        offset += table_size
+        self.times = np.frombuffer(self.body, dtype='<i8', count=count, offset=offset)
+        self.numbers = np.frombuffer(self.body, dtype='<u2', count=count, offset=offset + 8 * count)
+        lengths = np.frombuffer(self.body, dtype='<u4', count=count, offset=offset + 10 * count)
+        self.ends = offset + RECORD_SIZE * count + np.cumsum(lengths, dtype=np.int64)
+        self.starts = self.ends - lengths
+
+    def __len__(self):
+        return len(self.times)
+
+    def select(self, mask: np.ndarray):
+        """Keep only the records where `mask` is True."""
+        self.times, self.numbers = self.times[mask], self.numbers[mask]
+        self.starts, self.ends = self.starts[mask], self.ends[mask]
+
+    def payloads(self) -> List[memoryview]:
+        body = self.body
+        return [body[start:end] for start, end in zip(self.starts.tolist(), self.ends.tolist())]
+
+    def __iter__(self) -> Iterator[Tuple[str, int, memoryview]]:
+        topics = self.topics
+        return zip([topics[n] for n in self.numbers.tolist()], self.times.tolist(), self.payloads())
+
+
+def decode_records(body) -> Iterator[Tuple[str, int, memoryview]]:
+    """Iterate (topic, receive time ns, payload) records from an uncompressed chunk body. Payloads are views into `body`."""
+    return iter(Records(body))
+
+
+@lru_cache(maxsize=64)
+def _field_struct(fields: Tuple[str, ...]) -> Tuple[type, list]:
+    """Build a msgspec Struct type decoding only the (dotted path) `fields` of a message, as floats (None when missing),
+    and the attribute path of each field in the decoded message."""
+    tree = {}
+    for field in fields:
+        node = tree
+        for key in field.split('.'):
+            node = node.setdefault(key, {})
+
+    def build(node: dict, name: str) -> type:
+        # Attributes get generated names, the message keys are only used as the encoded names, so any key works.
+        # Missing nested objects default to an empty one, so every path can be read without checking each level.
+        members = []
+        for i, (key, child) in enumerate(node.items()):
+            if child:
+                child_type = build(child, f"{name}_{i}")
+                members.append((f"f{i}", Optional[child_type], msgspec.field(default_factory=child_type, name=key)))
+            else:
+                members.append((f"f{i}", Optional[float], msgspec.field(default=None, name=key)))
+        return msgspec.defstruct(name, members)
+
+    def path(field: str) -> str:
+        node = tree
+        attrs = []
+        for key in field.split('.'):
+            attrs.append(f"f{list(node).index(key)}")
+            node = node[key]
+        return '.'.join(attrs)
+
+    return build(tree, "Fields"), [path(field) for field in fields]
+
+
+def _get_path(msg, attrs: List[str]):
+    for attr in attrs:
+        msg = getattr(msg, attr)
+        if msg is None: return None
+    return msg
+
+
+def extract_columns(payloads: List[bytes], fields: List[str], protocol: str="json") -> Dict[str, np.ndarray]:
+    """Decode the numeric `fields` (dotted paths such as "acc.x") of a batch of JSON or msgpack encoded messages into float64
+    arrays, NaN where a message lacks a field. Everything else in the messages is skipped, and the whole batch is decoded
+    in one call by joining the payloads into a single array."""
+    root, paths = _field_struct(tuple(fields))
+    if protocol == "json":
+        msgs = msgspec.json.decode(b'[' + b','.join(payloads) + b']', type=List[root])
+    elif protocol == "msgpack":
+        msgs = msgspec.msgpack.decode(b'\xdd' + struct.pack(">I", len(payloads)) + b''.join(payloads), type=List[root])
+    else:
+        raise ValueError(f"Unknown protocol: {protocol}, expected 'json' or 'msgpack'")
+    columns = {}
+    for field, path in zip(fields, paths):
+        try:
+            values = list(map(attrgetter(path), msgs))
+        except AttributeError: # An explicit null part way along the path
+            attrs = path.split('.')
+            values = [_get_path(msg, attrs) for msg in msgs]
+        columns[field] = np.array(values, dtype=np.float64) # None becomes NaN
+    return columns
+
+
+class Writer():
+    """Writes a bag file. Records can be written one at a time with `write`, which buffers them into chunks of about
+    `chunk_size` bytes, or as pre-built chunks with `write_chunk` (see `encode_records`) when compressing elsewhere.
+
+    ```python
+    with Writer("run.bag") as bag:
+        bag.write("imu.thigh.data", payload)
+    ```
+    """
+    def __init__(self, file_name: str, codec: str="gzip", level: int=None, chunk_size: int=CHUNK_SIZE):
+        self.file_name = file_name
+        self.codec: Codec = get_codec(codec, level)
+        self.codec_id = CODEC_IDS[self.codec.name]
+        self.chunk_size = chunk_size
+        self.fhandle = open(file_name, "wb")
+        self.fhandle.write(MAGIC)
+        self.index = Index()
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.closed = False
+
+    def write(self, topic: str, payload: bytes, recv_time_ns: int=None):
+        """Buffer one record, writing a chunk once `chunk_size` bytes have been buffered."""
+        self.buffer.append((topic, time.time_ns() if recv_time_ns is None else recv_time_ns, payload))
+        self.buffered_bytes += RECORD_SIZE + len(payload)
+        if self.buffered_bytes >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write any buffered records out as a chunk."""
+        if not self.buffer: return
+        body, topics, count, start, end = encode_records(self.buffer)
+        self.write_chunk(self.codec.compress(body), len(body), topics, count, start, end)
+        self.buffer = []
+        self.buffered_bytes = 0
+
+    def write_chunk(self, block: bytes, raw_size: int, topics: dict, count: int, start: int, end: int):
+        """Write a chunk body already compressed with this writer's codec, along with what `encode_records` returned for it."""
+        offset = self.fhandle.tell()
+        self.fhandle.write(CHUNK_HEADER.pack(CHUNK_MAGIC, self.codec_id, len(block), raw_size, count, start, end))
+        self.fhandle.write(block)
+        self.index.chunks.append(ChunkInfo(offset, len(block), count, start, end, topics))
+        for topic, info in topics.items():
+            _merge_range(self.index.topics, topic, info.count, info.start, info.end)
+
+    def close(self):
+        """Flush, then write the index and trailer. A bag that was never closed can still be read, just more slowly."""
+        if self.closed: return
+        self.flush()
+        index_offset = self.fhandle.tell()
+        self.fhandle.write(msgspec.msgpack.encode(self.index))
+        self.fhandle.write(TRAILER.pack(index_offset, TRAILER_MAGIC))
+        self.fhandle.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Reader():
+    """Reads a bag file, using its index to only decompress the chunks that overlap the requested topics and time window.
+    The file is memory mapped, so only the chunks actually read are paged in, and uncompressed chunks aren't copied at all.
+    Bags without an index (e.g. the recorder was killed) are recovered by scanning the chunk headers.
+
+    ```python
+    bag = Reader("run.bag")
+    for topic, t_ns, payload in bag.read(topics=["imu.#"], start=t0, end=t0 + 10):
+        ...
+    acc = bag.columns(["acc.x", "acc.y"], topics=["imu.thigh.data"])  # {'time': ..., 'acc.x': ..., 'acc.y': ...}
+    ```
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.fhandle = open(file_name, "rb")
+        if self.fhandle.read(len(MAGIC)) != MAGIC:
+            self.fhandle.close()
+            raise ValueError(f"{file_name} is not a starling bag file")
+        self.mm = mmap.mmap(self.fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        self.codecs = {}
+        self.index = self._read_index()
+        if self.index.version != VERSION:
+            self.close()
+            raise ValueError(f"{file_name} has a version {self.index.version} index, expected version {VERSION}")
+
+    def _read_index(self) -> Index:
+        size = len(self.view)
+        if size >= len(MAGIC) + TRAILER.size:
+            index_offset, magic = TRAILER.unpack_from(self.view, size - TRAILER.size)
+            if magic == TRAILER_MAGIC:
+                return msgspec.msgpack.decode(self.view[index_offset:size - TRAILER.size], type=Index)
+        return self._scan_index(size)
+
+    def _scan_index(self, size: int) -> Index:
+        """Rebuild the index by walking the chunks, stopping at the first incomplete one."""
+        index = Index()
+        offset = len(MAGIC)
+        while offset + CHUNK_HEADER.size <= size:
+            magic, codec_id, block_size, raw_size, count, start, end = CHUNK_HEADER.unpack_from(self.view, offset)
+            if magic != CHUNK_MAGIC or offset + CHUNK_HEADER.size + block_size > size: break
+            body_offset = offset + CHUNK_HEADER.size
+            records = Records(self._decompress(codec_id, self.view[body_offset:body_offset + block_size]))
+            topics = {}
+            for number, topic in enumerate(records.topics):
+                topic_times = records.times[records.numbers == number]
+                topics[topic] = TopicRange(len(topic_times), int(topic_times.min()), int(topic_times.max()))
+            index.chunks.append(ChunkInfo(offset, block_size, count, start, end, topics))
+            for topic, info in topics.items():
+                _merge_range(index.topics, topic, info.count, info.start, info.end)
+            offset += CHUNK_HEADER.size + block_size
+        return index
+
+    def _decompress(self, codec_id: int, block: memoryview):
+        if codec_id == CODEC_IDS['none']:
+            return block # Straight out of the mapping
+        codec = self.codecs.get(codec_id)
+        if codec is None:
+            codec = self.codecs[codec_id] = get_codec(CODEC_NAMES[codec_id])
+        return codec.decompress(block)
+
+    @property
+    def topics(self) -> Dict[str, TopicRange]:
+        """Every topic in the bag, with its message count and first/last receive time (ns)."""
+        return self.index.topics
+
+    @property
+    def start(self) -> Optional[int]:
+        return min((c.start for c in self.index.chunks), default=None)
+
+    @property
+    def end(self) -> Optional[int]:
+        return max((c.end for c in self.index.chunks), default=None)
+
+    def read_chunk(self, chunk: ChunkInfo):
+        """Read and decompress a single chunk body."""
+        magic, codec_id, block_size, *_ = CHUNK_HEADER.unpack_from(self.view, chunk.offset)
+        body_offset = chunk.offset + CHUNK_HEADER.size
+        return self._decompress(codec_id, self.view[body_offset:body_offset + block_size])
+
+    def chunks(self, topics: List[str]=None, start: float=None, end: float=None) -> List[ChunkInfo]:
+        """The chunks which may hold records matching the filters, see `read`."""
+        matcher = self._matcher(topics)
+        start_ns = None if start is None else int(start * 1e9)
+        end_ns = None if end is None else int(end * 1e9)
+        selected = []
+        for chunk in self.index.chunks:
+            if start_ns is not None and chunk.end < start_ns: continue
+            if end_ns is not None and chunk.start > end_ns: continue
+            if matcher is not None and not any(matcher.match(t) for t in chunk.topics): continue
+            selected.append(chunk)
+        return selected
+
+    def _matcher(self, topics: Optional[List[str]]) -> Optional[TopicMatcher]:
+        if topics is None: return None
+        matcher = TopicMatcher()
+        for pattern in ([topics] if isinstance(topics, str) else topics):
+            matcher.add(pattern)
+        return matcher
+
+    def _read_chunks(self, topics: List[str]=None, start: float=None, end: float=None) -> Iterator[Records]:
+        """Yield the records of each selected chunk, filtered down to those matching."""
+        matcher = self._matcher(topics)
+        start_ns = None if start is None else int(start * 1e9)
+        end_ns = None if end is None else int(end * 1e9)
+        for chunk in self.chunks(topics, start, end):
+            records = Records(self.read_chunk(chunk))
+            mask = None
+            if matcher is not None:
+                keep = [n for n, topic in enumerate(records.topics) if matcher.match(topic)]
+                if len(keep) < len(records.topics):
+                    mask = np.isin(records.numbers, keep)
+            if start_ns is not None and chunk.start < start_ns:
+                mask = (records.times >= start_ns) if mask is None else mask & (records.times >= start_ns)
+            if end_ns is not None and chunk.end > end_ns:
+                mask = (records.times <= end_ns) if mask is None else mask & (records.times <= end_ns)
+            if mask is not None:
+                records.select(mask)
+            yield records
+
+    def read(self, topics: List[str]=None, start: float=None, end: float=None) -> Iterator[Tuple[str, int, memoryview]]:
+        """Iterate (topic, receive time ns, payload) records in file order. Payloads are only valid until the reader is closed.
+
+        Args:
+            topics (list[str], optional): Topic patterns to keep, wildcards allowed. Defaults to every topic.
+            start (float, optional): Only records received at or after this time, in seconds since the epoch.
+            end (float, optional): Only records received at or before this time, in seconds since the epoch.
+        """
+        for records in self._read_chunks(topics, start, end):
+            yield from records
+
+    def columns(self, fields: List[str], topics: List[str]=None, start: float=None, end: float=None,
+                protocol: str="json") -> Dict[str, np.ndarray]:
+        """Extract numeric fields of the matching records into NumPy arrays, see `extract_columns`. Each chunk is decoded
+        in a single batched msgspec call, so memory use is the output arrays plus about one chunk.
+
+        Args:
+            fields (list[str]): Dotted paths of the fields to extract, e.g. ["ts", "acc.x"].
+            topics, start, end: Filters, as for `read`.
+            protocol (str, optional): How the payloads are encoded, "json" or "msgpack". Defaults to "json".
+
+        Returns:
+            dict: float64 arrays per field (NaN where a message lacks it), plus "time", the receive times in seconds since the epoch.
+        """
+        times = []
+        columns = {field: [] for field in fields}
+        for records in self._read_chunks(topics, start, end):
+            if not len(records): continue
+            times.append(records.times)
+            for field, values in extract_columns(records.payloads(), fields, protocol).items():
+                columns[field].append(values)
+        out = {'time': (np.concatenate(times) if times else np.empty(0, dtype=np.int64)) / 1e9}
+        for field, parts in columns.items():
+            out[field] = np.concatenate(parts) if parts else np.empty(0)
+        return out
+
+    def close(self):
+        """Unmap and close the file. Payloads from `read` of uncompressed chunks point into the mapping, so they must have been
+        dropped (or copied with bytes()) by now."""
+        if self.fhandle.closed: return
+        try:
+            self.view.release()
+            self.mm.close()
+        except BufferError as e:
+            raise BufferError(f"Can't close {self.file_name} while payloads read from it are still referenced, copy the ones "
+                              "kept past the reader with bytes()") from e
+        finally:
+            self.fhandle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,210 @@
+# End to end benchmark of the nexus pipeline: publisher send -> XSUB/XPUB proxy -> subscriber recv loop -> callback.
+# Every publisher and subscriber runs in its own process, so the numbers include the real serialization through zmq and the nexus.
+import itertools
+import json
+import multiprocessing as mp
+import struct
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+STAMP = struct.Struct("<qII") # send time (time.monotonic_ns, system wide on Linux), publisher number, sequence number
+READY_TOPIC = "benchctl.ready"
+DATA_PREFIX = "bench"
+MAX_SAMPLES = 1_000_000 # latency samples kept per subscriber
+DISCOVERY_TIMEOUT = 15 # seconds for every process to find the nexus and each other
+DRAIN_TIMEOUT = 0.5 # seconds without a new message before a subscriber is considered drained
+RESULT_TIMEOUT = 10 # seconds past the run's duration to wait for each process's result before giving up on it
+
+
+def _publisher(number: int, topics: int, payload: int, rate: float, duration: float, start, results):
+    from starling.publication import NexusPublisher
+    from starling.rate import Rate
+    pub = NexusPublisher()
+    handles = [pub.topic(f"{DATA_PREFIX}.t{i}") for i in range(topics)]
+    ready_handle = pub.topic(READY_TOPIC)
+    padding = bytes(max(0, payload - STAMP.size))
+    # Announce ourselves until every subscriber has heard from every publisher
+    while not start.is_set():
+        ready_handle.send(STAMP.pack(time.monotonic_ns(), number, 0))
+        time.sleep(0.05)
+
+    # Max rate sends back to back, otherwise wakes at up to 1 kHz and sends whatever it takes to be at `rate` since the start,
+    # which paces against the clock without a sleep per message and without rounding a burst size
+    timer = Rate(min(rate, 1000.0), verbose=False) if rate else None
+    pack, monotonic_ns = STAMP.pack, time.monotonic_ns
+    seq = 0
+    begin = time.monotonic()
+    end = begin + duration
+    while (now := time.monotonic()) < end:
+        due = int((now - begin) * rate) if rate else seq + 256
+        while seq < due:
+            seq += 1
+            handles[seq % topics].send(pack(monotonic_ns(), number, seq) + padding)
+        if timer: timer.sleep()
+    results.put(('pub', number, {'sent': seq}))
+    time.sleep(DRAIN_TIMEOUT) # Give zmq time to flush before the context goes away
+    pub.stop()
+
+
+def _subscriber(number: int, topics: int, wildcards: int, publishers: int, dispatch: str, ready, start, stop, results):
+    from starling.subscription import NexusSubscriber
+    sub = NexusSubscriber(zero_copy=True, dispatch=dispatch)
+    latencies = np.empty(MAX_SAMPLES, dtype=np.int64)
+    state = {'received': 0, 'bytes': 0, 'last': time.monotonic()}
+    lock = threading.Lock() # Thread and pool dispatch run callbacks on several threads at once
+    heard = set()
+    unpack_from, monotonic_ns = STAMP.unpack_from, time.monotonic_ns
+
+    def on_ready(msg, topic):
+        heard.add(STAMP.unpack_from(msg)[1])
+        if len(heard) == publishers and not state.get('ready'):
+            state['ready'] = True
+            with ready.get_lock():
+                ready.value += 1
+
+    def on_data(msg, topic):
+        now = monotonic_ns()
+        with lock:
+            received = state['received']
+            if received < MAX_SAMPLES:
+                latencies[received] = now - unpack_from(msg)[0]
+            state['received'] = received + 1
+            state['bytes'] += len(msg)
+
+    if wildcards:
+        # One pattern catching every data topic, the rest pass the zmq prefix filter but don't match, so each message
+        # is still delivered once while the matcher has `wildcards` patterns to consider.
+        sub.subscribe(f"{DATA_PREFIX}.*", on_data)
+        for i in range(1, wildcards):
+            sub.subscribe(f"{DATA_PREFIX}.*.w{i}.#", on_data)
+    else:
+        for i in range(topics):
+            sub.subscribe(f"{DATA_PREFIX}.t{i}", on_data)
+    # Subscribed last, so hearing every publisher here means the data subscriptions have reached them too
+    sub.subscribe(READY_TOPIC, on_ready)
+
+    start.wait()
+    state['last'] = time.monotonic()
+    seen = 0
+    while not stop.is_set() or time.monotonic() - state['last'] < DRAIN_TIMEOUT:
+        time.sleep(0.05)
+        if state['received'] != seen:
+            seen = state['received']
+            state['last'] = time.monotonic()
+    sampled = min(state['received'], MAX_SAMPLES)
+    results.put(('sub', number, {'received': state['received'], 'bytes': state['bytes'], 'latencies': latencies[:sampled].copy()}))
+    sub.stop()
+
+
+def run_case(publishers: int, subscribers: int, payload: int, topics: int, wildcards: int, rate: float, duration: float,
+             dispatch: str = "inline") -> dict:
+    """Run one benchmark case against the running nexus, returning its result as a dict (see `_main` for the fields)."""
+    ctx = mp.get_context("spawn") # zmq contexts and sockets don't survive a fork
+    ready, start, stop, results = ctx.Value('i', 0), ctx.Event(), ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=_subscriber, args=(i, topics, wildcards, publishers, dispatch, ready, start, stop, results), daemon=True)
+             for i in range(subscribers)]
+    procs += [ctx.Process(target=_publisher, args=(i, topics, payload, rate, duration, start, results), daemon=True)
+              for i in range(publishers)]
+    for proc in procs:
+        proc.start()
+    deadline = time.monotonic() + DISCOVERY_TIMEOUT
+    while ready.value < subscribers:
+        if time.monotonic() > deadline:
+            for proc in procs: proc.terminate()
+            raise TimeoutError("Publishers and subscribers didn't find each other, is a nexus running?")
+        time.sleep(0.05)
+    start.set()
+
+    def result():
+        try:
+            return results.get(timeout=duration + RESULT_TIMEOUT)
+        except queue.Empty:
+            for proc in procs: proc.terminate()
+            raise TimeoutError("A publisher or subscriber process didn't report its results, it may have died") from None
+
+    pub_results, sub_results = {}, {}
+    while len(pub_results) < publishers:
+        kind, number, value = result()
+        (pub_results if kind == 'pub' else sub_results)[number] = value
+    stop.set()
+    while len(sub_results) < subscribers:
+        kind, number, value = result()
+        sub_results[number] = value
+    for proc in procs:
+        proc.join()
+
+    sent = sum(r['sent'] for r in pub_results.values())
+    received = sum(r['received'] for r in sub_results.values())
+    latencies = np.concatenate([r['latencies'] for r in sub_results.values()]) / 1e3 # us
+    percentile = lambda q: float(np.percentile(latencies, q)) if len(latencies) else None
+    return {
+        'publishers': publishers, 'subscribers': subscribers, 'payload': payload, 'topics': topics, 'wildcards': wildcards,
+        'rate': rate, 'duration': duration, 'dispatch': dispatch,
+        'sent': sent,
+        'received': received,
+        'dropped': sent * subscribers - received,
+        'publish_msgs_per_s': sent / duration,
+        'msgs_per_s': received / duration,
+        'mb_per_s': sum(r['bytes'] for r in sub_results.values()) / duration / 1e6,
+        'latency_us': {'p50': percentile(50), 'p99': percentile(99), 'p99.9': percentile(99.9),
+                       'max': float(latencies.max()) if len(latencies) else None},
+    }
+
+
+def _main():
+    from argparse import ArgumentParser
+    from rich.console import Console
+    from rich.table import Table
+    parser = ArgumentParser(description="Benchmark the nexus pipeline end to end. Launches a nexus plus publisher and subscriber processes for every combination of the swept parameters, and reports throughput, one-way latency and drops as JSON.")
+    parser.add_argument("--publishers", "-p", type=int, nargs="+", default=[1], help="Publisher process counts to sweep")
+    parser.add_argument("--subscribers", "-s", type=int, nargs="+", default=[1, 4], help="Subscriber process counts (fan-out) to sweep")
+    parser.add_argument("--payload", type=int, nargs="+", default=[64, 1024, 16384], help="Payload sizes (bytes) to sweep")
+    parser.add_argument("--topics", type=int, nargs="+", default=[1, 100], help="Topic counts to sweep, messages are spread round robin over them")
+    parser.add_argument("--wildcards", type=int, nargs="+", default=[0], help="Wildcard subscription counts to sweep, 0 subscribes to every topic exactly")
+    parser.add_argument("--rate", type=float, default=10_000, help="Messages per second per publisher, 0 sends as fast as possible (latency then includes queueing)")
+    parser.add_argument("--duration", "-d", type=float, default=2.0, help="Seconds to publish for in each case")
+    parser.add_argument("--dispatch", type=str, default="inline", choices=["inline", "thread", "pool"], help="Subscriber callback dispatch mode")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--no-nexus", action="store_true", help="Use an already running nexus rather than launching one")
+    args = parser.parse_args()
+
+    console = Console(stderr=True)
+    nexus = None
+    if not args.no_nexus:
+        nexus = subprocess.Popen([sys.executable, "-c", "from starling.nexus import _main; _main()"],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = []
+    try:
+        cases = list(itertools.product(args.publishers, args.subscribers, args.payload, args.topics, args.wildcards))
+        for i, (publishers, subscribers, payload, topics, wildcards) in enumerate(cases):
+            console.print(f"[{i + 1}/{len(cases)}] publishers={publishers} subscribers={subscribers} payload={payload} topics={topics} wildcards={wildcards}")
+            results.append(run_case(publishers, subscribers, payload, topics, wildcards, args.rate, args.duration, args.dispatch))
+    finally:
+        if nexus:
+            nexus.terminate()
+            nexus.wait()
+
+    table = Table(title="starling-bench")
+    for column in ("pubs", "subs", "payload", "topics", "wildcards", "msgs/s", "MB/s", "p50 us", "p99 us", "p99.9 us", "dropped"):
+        table.add_column(column, justify="right")
+    fmt = lambda v: "-" if v is None else f"{v:.1f}"
+    for r in results:
+        lat = r['latency_us']
+        table.add_row(str(r['publishers']), str(r['subscribers']), str(r['payload']), str(r['topics']), str(r['wildcards']),
+                      f"{r['msgs_per_s']:.0f}", f"{r['mb_per_s']:.2f}", fmt(lat['p50']), fmt(lat['p99']), fmt(lat['p99.9']), str(r['dropped']))
+    console.print(table)
+
+    report = json.dumps({'config': vars(args), 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    _main()
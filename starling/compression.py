@@ -0,0 +1,115 @@
+# Block compression codecs for snapshot files. Every block is compressed as a self contained gzip member / zstd frame / lz4 frame,
+# so blocks can be compressed in parallel and concatenated, and the result is still a valid file for the standard tools (zcat, zstdcat, lz4cat).
+import gzip
+import io
+
+CODECS = ('none', 'gzip', 'zstd', 'lz4')
+
+
+class Codec():
+    """Compresses and decompresses self contained blocks of bytes."""
+    name = 'none'
+    extension = ''
+
+    def __init__(self, level: int=None):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decompress one or more concatenated blocks."""
+        return bytes(data)
+
+    def open(self, file_name: str):
+        """Open a file of concatenated blocks for streaming, line iterable reads."""
+        return open(file_name, "rb")
+
+
+class GzipCodec(Codec):
+    name = 'gzip'
+    extension = '.gz'
+
+    def __init__(self, level: int=None):
+        super().__init__(6 if level is None else level)
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def decompress(self, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+    def open(self, file_name: str):
+        return gzip.open(file_name, "rb")
+
+
+class ZstdCodec(Codec):
+    name = 'zstd'
+    extension = '.zst'
+
+    def __init__(self, level: int=None):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("The zstd codec requires the zstandard package, `pip install zstandard`") from None
+        super().__init__(3 if level is None else level)
+        self.zstandard = zstandard
+
+    def compress(self, data: bytes) -> bytes:
+        # Compressor objects aren't thread safe, and are cheap enough to make per block
+        return self.zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        reader = self.zstandard.ZstdDecompressor().stream_reader(data, read_across_frames=True)
+        return reader.read()
+
+    def open(self, file_name: str):
+        # zstandard's readers don't support readline, so buffer them
+        return io.BufferedReader(self.zstandard.open(file_name, "rb"))
+
+
+class Lz4Codec(Codec):
+    name = 'lz4'
+    extension = '.lz4'
+
+    def __init__(self, level: int=None):
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("The lz4 codec requires the lz4 package, `pip install lz4`") from None
+        super().__init__(0 if level is None else level)
+        self.lz4 = lz4.frame
+
+    def compress(self, data: bytes) -> bytes:
+        return self.lz4.compress(data, compression_level=self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        # lz4.frame.decompress stops after the first frame
+        out = []
+        data = bytes(data)
+        while data:
+            decompressor = self.lz4.LZ4FrameDecompressor()
+            out.append(decompressor.decompress(data))
+            if not decompressor.eof: break # Truncated final frame
+            data = decompressor.unused_data
+        return b''.join(out)
+
+    def open(self, file_name: str):
+        return self.lz4.open(file_name, "rb")
+
+
+CODEC_CLASSES = {'none': Codec, 'gzip': GzipCodec, 'zstd': ZstdCodec, 'lz4': Lz4Codec}
+
+def get_codec(name: str, level: int=None) -> Codec:
+    """Create a codec by name, one of 'none', 'gzip', 'zstd' or 'lz4'. `level` defaults to each codec's usual default."""
+    if name not in CODEC_CLASSES:
+        raise ValueError(f"Unknown codec: {name}, expected one of {', '.join(CODECS)}")
+    return CODEC_CLASSES[name](level)
+
+
+def codec_for_file(file_name: str) -> Codec:
+    """Guess the codec of a file from its extension."""
+    for name, cls in CODEC_CLASSES.items():
+        if cls.extension and file_name.endswith(cls.extension):
+            return get_codec(name)
+    return get_codec('none')
@@ -0,0 +1,77 @@
+# Direct publishing. High bandwidth topics (camera frames, point clouds) can skip the nexus: the publisher binds a PUB socket
+# of its own for them, and advertises it once a second on DIRECT_TOPIC through the nexus:
+#
+#   {"id": "<publisher id>", "addrs": ["<ip>", ...], "port": <port>, "topics": ["camera.front", ...]}
+#
+# Subscribers connect straight to every advertised publisher with a topic they are subscribed to, so the payloads make one
+# hop instead of two and never pass through the nexus proxy. The nexus stays the discovery and low rate path.
+#
+# Publishers with a shared memory ring (see `starling.shm`) also advertise "ipc" and "shm", the ipc:// endpoint their
+# descriptors are sent on and the ring's segment name. Subscribers on the same host use those instead of the TCP port.
+from typing import List, Optional
+import time
+
+import msgspec
+
+from starling.simpleudp import get_ips, primary_ip, LOCALHOST
+
+DIRECT_TOPIC = "_starling.direct"
+DIRECT_RAW = DIRECT_TOPIC.encode('utf-8')
+ADVERTISE_INTERVAL = 1 # seconds between advertisements
+DIRECT_TIMEOUT = 5 # seconds without an advertisement before a direct publisher is disconnected from
+
+
+def advertisement(publisher_id: str, port: int, topics: List[str], ipc: str=None, shm: str=None) -> bytes:
+    primary = primary_ip()
+    addrs = [primary] if primary else []
+    addrs += sorted(ip for ip in get_ips() if ip != LOCALHOST and ip != primary)
+    advert = {'id': publisher_id, 'addrs': addrs, 'port': port, 'topics': topics}
+    if ipc and shm:
+        advert.update({'ipc': ipc, 'shm': shm})
+    return msgspec.json.encode(advert)
+
+
+class DirectPeers():
+    """Subscriber side bookkeeping of the direct publishers that have been advertised. `heard` returns a publisher's info
+    ('endpoint', and 'shm', the ring's segment name or None for plain TCP) when it first advertises a topic the subscriber
+    wants, and `expire` returns the infos of connected publishers that have stopped advertising."""
+    def __init__(self, shm: bool=False):
+        self.shm = shm # Whether shared memory rings of publishers on this host should be used
+        self.publishers = {} # publisher id -> {'endpoint', 'shm', 'connected', 'last_seen'}
+        self.myips = set(get_ips()) | {primary_ip()}
+        self.last_expired = time.monotonic()
+
+    def heard(self, data, matcher) -> Optional[dict]:
+        try:
+            advert = msgspec.json.decode(data)
+            publisher_id, addrs, port, topics = advert['id'], advert['addrs'], advert['port'], advert['topics']
+        except (msgspec.DecodeError, KeyError, TypeError):
+            return None
+        info = self.publishers.get(publisher_id)
+        if info is None:
+            local = bool(self.myips.intersection(addrs)) or not addrs
+            if local and self.shm and advert.get('ipc') and advert.get('shm'):
+                info = {'endpoint': advert['ipc'], 'shm': advert['shm']}
+            else:
+                info = {'endpoint': f"tcp://{LOCALHOST if local else addrs[0]}:{port}", 'shm': None}
+            info['connected'] = False
+            self.publishers[publisher_id] = info
+        info['last_seen'] = time.monotonic()
+        # Checked on every advertisement, so subscriptions made after a publisher was first heard still connect to it
+        if not info['connected'] and any(matcher.match(topic) for topic in topics):
+            info['connected'] = True
+            return info
+        return None
+
+    def expire(self, timeout: float=DIRECT_TIMEOUT) -> List[dict]:
+        """Forget publishers that have stopped advertising, returning the ones that were connected to."""
+        now = time.monotonic()
+        if now - self.last_expired < 1: return []
+        self.last_expired = now
+        expired = []
+        for publisher_id, info in list(self.publishers.items()):
+            if now - info['last_seen'] > timeout:
+                del self.publishers[publisher_id]
+                if info['connected']:
+                    expired.append(info)
+        return expired
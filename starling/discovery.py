@@ -0,0 +1,141 @@
+# Nexus discovery. Every nexus broadcasts a heartbeat once a second over UDP:
+#
+#   "<pub_port> <sub_port> <nexus id>[ key=value ...]"
+#
+# The optional key=value fields advertise extras (e.g. a federated nexus's export port), so clients and nexuses must ignore
+# any keys they don't know. Publishers and subscribers talk to a single "home" nexus, never to several at once, since
+# federated nexuses already forward traffic between each other and connecting to more than one would duplicate messages.
+#
+# Besides TCP, a nexus advertises ipc:// endpoints ('ipc_pub', 'ipc_sub') for clients on its own host, and binds inproc://
+# endpoints that clients in its own process can use when they share its zmq.Context (see INPROC_NEXUS).
+#
+# A sharded nexus runs several proxies, advertising the ports of every shard after the first as
+# 'shards=<pub_port>:<sub_port>,...'. A topic belongs to the shard picked by `shard_of`, so publishers send each topic to
+# its shard while subscribers connect to all of them.
+from typing import List, Optional
+import time
+import zlib
+
+from starling.shm import ipc_endpoint
+from starling.simpleudp import get_ips, primary_ip, LOCALHOST
+
+NEXUS_PORT = 8899
+NEXUS_TIMEOUT = 5 # seconds without a heartbeat before a nexus is forgotten
+TRANSPORTS = ("inproc", "ipc", "tcp") # In order of preference, the first one usable with the home nexus is connected to
+
+INPROC_NEXUS = {} # nexus id -> address of the underlying zmq context, for nexuses running in this process
+
+
+def inproc_endpoint(nexus_id: str, side: str, shard: int=0) -> str:
+    """A nexus's inproc endpoint, `side` being 'pub' (the XPUB subscribers connect to) or 'sub' (the XSUB publishers connect to)."""
+    return f"inproc://starling-nexus-{nexus_id}-{side}" + (f"-{shard}" if shard else "")
+
+
+def nexus_ipc_endpoint(port: int) -> str:
+    """The ipc endpoint a nexus binds alongside a TCP port."""
+    return ipc_endpoint(f"starling-nexus-{port}")
+
+
+def shard_of(raw_topic: bytes, shards: int) -> int:
+    """The shard a topic is routed through, chosen by its first segment so related topics share a proxy. crc32 rather than
+    hash(), which differs between processes."""
+    if shards == 1: return 0
+    return zlib.crc32(raw_topic.split(b'.', 1)[0]) % shards
+
+
+def format_heartbeat(pub_port: int, sub_port: int, nexus_id: str, **extras) -> str:
+    return " ".join([str(pub_port), str(sub_port), nexus_id, *(f"{key}={value}" for key, value in extras.items())])
+
+
+def parse_heartbeat(message: str) -> Optional[dict]:
+    """The fields of a heartbeat as a dict ('pub_port', 'sub_port', 'id' and any extras), or None if it isn't one."""
+    parts = message.split(' ')
+    if len(parts) < 3 or not parts[0].isdigit() or not parts[1].isdigit():
+        return None
+    info = dict(part.split('=', 1) for part in parts[3:] if '=' in part)
+    info.update({'pub_port': parts[0], 'sub_port': parts[1], 'id': parts[2]})
+    return info
+
+
+class NexusTracker():
+    """Keeps track of the nexuses whose heartbeats have been heard, and picks the one to use as home: a federated nexus on
+    this host if there is one, otherwise the one with the lowest id. Only federated nexuses forward traffic between each
+    other, so clients of plain nexuses must all pick the same one, whichever host they are on.
+
+    `heard` and `expire` return True when the home changes, at which point the owner should disconnect from the old
+    home's endpoint and connect to the new one (see `endpoint`). `ctx` is the owner's zmq context, needed to tell whether
+    the inproc transport can be used, and `transports` limits and orders the transports that may be.
+    """
+    def __init__(self, ctx=None, transports: tuple=TRANSPORTS):
+        self.nexus = {} # nexus id -> heartbeat fields, plus 'addr' and 'last_seen'
+        self.home: Optional[str] = None
+        self.myips = set(get_ips()) | {primary_ip()}
+        self.ctx = ctx
+        self.transports = transports
+        self.last_expired = time.monotonic()
+
+    def heard(self, message: str, addr: tuple) -> bool:
+        info = parse_heartbeat(message)
+        if info is None: return False
+        known = self.nexus.get(info['id'])
+        if known is not None:
+            known['last_seen'] = time.monotonic()
+            return False
+        info.update({'addr': addr, 'last_seen': time.monotonic()})
+        self.nexus[info['id']] = info
+        return self._choose_home()
+
+    def expire(self, timeout: float=NEXUS_TIMEOUT) -> bool:
+        """Forget nexuses that have gone quiet. Cheap enough to call on every poll, it only checks once a second."""
+        now = time.monotonic()
+        if now - self.last_expired < 1: return False
+        self.last_expired = now
+        for nexus_id, info in list(self.nexus.items()):
+            if now - info['last_seen'] > timeout:
+                del self.nexus[nexus_id]
+        return self._choose_home()
+
+    def is_local(self, info: dict) -> bool:
+        return info['addr'][0] in self.myips
+
+    def connect_address(self, info: dict) -> str:
+        return LOCALHOST if self.is_local(info) else info['addr'][0]
+
+    def _federated_local(self, info: dict) -> bool:
+        return 'fed' in info and self.is_local(info)
+
+    def _choose_home(self) -> bool:
+        home = min(self.nexus, key=lambda nexus_id: (not self._federated_local(self.nexus[nexus_id]), nexus_id), default=None)
+        changed = home != self.home
+        self.home = home
+        return changed
+
+    def endpoint(self, port_key: str) -> Optional[str]:
+        """The home nexus's endpoint for 'pub_port' (subscribers) or 'sub_port' (publishers), over the most preferred transport
+        that can reach it, None while there is no home. For a sharded nexus this is the first shard's, see `endpoints`."""
+        endpoints = self.endpoints(port_key)
+        return endpoints[0] if endpoints else None
+
+    def endpoints(self, port_key: str) -> List[str]:
+        """The endpoints of every shard of the home nexus (just the one for an unsharded nexus), in shard order."""
+        info = self.nexus.get(self.home) if self.home else None
+        if info is None: return []
+        side = port_key.split('_')[0]
+        ports = [int(info[port_key])]
+        for pair in filter(None, info.get('shards', '').split(',')):
+            pub_port, sub_port = pair.split(':')
+            ports.append(int(pub_port if side == 'pub' else sub_port))
+        endpoints = [self._endpoint(info, side, shard, port) for shard, port in enumerate(ports)]
+        return endpoints if None not in endpoints else []
+
+    def _endpoint(self, info: dict, side: str, shard: int, port: int) -> Optional[str]:
+        for transport in self.transports:
+            if transport == "inproc":
+                if self.ctx is not None and INPROC_NEXUS.get(self.home) == self.ctx.underlying:
+                    return inproc_endpoint(self.home, side, shard)
+            elif transport == "ipc":
+                if self.is_local(info) and f'ipc_{side}' in info:
+                    return nexus_ipc_endpoint(port)
+            elif transport == "tcp":
+                return f"tcp://{self.connect_address(info)}:{port}"
+        return None
@@ -0,0 +1,246 @@
+# Dispatchers decide where subscription callbacks run. The subscriber's recv thread hands every matched message to its dispatcher via
+# `put`, and the dispatcher is responsible for eventually calling `cb(msg, topic)` for that subscription, in the order received.
+# Batching subscriptions (a 'batch' size in their info) are instead called as `cb(msgs, topics)` with everything queued for
+# them, up to 'batch' messages at a time.
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue
+import queue
+import threading
+import traceback
+
+MEDIUM = 10_000
+DRAIN_LIMIT = 64 # Max messages a pool worker handles for one subscription before giving other subscriptions a turn
+
+CONFLATED = object() # Queued in place of the message for conflating subscriptions, the newest message is taken from the mailbox on delivery
+
+
+def _run_callback(cb: callable, msg, topic: str):
+    """Run a callback without letting an exception take down the thread that is running it."""
+    try:
+        cb(msg, topic)
+    except Exception:
+        traceback.print_exc()
+
+
+def _drain(q: Queue, limit: int) -> list:
+    """Take up to `limit` items already waiting in a queue, under a single acquisition of its lock rather than one per item."""
+    with q.mutex:
+        items = q.queue
+        taken = [items.popleft() for _ in range(min(limit, len(items)))]
+        if taken:
+            q.not_full.notify_all()
+    return taken
+
+
+class Dispatcher():
+    """Base class for dispatchers. Subscription state lives in the subscription info dict owned by the subscriber, dispatchers
+    add their own entries to it (queues, threads...) in `add` and keep its 'dropped' and 'conflated' counters up to date.
+
+    Conflating subscriptions (those with a 'mailbox' dict) keep a single slot per concrete topic. Only one delivery per topic is
+    queued at a time, and newer messages overwrite the slot while it waits, so the callback always gets the newest message.
+    """
+    def __init__(self, queue_size: int=MEDIUM):
+        self.queue_size = queue_size
+
+    def add(self, info: dict):
+        """Prepare a new subscription for dispatch."""
+        raise NotImplementedError
+
+    def put(self, info: dict, msg, topic: str):
+        """Hand a message to a subscription. Must never block the recv thread."""
+        mailbox = info.get('mailbox')
+        if mailbox is None:
+            if not self._enqueue(info, msg, topic):
+                info['dropped'] += 1
+            return
+        with info['lock']:
+            pending = topic in mailbox
+            mailbox[topic] = msg
+            if pending: # A delivery for this topic is already queued, and will pick up this message instead of the old one
+                info['conflated'] += 1
+            elif not self._enqueue(info, CONFLATED, topic):
+                del mailbox[topic]
+                info['dropped'] += 1
+
+    def _enqueue(self, info: dict, msg, topic: str) -> bool:
+        """Queue a message for delivery, returning False if it had to be dropped."""
+        raise NotImplementedError
+
+    def _resolve(self, info: dict, msg, topic: str):
+        """Swap a queued CONFLATED marker for the newest message in the subscription's mailbox."""
+        if msg is not CONFLATED: return msg
+        with info['lock']:
+            return info['mailbox'].pop(topic)
+
+    def remove(self, info: dict):
+        """Stop dispatching to a subscription."""
+        raise NotImplementedError
+
+    def depth(self, info: dict) -> int:
+        """The number of messages waiting to be handed to the subscription's callback."""
+        q = info.get('queue')
+        return q.qsize() if q is not None else 0
+
+    def stop(self):
+        """Release any resources shared between subscriptions."""
+        pass
+
+
+class InlineDispatcher(Dispatcher):
+    """Runs callbacks directly on the subscriber's recv thread. This has the lowest overhead and never drops, but a slow
+    callback stalls every other subscription (and eventually backs up into zmq's HWM). Nothing is ever queued, so conflating
+    subscriptions behave like any other."""
+    def add(self, info: dict):
+        info['queue'] = None
+
+    def put(self, info: dict, msg, topic: str):
+        if info.get('batch'):
+            _run_callback(info['cb'], [msg], [topic])
+        else:
+            _run_callback(info['cb'], msg, topic)
+
+    def remove(self, info: dict):
+        pass
+
+
+class ThreadDispatcher(Dispatcher):
+    """One thread and one bounded queue per subscription. Messages for a subscription whose queue is full are dropped."""
+    def add(self, info: dict):
+        info['queue'] = Queue(maxsize=self.queue_size)
+        info['thread'] = threading.Thread(target=self._topic_listen, args=(info,), daemon=True)
+        info['thread'].start()
+
+    def _topic_listen(self, info: dict):
+        """Thread function to handle messages for a specific topic via a callback"""
+        cb: callable = info['cb']
+        q: Queue = info['queue']
+        batch = info.get('batch')
+        while True:
+            msg, recv_topic = q.get()
+            if msg is None: return  # Exit if None is put in the queue
+            if not batch:
+                _run_callback(cb, self._resolve(info, msg, recv_topic), recv_topic)
+                continue
+            # Take whatever else is already waiting, without blocking for more
+            msgs, topics = [msg], [recv_topic]
+            stopping = False
+            for msg, recv_topic in _drain(q, batch - 1):
+                if msg is None:
+                    stopping = True
+                    break
+                msgs.append(msg)
+                topics.append(recv_topic)
+            _run_callback(cb, msgs, topics)
+            if stopping: return
+
+    def _enqueue(self, info: dict, msg, topic: str) -> bool:
+        try:
+            info['queue'].put_nowait((msg, topic))
+        except queue.Full:
+            return False
+        return True
+
+    def remove(self, info: dict):
+        info['queue'].put((None, None))
+        info['thread'].join()
+
+
+class PoolDispatcher(Dispatcher):
+    """A fixed number of worker threads shared by all subscriptions. Each subscription keeps its own bounded queue, and is
+    scheduled onto at most one worker at a time, so callbacks for one subscription still run in order and never concurrently.
+    """
+    def __init__(self, queue_size: int=MEDIUM, workers: int=4):
+        super().__init__(queue_size)
+        self.ready = Queue() # Subscriptions with pending messages, each one appears here at most once
+        self.lock = threading.Lock()
+        self.workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def add(self, info: dict):
+        info['queue'] = Queue(maxsize=self.queue_size)
+        info['scheduled'] = False
+        info['removed'] = False
+
+    def _enqueue(self, info: dict, msg, topic: str) -> bool:
+        try:
+            info['queue'].put_nowait((msg, topic))
+        except queue.Full:
+            return False
+        with self.lock:
+            if not info['scheduled']:
+                info['scheduled'] = True
+                self.ready.put(info)
+        return True
+
+    def _call(self, cb: callable, msg, topic: str):
+        _run_callback(cb, msg, topic)
+
+    def _worker(self):
+        while True:
+            info = self.ready.get()
+            if info is None: return
+            q: Queue = info['queue']
+            batch = info.get('batch')
+            if batch:
+                pending = _drain(q, batch) if not info['removed'] else []
+                if pending:
+                    self._call(info['cb'], [msg for msg, _ in pending], [topic for _, topic in pending])
+            for _ in range(0 if batch else DRAIN_LIMIT):
+                if info['removed']: break
+                try:
+                    msg, topic = q.get_nowait()
+                except queue.Empty:
+                    break
+                self._call(info['cb'], self._resolve(info, msg, topic), topic)
+            with self.lock: # Checked under the lock so a message put while we drained can't be stranded
+                if not info['removed'] and q.qsize() > 0:
+                    self.ready.put(info)
+                else:
+                    info['scheduled'] = False
+
+    def remove(self, info: dict):
+        info['removed'] = True
+
+    def stop(self):
+        for _ in self.workers:
+            self.ready.put(None)
+        for worker in self.workers:
+            worker.join()
+
+
+class ProcessDispatcher(PoolDispatcher):
+    """Like `PoolDispatcher`, but the callbacks themselves run in a pool of worker processes, for CPU heavy callbacks that
+    would otherwise hold the GIL. Callbacks must be picklable (module level functions, not lambdas or closures) and only see
+    copies of the messages, so any state they change is local to the worker process.
+    """
+    def __init__(self, queue_size: int=MEDIUM, workers: int=4):
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        super().__init__(queue_size, workers)
+
+    def _call(self, cb: callable, msg, topic: str):
+        try:
+            msg = [bytes(m) for m in msg] if isinstance(msg, list) else bytes(msg)
+            self.executor.submit(cb, msg, topic).result() # Wait, to keep callbacks for one subscription in order
+        except Exception:
+            traceback.print_exc()
+
+    def stop(self):
+        super().stop()
+        self.executor.shutdown(wait=True)
+
+
+DISPATCHERS = {
+    'inline': InlineDispatcher,
+    'thread': ThreadDispatcher,
+    'pool': PoolDispatcher,
+    'process': ProcessDispatcher,
+}
+
+def make_dispatcher(kind: str, queue_size: int=MEDIUM, workers: int=4) -> Dispatcher:
+    """Create a dispatcher by name: 'inline', 'thread' (one thread per subscription), 'pool' or 'process'."""
+    if kind not in DISPATCHERS:
+        raise ValueError(f"Unknown dispatcher: {kind}, expected one of {', '.join(DISPATCHERS)}")
+    if kind in ('pool', 'process'):
+        return DISPATCHERS[kind](queue_size, workers)
+    return DISPATCHERS[kind](queue_size)
@@ -0,0 +1,107 @@
+# A log-linear bucketed histogram in the style of HdrHistogram, for latency and jitter distributions.
+#
+# Values (non-negative integers, e.g. nanoseconds) below 2**SUB_BITS get a bucket each. Above that, every power of two range
+# is split into 2**(SUB_BITS - 1) equal buckets, so a value is always within 1 / 2**(SUB_BITS - 1) of its bucket's bounds
+# (about 1.6% with the default of 7 bits) whatever its magnitude, using a few thousand buckets to cover nanoseconds to hours.
+from typing import Iterable, List, TextIO, Tuple
+import math
+
+import numpy as np
+
+SUB_BITS = 7
+MAX_BITS = 44 # Values up to 2**44 (about 4.9 hours in ns), larger ones land in the last bucket
+
+
+class LogHistogram():
+    """Records non-negative integer values in O(1) and reports percentiles with bounded relative error.
+
+    ```python
+    hist = LogHistogram()
+    hist.record(period_ns)
+    hist.percentile(99)  # ns
+    ```
+    """
+    def __init__(self, sub_bits: int=SUB_BITS, max_bits: int=MAX_BITS):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.half = self.sub_count >> 1
+        self.max_value = (1 << max_bits) - 1
+        self.buckets = self._index(self.max_value) + 1
+        self.reset()
+
+    def reset(self):
+        self.counts: List[int] = [0] * self.buckets # A list, incrementing a NumPy element costs far more
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0
+        self.total_sq = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return self.sub_count + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def bucket_bounds(self, index: int) -> Tuple[int, int]:
+        """The lowest and highest value recorded into a bucket."""
+        if index < self.sub_count:
+            return index, index
+        shift, offset = divmod(index - self.sub_count, self.half)
+        shift += 1
+        low = (self.half + offset) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, value: int):
+        value = int(value)
+        if value < 0: value = 0
+        self.counts[self._index(min(value, self.max_value))] += 1
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        if self.min is None or value < self.min: self.min = value
+        if self.max is None or value > self.max: self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        if not self.count: return 0.0
+        return math.sqrt(max(self.total_sq / self.count - self.mean ** 2, 0.0))
+
+    def percentiles(self, qs: Iterable[float]) -> List[float]:
+        """Values at each percentile in `qs` (0 to 100), as the middle of the bucket holding it (clamped to min/max)."""
+        if not self.count: return [0.0 for _ in qs]
+        cumulative = np.cumsum(self.counts)
+        out = []
+        for q in qs:
+            rank = max(1, math.ceil(q / 100 * self.count))
+            index = int(np.searchsorted(cumulative, rank))
+            low, high = self.bucket_bounds(index)
+            out.append(min(max((low + high) / 2, self.min), self.max))
+        return out
+
+    def percentile(self, q: float) -> float:
+        return self.percentiles([q])[0]
+
+    def summary(self, qs: Iterable[float]=(50, 90, 99, 99.9)) -> dict:
+        summary = {'count': self.count, 'min': self.min or 0, 'max': self.max or 0, 'mean': self.mean, 'std': self.std}
+        summary.update({f'p{q:g}': v for q, v in zip(qs, self.percentiles(qs))})
+        return summary
+
+    def dump(self, fhandle: TextIO, scale: float=1.0):
+        """Write the percentile distribution in HdrHistogram's text format (readable by its plotting tools), with values
+        divided by `scale`, e.g. 1e6 for nanoseconds recorded and milliseconds written."""
+        fhandle.write(f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}\n\n")
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if not count: continue
+            cumulative += count
+            fraction = cumulative / self.count
+            inverse = f"{1 / (1 - fraction):14.2f}" if fraction < 1 else f"{'inf':>14}"
+            fhandle.write(f"{self.bucket_bounds(index)[1] / scale:12.3f} {fraction:14.12f} {cumulative:10d} {inverse}\n")
+        fhandle.write(f"#[Mean    = {self.mean / scale:12.3f}, StdDeviation   = {self.std / scale:12.3f}]\n")
+        fhandle.write(f"#[Max     = {(self.max or 0) / scale:12.3f}, Total count    = {self.count:12d}]\n")
+        fhandle.write(f"#[Buckets = {len(self.counts):12d}, SubBuckets     = {self.sub_count:12d}]\n")
@@ -1,4 +1,5 @@
 from starling.subscription import NexusSubscriber
+import starling.schema
 import msgspec
 import time
 from rich.console import Console
@@ -20,12 +21,18 @@ def _echo():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("topic", type=str, help="The topic to echo")
+    parser.add_argument("--schema", type=str, default=None, help="A msgspec Struct as 'module:Class' to decode typed (msgpack) messages with")
     args = parser.parse_args()
-    echo(args.topic)
+    echo(args.topic, schema=starling.schema.load(args.schema) if args.schema else None)
 
-def echo(topic, deserialize=msgspec.json.decode):
+def echo(topic, deserialize=msgspec.json.decode, schema: type=None):
+    """Print every message on `topic` as JSON. Typed messages are decoded with `schema` (or one registered for the topic),
+    and shown as generic msgpack without one."""
     subscriber = NexusSubscriber()
-    subscriber.subscribe(topic, lambda msg, topic: console.print(JSON(f"{msgspec.json.format(msg, indent=4).decode('utf-8')}")))
+    schema = schema or starling.schema.lookup(topic)
+    def show(msg, topic):
+        console.print(JSON(msgspec.json.format(starling.schema.to_json(msg, schema), indent=4).decode('utf-8')))
+    subscriber.subscribe(topic, show)
     while True:
         time.sleep(1)
 
@@ -35,30 +42,85 @@ def _frequency():
     parser = argparse.ArgumentParser()
     parser.add_argument("topic", type=str, help="The topic to measure frequency on")
     parser.add_argument("--window", type=int, default=1000, help="Window size in frames to average frequency over")
+    parser.add_argument("--time-field", type=str, default=None, help="Top level field of the (JSON) messages holding their send time, in seconds since the epoch (time.time()), to also measure one-way latency")
+    parser.add_argument("--gap", type=float, default=2.0, help="Count a gap whenever a period is longer than this many mean periods")
+    parser.add_argument("--dump", type=str, default=None, help="File to write the period (and latency) histograms to, in HdrHistogram's percentile format (ms), every report")
     args = parser.parse_args()
-    frequency(args.topic, args.window)
+    frequency(args.topic, args.window, time_field=args.time_field, gap_factor=args.gap, dump=args.dump)
 
-def frequency(topic, window):
+def frequency(topic, window, time_field=None, gap_factor=2.0, dump=None):
     from collections import deque
     import time
     import numpy as np
-    subscriber = NexusSubscriber()
+    from starling.histogram import LogHistogram
+    # The callback only does O(1) bookkeeping, so run it on the recv thread rather than paying for a queue and a thread
+    subscriber = NexusSubscriber(dispatch='inline')
     sample_times = deque(maxlen=window)
-    subscriber.subscribe(topic, lambda msg, topic: sample_times.append(time.perf_counter()))
+    periods = LogHistogram() # ns
+    latencies = LogHistogram() # ns
+    gaps = {'count': 0, 'largest': 0}
+    last = [None]
+    stamp_decoder = None
+    if time_field:
+        stamp_decoder = msgspec.json.Decoder(msgspec.defstruct("Stamp", [("t", float, msgspec.field(name=time_field))]))
+
+    def on_message(msg, topic):
+        now = time.perf_counter_ns()
+        sample_times.append(now / 1e9)
+        if last[0] is not None:
+            period = now - last[0]
+            if periods.count > 10 and period > gap_factor * periods.mean:
+                gaps['count'] += 1
+                gaps['largest'] = max(gaps['largest'], period)
+            periods.record(period)
+        last[0] = now
+        if stamp_decoder is not None:
+            try:
+                latencies.record(time.time_ns() - int(stamp_decoder.decode(msg).t * 1e9))
+            except msgspec.DecodeError:
+                pass # No (numeric) timestamp in this message
+
+    subscriber.subscribe(topic, on_message)
+    ms = lambda ns: ns / 1e6
     while True:
         time.sleep(1)
         diffs = np.diff(sample_times)
         freq = 1/np.mean(diffs) if len(diffs) > 0 else 0
         rich.print(f'[bold yellow]Frequency:[/] {freq:.4f} Hz over last {len(sample_times)} samples')
+        if periods.count:
+            p = periods.summary()
+            rich.print(f'  [bold cyan]Period (ms):[/] min {ms(p["min"]):.3f} | mean {ms(p["mean"]):.3f} | max {ms(p["max"]):.3f} | std {ms(p["std"]):.3f} | '
+                       f'p50 {ms(p["p50"]):.3f} | p99 {ms(p["p99"]):.3f} | p99.9 {ms(p["p99.9"]):.3f} | '
+                       f'[bold red]{gaps["count"]} gaps[/] (> {gap_factor:g}x mean, largest {ms(gaps["largest"]):.3f})')
+        if latencies.count:
+            l = latencies.summary()
+            rich.print(f'  [bold magenta]Latency (ms):[/] min {ms(l["min"]):.3f} | mean {ms(l["mean"]):.3f} | max {ms(l["max"]):.3f} | '
+                       f'p50 {ms(l["p50"]):.3f} | p99 {ms(l["p99"]):.3f} | p99.9 {ms(l["p99.9"]):.3f}')
+        if dump:
+            with open(dump, "w") as f:
+                f.write(f"# Period (ms) on {topic}\n")
+                periods.dump(f, scale=1e6)
+                if latencies.count:
+                    f.write(f"\n# Latency (ms) on {topic}\n")
+                    latencies.dump(f, scale=1e6)
 
 def _topics():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--topic", type=str, default="#", help="The topic to monitor, use '#' for all topics")
     parser.add_argument("--window", type=int, default=16, help="Window size in frames to average frequency over - Used only for lower frequency topics")
+    parser.add_argument("--stats", action="store_true", help="Read the nexus's traffic summaries instead of subscribing to (and receiving) every message")
+    parser.add_argument("--span", type=float, default=5.0, help="Seconds of recent traffic the statistics are computed over")
+    parser.add_argument("--capacity", type=int, default=1 << 20, help="Messages kept for the statistics, faster traffic is sampled over a shorter span")
+    parser.add_argument("--legacy", action="store_true", help="Use the older per message frequency tracking (with --window)")
     args = parser.parse_args()
     # topics(args.topic, args.window)
-    topics2(args.topic, args.window)
+    if args.stats:
+        topics_stats(args.topic)
+    elif args.legacy:
+        topics2(args.topic, args.window)
+    else:
+        topics3(args.topic, args.span, args.capacity)
 
 def topics(topicset, window):
     from collections import deque
@@ -146,5 +208,117 @@ def topics2(topicset, window):
         console.print(towrite.strip())
         prev_time = current_time
 
+def topics3(topicset, span=5.0, capacity=1 << 20):
+    """Like `topics2`, but cheap enough to leave running on a busy bus. Messages are recorded on the recv thread (no queue, no
+    lock, payloads never copied or decoded) as an arrival time, topic number and size in preallocated ring buffers, and the
+    statistics for every topic are computed from them in one vectorized pass a second."""
+    import numpy as np
+    capacity = 1 << max(1, (capacity - 1).bit_length()) # Power of two, so the ring index is a mask
+    mask = capacity - 1
+    times = np.zeros(capacity, dtype=np.float64)
+    numbers = np.zeros(capacity, dtype=np.int32)
+    sizes = np.zeros(capacity, dtype=np.int64)
+    topic_numbers = {}
+    topic_names = []
+    recorded = 0
+    perf_counter = time.perf_counter
+
+    def record(msg, topic):
+        nonlocal recorded
+        number = topic_numbers.get(topic)
+        if number is None:
+            number = topic_numbers[topic] = len(topic_names)
+            topic_names.append(topic)
+        i = recorded & mask
+        times[i] = perf_counter()
+        numbers[i] = number
+        sizes[i] = len(msg)
+        recorded += 1
+
+    subscriber = NexusSubscriber(zero_copy=True, dispatch='inline')
+    subscriber.subscribe(topicset, record)
+    started = perf_counter()
+    counted = 0
+    totals = np.zeros(0, dtype=np.int64)
+
+    while True:
+        time.sleep(1)
+        now, end, ntopics = perf_counter(), recorded, len(topic_names)
+        start = max(0, end - capacity)
+        ring = np.arange(start, end) & mask
+        t, n, size = times[ring], numbers[ring], sizes[ring]
+
+        # Running totals from the entries new since the last pass, anything overwritten before we saw it is counted as missed
+        fresh = max(counted, start) - start
+        totals = np.pad(totals, (0, ntopics - len(totals)))
+        totals += np.bincount(n[fresh:], minlength=ntopics)
+        missed = max(0, start - counted)
+        counted = end
+
+        # Only the last `span` seconds, or less when the ring doesn't reach that far back
+        window_start = max(now - span, started, t[0] if start > 0 and len(t) else 0.0)
+        keep = t >= window_start
+        t, n, size = t[keep], n[keep], size[keep]
+        elapsed = now - window_start
+        counts = np.bincount(n, minlength=ntopics)
+        nbytes = np.bincount(n, weights=size, minlength=ntopics)
+        max_size = np.zeros(ntopics, dtype=np.int64)
+        np.maximum.at(max_size, n, size)
+        # Inter-arrival periods per topic: group by topic (stable, so each group stays in time order) and diff neighbours
+        order = np.argsort(n, kind='stable')
+        t, n = t[order], n[order]
+        same = n[1:] == n[:-1]
+        periods, groups = np.diff(t)[same], n[1:][same]
+        period_counts = np.bincount(groups, minlength=ntopics)
+        period_sum = np.bincount(groups, weights=periods, minlength=ntopics)
+        period_sq = np.bincount(groups, weights=periods * periods, minlength=ntopics)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_period = period_sum / period_counts
+            jitter = np.sqrt(np.maximum(period_sq / period_counts - mean_period ** 2, 0))
+            mean_size = nbytes / counts
+
+        towrite = ""
+        for number in np.argsort(topic_names):
+            freq = counts[number] / elapsed if elapsed > 0 else 0
+            towrite += (f"[bold green]{topic_names[number]:12}[/bold green] - [bold yellow]{freq:.3f} Hz[/bold yellow] - "
+                        f"[yellow]jitter {jitter[number] * 1e3 if period_counts[number] else 0:.3f} ms[/yellow] - "
+                        f"[cyan]{nbytes[number] / elapsed / 1e3 if elapsed > 0 else 0:.1f} kB/s, "
+                        f"{mean_size[number] if counts[number] else 0:.0f} B avg / {max_size[number]} B max[/cyan] - "
+                        f"[bold cyan]{totals[number]:>5} messages[/bold cyan]\n")
+        console.clear()
+        console.rule("Starling Topics")
+        console.print(towrite.strip())
+        if missed:
+            console.print(f"[dim]{missed} messages arrived faster than the ring buffer was read and aren't in the totals, raise --capacity[/dim]")
+
+
+def topics_stats(topicset):
+    """Like `topics2`, but from the summaries every nexus publishes on STATS_TOPIC, so only one small message a second is received."""
+    from starling.nexus import STATS_TOPIC
+    from starling.matching import TopicMatcher
+    matcher = TopicMatcher()
+    matcher.add(topicset)
+    summaries = {} # nexus id -> latest summary
+    def update_summary(msg, topic):
+        summary = msgspec.json.decode(msg)
+        summaries[summary['nexus']] = summary
+    subscriber = NexusSubscriber(dispatch='inline')
+    subscriber.subscribe(STATS_TOPIC, update_summary)
+
+    while True:
+        time.sleep(1)
+        towrite = ""
+        for nexus_id, summary in list(summaries.items()):
+            for t, info in sorted(summary['topics'].items()):
+                if not matcher.match(t): continue
+                freq = info['rate_1s'] if info['last_seen'] < 1 else 0 # Quiet for over a second, the 1 s rate is stale
+                towrite += (f"[bold green]{t:12}[/bold green] - [bold yellow]{freq:.3f} Hz[/bold yellow] ([yellow]{info['rate_10s']:.3f} Hz[/yellow] over 10 s) - "
+                            f"[bold cyan]{info['messages']:>5} messages[/bold cyan] - [cyan]{info['bandwidth_10s'] / 1e3:.1f} kB/s[/cyan]"
+                            f"{f' - [dim]{nexus_id}[/dim]' if len(summaries) > 1 else ''}\n")
+        console.clear()
+        console.rule("Starling Topics")
+        console.print(towrite.strip() if summaries else "Waiting for nexus statistics (is the nexus running with --stats-interval greater than 0?)")
+
+
 if __name__ == "__main__":
     topics2("#", 16)
\ No newline at end of file
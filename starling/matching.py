@@ -0,0 +1,113 @@
+from collections import OrderedDict
+import threading
+
+TOPIC_DELIM_CHAR = '.'
+SINGLE_WILDCARD = '*'
+MULTI_WILDCARD = '#'
+
+CACHE_SIZE = 4096
+RESERVED = '_starling' # First segment of the library's own topics (direct adverts, nexus stats)
+
+
+class _Node():
+    __slots__ = ('children', 'patterns')
+
+    def __init__(self):
+        self.children = {}
+        self.patterns = []
+
+
+class TopicMatcher():
+    """A segment trie over '.' delimited subscription patterns. Matching a concrete topic walks the trie once instead of
+    running one regex per wildcard subscription, and the result for each concrete topic is kept in a bounded LRU cache so
+    repeated topics (the common case on a bus) cost a single dict lookup regardless of how many wildcards are registered.
+
+    `*` matches exactly one topic name and `#` matches any number of chained topic names (or none), the same rules as `to_regex`.
+    Topics under the reserved `_starling.` prefix are only matched by patterns that start with it, so `#` or `*.stats`
+    don't pick up the library's internal traffic but `_starling.#` does (`to_regex` has no notion of reserved topics).
+    """
+    def __init__(self, cache_size: int=CACHE_SIZE):
+        self.root = _Node()
+        self.patterns = set()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, pattern: str):
+        """Register a subscription pattern. Adding an already registered pattern is a no-op."""
+        with self.lock:
+            if pattern in self.patterns: return
+            node = self.root
+            for seg in pattern.split(TOPIC_DELIM_CHAR):
+                node = node.children.setdefault(seg, _Node())
+            node.patterns.append(pattern)
+            self.patterns.add(pattern)
+            self.cache.clear()
+
+    def remove(self, pattern: str):
+        """Remove a subscription pattern, pruning any trie branches that are left empty."""
+        with self.lock:
+            if pattern not in self.patterns: return
+            path = [self.root]
+            segs = pattern.split(TOPIC_DELIM_CHAR)
+            for seg in segs:
+                path.append(path[-1].children[seg])
+            path[-1].patterns.remove(pattern)
+            # Walk back up, dropping nodes which no longer lead anywhere
+            for depth in range(len(segs), 0, -1):
+                node = path[depth]
+                if node.patterns or node.children: break
+                del path[depth-1].children[segs[depth-1]]
+            self.patterns.discard(pattern)
+            self.cache.clear()
+
+    def match(self, topic: str) -> list:
+        """Return the registered patterns matching a concrete topic, in the order they were found."""
+        return self.resolve(topic)[1]
+
+    def resolve(self, topic) -> tuple:
+        """Resolve a concrete topic, given as a str or as the raw utf-8 topic frame, to a (topic_str, patterns) tuple.
+        Raw frames are cached as-is, so a repeated topic is neither decoded nor walked through the trie again."""
+        with self.lock:
+            resolved = self.cache.get(topic)
+            if resolved is not None:
+                self.cache.move_to_end(topic)
+                return resolved
+            topic_str = topic.decode('utf-8') if isinstance(topic, bytes) else topic
+            found = []
+            segs = topic_str.split(TOPIC_DELIM_CHAR)
+            if segs[0] == RESERVED: # Skip the wildcards at the root, only patterns naming the prefix apply
+                reserved = self.root.children.get(RESERVED)
+                if reserved is not None:
+                    self._collect(reserved, segs, 1, found)
+            else:
+                self._collect(self.root, segs, 0, found)
+            resolved = (topic_str, list(dict.fromkeys(found))) # Overlapping '#' patterns can reach the same node more than once
+            self.cache[topic] = resolved
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return resolved
+
+    def _collect(self, node: _Node, segs: list, i: int, found: list):
+        children = node.children
+        multi = children.get(MULTI_WILDCARD)
+        if i == len(segs):
+            found.extend(node.patterns)
+            if multi is not None: # '#' may also match zero topic names
+                self._collect(multi, segs, i, found)
+            return
+        child = children.get(segs[i])
+        if child is not None:
+            self._collect(child, segs, i+1, found)
+        single = children.get(SINGLE_WILDCARD)
+        if single is not None:
+            self._collect(single, segs, i+1, found)
+        if multi is not None:
+            for j in range(i, len(segs)+1):
+                self._collect(multi, segs, j, found)
+
+    def __contains__(self, pattern: str):
+        return pattern in self.patterns
+
+    def __len__(self):
+        return len(self.patterns)
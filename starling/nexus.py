@@ -3,18 +3,28 @@ import zmq
 import threading
 import time
 import starling.simpleudp
+from starling.discovery import format_heartbeat, parse_heartbeat, inproc_endpoint, nexus_ipc_endpoint, shard_of, INPROC_NEXUS
 import socket
 import signal
 import atexit
 from rich import print as print
 import uuid
+import msgspec
+from collections import deque
 
 PUB_PORT = 8989
 SUB_PORT = 9898
 NEXUS_PORT = 8899
-OBSERVER_PORT = 9988
+EXPORT_PORT = 8998 # Federated nexuses offer their local publishers' traffic to each other here
+PEER_TIMEOUT = 5 # seconds without a heartbeat before a federated peer is dropped
 GOOGLE_DNS = '8.8.8.8'
 
+STATS_TOPIC = "_starling.stats" # Reserved, topics under "_starling." are the nexus's own and aren't counted
+RESERVED_PREFIX = b"_starling."
+STATS_WINDOWS = (1, 10, 60) # seconds, rates are reported over each of these sliding windows
+CAPTURE_HWM = 100_000 # Messages buffered for the stats/echo threads before the capture drops them
+CONTROL_TIMEOUT = 1000 # ms to wait for a proxy to answer a STATISTICS request
+
 def get_local_ip():
     """Get the local IP address of the machine."""
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -28,30 +38,139 @@ def get_local_ip():
         s.close()
 
 
+class TopicStats():
+    """Per topic message and byte counters, with rates over sliding windows. Totals are sampled once a second into a short
+    history, so a window's rate is just the difference between the newest sample and the one `window` seconds before it."""
+    def __init__(self, windows: tuple=STATS_WINDOWS):
+        self.windows = windows
+        self.counts = {} # raw topic -> [messages, bytes, last seen (time.monotonic)]
+        self.history = deque(maxlen=max(windows) + 1) # (time.monotonic, {raw topic: (messages, bytes)}), one per second
+        self.started = time.monotonic()
+
+    def add(self, raw_topic: bytes, size: int):
+        counts = self.counts.get(raw_topic)
+        if counts is None:
+            counts = self.counts[raw_topic] = [0, 0, 0.0]
+        counts[0] += 1
+        counts[1] += size
+        counts[2] = time.monotonic()
+
+    def sample(self):
+        self.history.append((time.monotonic(), {topic: (c[0], c[1]) for topic, c in self.counts.items()}))
+
+    def _base(self, latest_time: float, window: float) -> tuple:
+        """The newest sample at least `window` seconds older than the latest, or the oldest there is while the history is short."""
+        for then_time, then in reversed(self.history):
+            if latest_time - then_time >= window - 0.05: # Samples are taken about, not exactly, a second apart
+                return then_time, then
+        return self.started, {}
+
+    def summary(self) -> dict:
+        now = time.monotonic()
+        latest_time, latest = self.history[-1] if self.history else (now, {})
+        bases = [self._base(latest_time, window) for window in self.windows]
+        topics = {}
+        for raw_topic, (messages, size, last_seen) in self.counts.items():
+            info = {'messages': messages, 'bytes': size, 'last_seen': now - last_seen}
+            for window, (then_time, then) in zip(self.windows, bases):
+                elapsed = latest_time - then_time
+                then_messages, then_bytes = then.get(raw_topic, (0, 0))
+                now_messages, now_bytes = latest.get(raw_topic, (0, 0))
+                info[f'rate_{window}s'] = (now_messages - then_messages) / elapsed if elapsed > 0 else 0.0
+                info[f'bandwidth_{window}s'] = (now_bytes - then_bytes) / elapsed if elapsed > 0 else 0.0
+            topics[raw_topic.decode('utf-8', errors='replace')] = info
+        return {'uptime': now - self.started, 'topics': topics,
+                'messages': sum(c[0] for c in self.counts.values()), 'bytes': sum(c[1] for c in self.counts.values())}
+
+
 class StarlingNexus():
-    def __init__(self, ctx: zmq.Context=None, heartbeat_interval: int=1, echo=False, identifier: str=None):
-        self.ctx = zmq.Context.instance() if ctx is None else ctx
-        self.xpub = self.ctx.socket(zmq.XPUB)
-        self.xsub = self.ctx.socket(zmq.XSUB)
+    def __init__(self, ctx: zmq.Context=None, heartbeat_interval: int=1, echo=False, identifier: str=None, stats_interval: float=0,
+                 federate: bool=False, export_port: int=EXPORT_PORT, hwm: int=None, sndbuf: int=None, rcvbuf: int=None,
+                 io_threads: int=None, keepalive: int=0, shards: int=1, ipc: bool=False):
+        """The central node every publisher and subscriber connects to, forwarding messages from the XSUB to the XPUB socket.
+
+        Traffic is counted off a capture of the proxy, so it costs the proxy nothing but a reference counted copy per message.
+        With `stats_interval`, a summary of per topic message/byte counts and rates is published on `STATS_TOPIC` every that
+        many seconds (the default of 0 disables it, and the per message counting with it). The capture drops frames rather
+        than slow the proxy down, so the counts are a lower bound: the summary's 'uncounted_frames' is how many frames the
+        proxies forwarded that weren't counted, either dropped or still on their way, and it growing means counts are missing
+        traffic. `echo` prints every message, which is only suitable for light traffic.
+
+        With `federate`, nexuses on different hosts share the load: clients use the nexus on their own host, and each nexus
+        offers its local publishers' traffic on `export_port`. Every federated nexus subscribes to its peers' exports with
+        its own local subscribers' subscriptions, so only topics wanted on the other side cross between hosts, and
+        traffic received from a peer is only delivered locally, never forwarded on to a third nexus.
+
+            local publishers -> xsub -> [local] -+-> [delivery] -> xpub -> local subscribers
+                                                 |        ^
+                                                 |        +---- peers' exports
+                                                 +-> [export] -> tcp://*:export_port -> peers
+
+        Under bursts from many publishers, messages are dropped at the XPUB once a subscriber's queue holds `hwm` messages
+        (zmq's default is 1000, 0 means unlimited). `sndbuf`/`rcvbuf` size the kernel's socket buffers in bytes, `io_threads`
+        sizes the context's I/O thread pool (only when the nexus creates its own context) and `keepalive` enables TCP
+        keepalives after that many idle seconds, so dead peers' connections get cleaned up.
 
-        self.xpub.bind(f'tcp://*:{PUB_PORT}')
-        self.xsub.bind(f'tcp://*:{SUB_PORT}')
+        With `shards` > 1, forwarding is split across that many proxies, each on its own thread with its own sockets, so
+        throughput scales with cores. Every topic goes through the shard picked by `starling.discovery.shard_of` from its
+        first segment: publishers send to it, and subscribers connect to every shard. The first shard uses the usual ports,
+        the others random ones advertised in the heartbeat. Every `stats_interval` summary includes each proxy's counters.
+
+        With `ipc`, the nexus also binds ipc:// endpoints (where zmq supports them) and advertises them in its heartbeat, so
+        clients on its own host skip TCP. Like `federate` and `shards`, this adds fields to the heartbeat that clients from
+        before those options can't parse, so only enable them once every client on the network is up to date.
+        """
+        if shards > 1 and federate:
+            raise ValueError("A federated nexus can't be sharded")
+        if ctx is None:
+            ctx = zmq.Context(io_threads=io_threads) if io_threads else zmq.Context.instance()
+        self.ctx = ctx
+        self.hwm = hwm
+        self.sndbuf = sndbuf
+        self.rcvbuf = rcvbuf
+        self.keepalive = keepalive
         # Construct UUID and take first 8 characters - Should be sufficient for most use cases
         # TODO: Maybe a better method to avoid collisions? Though this seems unlikely.
         self.myid = identifier if identifier else str(uuid.uuid4())[:8] 
-        # Set up a socket pair for the observer
-        self.observer_in = self.ctx.socket(zmq.PAIR)
-        self.observer_out = self.ctx.socket(zmq.PAIR)
-        self.observer_in.linger = self.observer_out.linger = 0
-        self.observer_in.hwm = self.observer_out.hwm = 1
-        self.observer_in.bind(f"tcp://*:{OBSERVER_PORT}")
-        self.observer_out.connect(f"tcp://localhost:{OBSERVER_PORT}")
 
-        self.control = self.ctx.socket(zmq.PAIR)
-        self.control.bind(f"inproc://control")
+        self.xpub = self._socket(zmq.XPUB, bind=f'tcp://*:{PUB_PORT}')
+        self.xsub = self._socket(zmq.XSUB, bind=f'tcp://*:{SUB_PORT}')
+        self.shards = [(self.xsub, self.xpub, PUB_PORT, SUB_PORT)] # (xsub, xpub, pub port, sub port) per shard
+        for _ in range(shards - 1):
+            xpub, xsub = self._socket(zmq.XPUB), self._socket(zmq.XSUB)
+            self.shards.append((xsub, xpub, xpub.bind_to_random_port('tcp://*'), xsub.bind_to_random_port('tcp://*')))
+        # Clients on this host connect over ipc, and clients in this process sharing our context over inproc (see `starling.discovery`)
+        self.ipc = {}
+        if ipc and zmq.has('ipc'):
+            self.ipc = {'ipc_pub': nexus_ipc_endpoint(PUB_PORT), 'ipc_sub': nexus_ipc_endpoint(SUB_PORT)}
+        for shard, (xsub, xpub, pub_port, sub_port) in enumerate(self.shards):
+            if self.ipc:
+                xpub.bind(nexus_ipc_endpoint(pub_port))
+                xsub.bind(nexus_ipc_endpoint(sub_port))
+            xpub.bind(inproc_endpoint(self.myid, 'pub', shard))
+            xsub.bind(inproc_endpoint(self.myid, 'sub', shard))
+        INPROC_NEXUS[self.myid] = self.ctx.underlying
+        self.echo = echo
+        self.stats_interval = stats_interval
+        self.stats = TopicStats()
+        # Each proxy copies every message it forwards to its capture socket, which the stats and echo threads subscribe to
+        self.captures = []
+        self.capture_addr = f"inproc://capture-{self.myid}"
+        if echo or stats_interval:
+            for shard in range(len(self.shards)):
+                capture = self.ctx.socket(zmq.PUB)
+                capture.linger = 0
+                capture.sndhwm = CAPTURE_HWM
+                capture.bind(self._capture_addr(shard))
+                self.captures.append(capture)
+        self.capture = self.captures[0] if self.captures else None
 
-        if not echo:
-            self.observer_in = self.observer_out = None
+        self.federate = federate
+        self.export_port = export_port
+        self.proxies = {} # name -> (thread, controller socket, sockets to close once it has stopped)
+        self.captured = set() # Names of the proxies with a capture socket
+        self.counted_frames = 0 # Frames the stats thread has taken off the captures
+        self.peers = {} # nexus id -> {'addr', 'last_seen', 'proxy'} for federated peers
 
         self.beacon = starling.simpleudp.UDPBroadcaster(port=NEXUS_PORT)
         self.heartbeat_interval = heartbeat_interval
@@ -63,21 +182,142 @@ class StarlingNexus():
         """Broadcasts a heartbeat message to announce the presence of this nexus node."""
         while not self.exit_event.is_set():
             try:
-                self.beacon.send(f"{PUB_PORT} {SUB_PORT} {self.myid}")
+                self.beacon.send(self._heartbeat_message())
             except Exception as e:
                 print(f"Error occurred in heartbeat: {e}")
                 break
             time.sleep(1)
 
 
+    def _heartbeat_message(self) -> str:
+        """The heartbeat, with extras only for the options that need them (see `__init__`'s `ipc`)."""
+        extras = dict(self.ipc)
+        if self.federate: extras['fed'] = self.export_port
+        if len(self.shards) > 1: extras['shards'] = ",".join(f"{pub}:{sub}" for _, _, pub, sub in self.shards[1:])
+        return format_heartbeat(PUB_PORT, SUB_PORT, self.myid, **extras)
+
+
+    def _socket(self, kind: int, bind: str=None, connect: str=None) -> zmq.Socket:
+        """A proxy socket, with the nexus's tuning applied before it binds or connects."""
+        sock = self.ctx.socket(kind)
+        sock.linger = 0
+        if self.hwm is not None:
+            sock.sndhwm = sock.rcvhwm = self.hwm
+        if self.sndbuf: sock.sndbuf = self.sndbuf
+        if self.rcvbuf: sock.rcvbuf = self.rcvbuf
+        if self.keepalive:
+            sock.setsockopt(zmq.TCP_KEEPALIVE, 1)
+            sock.setsockopt(zmq.TCP_KEEPALIVE_IDLE, self.keepalive)
+        if bind: sock.bind(bind)
+        if connect: sock.connect(connect)
+        return sock
+
+    def _capture_addr(self, shard: int) -> str:
+        return self.capture_addr if shard == 0 else f"{self.capture_addr}-{shard}"
+
+    def _start_proxy(self, name: str, frontend: zmq.Socket, backend: zmq.Socket, capture: zmq.Socket=None):
+        """Runs a steerable proxy on its own thread, stopped by sending TERMINATE to its control socket (see `_stop_proxy`)."""
+        control_addr = f"inproc://control-{self.myid}-{name}"
+        control = self.ctx.socket(zmq.PAIR)
+        control.linger = 0
+        control.bind(control_addr)
+        controller = self.ctx.socket(zmq.PAIR)
+        controller.linger = 0
+        controller.rcvtimeo = CONTROL_TIMEOUT
+        controller.connect(control_addr)
+        thread = threading.Thread(target=zmq.proxy_steerable, args=(frontend, backend, capture, control), daemon=True)
+        thread.start()
+        self.proxies[name] = (thread, controller, [frontend, backend, control, controller])
+        if capture is not None:
+            self.captured.add(name)
+
+    def _stop_proxy(self, name: str):
+        thread, controller, sockets = self.proxies.pop(name)
+        controller.send(b"TERMINATE")
+        thread.join()
+        for sock in sockets:
+            sock.close()
+
+    def proxy_stats(self) -> dict:
+        """Each proxy's counters, other than federated peers': frames and bytes received from publishers and forwarded on
+        to subscribers, and subscription frames received from subscribers. Counts are of frames, a message is two.
+
+        There is no drop counter: libzmq counts a message the XPUB drops for a subscriber whose queue is full as forwarded,
+        and doesn't report the drop. Publish with `sequence=True` to see those losses in the subscribers' `stats()`."""
+        stats = {}
+        for name, (_, controller, _) in list(self.proxies.items()):
+            if name.startswith("peer-"): continue
+            try:
+                controller.send(b"STATISTICS")
+                counters = [int.from_bytes(frame, 'little') for frame in controller.recv_multipart()]
+            except zmq.ZMQError:
+                continue
+            stats[name] = {'received_frames': counters[0], 'received_bytes': counters[1],
+                           'forwarded_frames': counters[6], 'forwarded_bytes': counters[7], 'subscription_frames': counters[4]}
+        return stats
+
+    def _start_federated(self):
+        local_addr = f"inproc://local-{self.myid}"
+        delivery_addr = f"inproc://delivery-{self.myid}"
+        # Local publishers' traffic, fanned out to local delivery and to the export
+        self._start_proxy("local", self.xsub, self._socket(zmq.XPUB, bind=local_addr), self.capture)
+        self._start_proxy("delivery", self._socket(zmq.XSUB, bind=delivery_addr, connect=local_addr), self.xpub)
+        self._start_proxy("export", self._socket(zmq.XSUB, connect=local_addr), self._socket(zmq.XPUB, bind=f"tcp://*:{self.export_port}"))
+        self.federation_thread = threading.Thread(target=self.federation, args=(), daemon=True)
+        self.federation_thread.start()
+        print(f"Federating with other nexuses, exporting on port {self.export_port}.")
+
+    def federation(self):
+        """Listens for other federated nexuses' heartbeats, subscribing to each new peer's export and dropping peers that
+        have gone quiet. Subscriptions from local subscribers reach a peer through the delivery proxy, and the peer's
+        matching traffic comes back into it."""
+        self.beacon.sock.settimeout(0.5)
+        delivery_addr = f"inproc://delivery-{self.myid}"
+        myips = starling.simpleudp.get_ips() | {starling.simpleudp.primary_ip()}
+        while not self.exit_event.is_set():
+            try:
+                message, addr = self.beacon.recv()
+            except socket.timeout:
+                message = None
+            except OSError:
+                break
+            info = parse_heartbeat(message) if message else None
+            if info is not None and info['id'] != self.myid and 'fed' in info:
+                peer = self.peers.get(info['id'])
+                if peer is not None:
+                    peer['last_seen'] = time.monotonic()
+                else:
+                    host = starling.simpleudp.LOCALHOST if addr[0] in myips else addr[0]
+                    name = f"peer-{info['id']}"
+                    self._start_proxy(name, self._socket(zmq.XSUB, connect=f"tcp://{host}:{info['fed']}"),
+                                      self._socket(zmq.XPUB, connect=delivery_addr))
+                    self.peers[info['id']] = {'addr': host, 'last_seen': time.monotonic(), 'proxy': name}
+                    print(f"Federated with nexus {info['id']} at {host}:{info['fed']}.")
+            now = time.monotonic()
+            for peer_id, peer in list(self.peers.items()):
+                if now - peer['last_seen'] > PEER_TIMEOUT:
+                    self._stop_proxy(peer['proxy'])
+                    del self.peers[peer_id]
+                    print(f"Lost federated nexus {peer_id}.")
+
+    def _capture_socket(self) -> zmq.Socket:
+        sock = self.ctx.socket(zmq.SUB)
+        sock.linger = 0
+        sock.rcvhwm = CAPTURE_HWM
+        sock.setsockopt(zmq.RCVTIMEO, 500) # Set recv timeout to avoid blocking indefinitely
+        sock.setsockopt(zmq.SUBSCRIBE, b'')
+        for shard in range(len(self.captures)):
+            sock.connect(self._capture_addr(shard))
+        return sock
+
     def observe(self):
-        """Echoes messages received from the observer socket."""
-        # Set recv timeout to avoid blocking indefinitely
-        self.observer_out.setsockopt(zmq.RCVTIMEO, 500)
+        """Echoes the messages passing through the proxy."""
+        sock = self._capture_socket()
         while not self.exit_event.is_set():
             try:
-                msg = self.observer_out.recv()
-                print(f"Echoing message from observer: {msg}")
+                msg = sock.recv_multipart()
+                if len(msg) < 2: continue # Subscription messages from the XPUB side
+                print(f"Echoing message on {msg[0]}: {msg[-1]}") # The payload follows any sequence header
             except zmq.ContextTerminated:
                 print("Context terminated, stopping observer!")
                 break
@@ -87,53 +327,112 @@ class StarlingNexus():
             except Exception as e:
                 print(f"Error in echoing observer message: {e}")
                 break
+        sock.close()
+
+    def count(self):
+        """Counts the messages passing through the proxy, and periodically publishes a summary on STATS_TOPIC."""
+        sock = self._capture_socket()
+        # Published through our own XSUB like any other message, so subscribers need nothing special to receive it
+        pub = self.ctx.socket(zmq.PUB)
+        pub.linger = 0
+        stats_topic = STATS_TOPIC.encode('utf-8')
+        pub.connect(inproc_endpoint(self.myid, 'sub', shard_of(stats_topic, len(self.shards))))
+        next_sample = next_publish = time.monotonic()
+        while not self.exit_event.is_set():
+            try:
+                # Drain everything waiting before checking the clocks, the payloads are never copied out of zmq
+                frames = sock.recv_multipart(copy=False)
+                while True:
+                    self.counted_frames += len(frames)
+                    if len(frames) >= 2: # [topic, payload] or [topic, sequence header, payload], not subscriptions
+                        raw_topic = frames[0].bytes
+                        if not raw_topic.startswith(RESERVED_PREFIX):
+                            self.stats.add(raw_topic, len(frames[-1]))
+                    frames = sock.recv_multipart(flags=zmq.NOBLOCK, copy=False)
+            except zmq.Again:
+                pass
+            except zmq.ContextTerminated:
+                break
+            now = time.monotonic()
+            if now >= next_sample:
+                self.stats.sample()
+                next_sample += 1.0
+            if now >= next_publish:
+                summary = self.stats.summary()
+                proxies = self.proxy_stats()
+                # Everything a proxy receives, from either side, is copied to its capture
+                captured = sum(stats['received_frames'] + stats['subscription_frames'] for name, stats in proxies.items() if name in self.captured)
+                summary.update({'nexus': self.myid, 'time': time.time(), 'proxies': proxies,
+                                'uncounted_frames': max(captured - self.counted_frames, 0)})
+                pub.send_multipart([stats_topic, msgspec.json.encode(summary)])
+                next_publish += self.stats_interval
+        sock.close()
+        pub.close()
 
     def stop(self):
         """Stops the nexus node and cleans up resources."""
         if self.exit_event.is_set(): return
         print("[dark_orange]Stopping nexus node[/dark_orange]...")
         self.exit_event.set()
+        INPROC_NEXUS.pop(self.myid, None)
 
         print("[dark_orange]Stopping heartbeat thread[/dark_orange]...")
         self.heartbeat_thread.join()
-        self.beacon.sock.close()
 
-        print("[dark_orange]Stopping proxy thread[/dark_orange]...")
-        _control = self.ctx.socket(zmq.PAIR)
-        _control.connect("inproc://control")
-        _control.send(b"TERMINATE")
-        self.proxy_thread.join()
-        
-        self.xpub.close()
-        self.xsub.close()
+        if self.federation_thread:
+            print("[dark_orange]Stopping federation thread[/dark_orange]...")
+            self.federation_thread.join()
+        self.beacon.sock.close()
 
         if self.observer_thread:
             print("[dark_orange]Stopping observer thread[/dark_orange]...")
             self.observer_thread.join()
-            self.observer_in.close()
-            self.observer_out.close()
-        self.control.close()
-        _control.close()
+        if self.stats_thread: # Before the proxies, it asks them for their counters
+            print("[dark_orange]Stopping stats thread[/dark_orange]...")
+            self.stats_thread.join()
+
+        print("[dark_orange]Stopping proxy threads[/dark_orange]...")
+        for name in list(self.proxies):
+            self._stop_proxy(name)
+        for capture in self.captures:
+            capture.close()
 
         # self.ctx.term()
 
         print("[dark_sea_green2]Nexus successfully shut down![/dark_sea_green2]")
 
-    def run(self):
+    def start(self):
+        """Starts the nexus's threads and returns, for running a nexus inside another program. `run` also handles signals
+        and blocks until the nexus is stopped."""
         # Proxying the XSUB and XPUB sockets -> Allows for all subscriber and publishers to connect to a central point
-        if self.observer_in:
+        if self.echo:
             self.observer_thread = threading.Thread(target=self.observe, args=(), daemon=True)
             self.observer_thread.start()
-            print(f"Observer thread started on port {OBSERVER_PORT} as a PAIR socket.")
+            print(f"Echoing messages from {self.capture_addr}.")
         else:
             self.observer_thread = None
-        self.proxy_thread = threading.Thread(target=zmq.proxy_steerable, args=(self.xsub, self.xpub, self.observer_in, self.control), daemon=True)
+        if self.stats_interval:
+            self.stats_thread = threading.Thread(target=self.count, args=(), daemon=True)
+            self.stats_thread.start()
+            print(f"Publishing traffic statistics on '{STATS_TOPIC}' every {self.stats_interval} s.")
+        else:
+            self.stats_thread = None
+        self.federation_thread = None
+        if self.federate:
+            self._start_federated()
+        else:
+            for shard, (xsub, xpub, _, _) in enumerate(self.shards):
+                self._start_proxy("main" if shard == 0 else f"shard-{shard}", xsub, xpub,
+                                  self.captures[shard] if self.captures else None)
+            if len(self.shards) > 1:
+                print(f"Forwarding through {len(self.shards)} shards.")
         # Hearbeat Beaconing - UDP broadcast periodically to announce the presence of this beacon node, subsciptions and publications can me made aware of this beacon's ip address.
         self.heartbeat_thread = threading.Thread(target=self.heartbeat, args=(), daemon=True)
 
-        self.proxy_thread.start()
         self.heartbeat_thread.start()
 
+    def run(self):
+        self.start()
         signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
         signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
         atexit.register(self.stop)
@@ -166,11 +465,22 @@ def _main():
         be routed, though this will be a quiet death and no error will be raised. Have external mechanisms for monitoring the overall state of your setup.
         """
         )
-    parser.add_argument('--echo', action='store_true', help="Echo messages received from the observer socket. Useful for debugging, but bad under high load.")
+    parser.add_argument('--echo', action='store_true', help="Print every message passing through the nexus. Useful for debugging, but bad under high load, see --stats-interval for cheap traffic statistics.")
     parser.add_argument('--id', type=str, default=None, help="Optional identifier for this nexus node. If not provided, a random UUID will be generated.")
-    echo = parser.parse_args().echo
-    nexus_id = parser.parse_args().id
-    nexus = StarlingNexus(echo=echo, identifier=nexus_id)
+    parser.add_argument('--stats-interval', type=float, default=0, help=f"Seconds between per topic traffic summaries published on '{STATS_TOPIC}'. Off (0) by default, as counting costs the nexus some throughput.")
+    parser.add_argument('--federate', action='store_true', help="Share traffic with other federated nexuses on the network, forwarding only the topics their subscribers want. Run one per host, clients use the nexus on their own host.")
+    parser.add_argument('--export-port', type=int, default=EXPORT_PORT, help="Port this nexus offers its local traffic to federated peers on.")
+    parser.add_argument('--hwm', type=int, default=None, help="Messages queued per connection before the nexus drops them (zmq's default is 1000, 0 is unlimited). Raise it if bursts from many publishers get dropped.")
+    parser.add_argument('--sndbuf', type=int, default=None, help="Kernel send buffer size in bytes for the nexus's sockets.")
+    parser.add_argument('--rcvbuf', type=int, default=None, help="Kernel receive buffer size in bytes for the nexus's sockets.")
+    parser.add_argument('--io-threads', type=int, default=None, help="zmq I/O threads for the nexus's context, roughly one per gigabyte per second of traffic.")
+    parser.add_argument('--keepalive', type=int, default=0, help="Enable TCP keepalives after this many idle seconds, 0 leaves them off.")
+    parser.add_argument('--shards', type=int, default=1, help="Split forwarding across this many proxies, each on its own thread, by the first segment of the topic.")
+    parser.add_argument('--ipc', action='store_true', help="Also offer ipc:// endpoints to clients on this host. Older clients can't parse the heartbeat this sends, like --federate's and --shards'.")
+    args = parser.parse_args()
+    nexus = StarlingNexus(echo=args.echo, identifier=args.id, stats_interval=args.stats_interval, federate=args.federate, export_port=args.export_port,
+                          hwm=args.hwm, sndbuf=args.sndbuf, rcvbuf=args.rcvbuf, io_threads=args.io_threads, keepalive=args.keepalive,
+                          shards=args.shards, ipc=args.ipc)
     nexus.run()
 
 if __name__ == "__main__":
@@ -2,15 +2,24 @@ import zmq
 import socket
 import time
 import starling.simpleudp
+from starling.discovery import NexusTracker, TRANSPORTS, shard_of
+from starling.direct import DIRECT_RAW, ADVERTISE_INTERVAL, advertisement
+from starling.sequence import Sequencer
+from starling.shm import SHM_AVAILABLE, ShmRing, ipc_endpoint
+import starling.schema
 import threading
 import atexit
 import re
+import uuid
+from typing import Iterable, Union
 
 LOCALHOST = '127.0.0.1'
 TOPIC_DELIM_CHAR = '.'
 
 NEXUS_TIMEOUT = 5
 
+TOPIC_CACHE_SIZE = 10_000
+
 
 VALID_TOPIC_PATTERN = re.compile(r'^(([^.#*]+)|[*#])(\.([^.#*]+|[*#]))*$')
 
@@ -29,11 +38,63 @@ def get_ips():
     hostname = socket.gethostname()
     return {*socket.gethostbyname_ex(hostname)[2], LOCALHOST}
 
+class PublisherTopic():
+    """A pre-validated handle for publishing on a single topic, created via `NexusPublisher.topic`. The topic is validated and
+    encoded once up front, so each send only hands the cached topic bytes and the message to the socket.
+    """
+    __slots__ = ('publisher', 'name', 'raw', 'direct')
+
+    def __init__(self, publisher: "NexusPublisher", topic: str, direct: bool=False):
+        if not validate_topic(topic):
+            raise ValueError(f"Invalid topic: {topic}")
+        self.publisher = publisher
+        self.name = topic
+        self.raw = topic.encode('utf-8')
+        self.direct = direct
+
+    def send(self, message: bytes, copy: bool=True, track: bool=False):
+        """Publish a message on this topic. See `NexusPublisher.send` for `copy` and `track`."""
+        return self.publisher._send_raw(self.raw, message, copy, track, self.direct)
+
+    def __repr__(self):
+        return f"PublisherTopic({self.name!r}{', direct=True' if self.direct else ''})"
+
+
+class TypedPublisherTopic(PublisherTopic):
+    """A topic handle that sends msgspec Structs of a single schema, created via `NexusPublisher.typed_topic`. Messages
+    are msgpack encoded with a shared, reused encoder (see `starling.schema`)."""
+    __slots__ = ('schema', 'encode')
+
+    def __init__(self, publisher: "NexusPublisher", topic: str, schema: type, direct: bool=False):
+        super().__init__(publisher, topic, direct)
+        self.schema = schema
+        self.encode = starling.schema.ENCODER.encode
+
+    def send(self, message, copy: bool=True, track: bool=False):
+        """Encode and publish a `schema` instance on this topic."""
+        return self.publisher._send_raw(self.raw, self.encode(message), copy, track, self.direct)
+
+    def __repr__(self):
+        return f"TypedPublisherTopic({self.name!r}, {self.schema.__name__}{', direct=True' if self.direct else ''})"
+
+
 class NexusPublisher():
     """A publisher class that connects to a nexus node's XSUB socket and publishes messages on subscribed topics.
     The publisher does not broadcast its presence, but it does look for the nexus's presence via UDP.
+
+    With `shm_size` (bytes), direct topics reach subscribers on the same host through a shared memory ring of that size
+    (see `starling.shm`), only descriptors are sent over zmq. Subscribers on other hosts still receive them over TCP.
+
+    The nexus is connected to over the first of `transports` that reaches it: inproc when the nexus runs in this process
+    on the same context, ipc when it is on this host, tcp otherwise. A sharded nexus gets one socket per shard, and each
+    topic is sent to the shard that forwards it.
+
+    With `sequence=True` every message carries a small header (see `starling.sequence`) so subscribers can report gaps,
+    drops and latency per topic in their `stats()`. Subscribers accept both formats.
+
+    Sends may come from any thread, they are serialized with each other and with the move to a new home nexus.
     """
-    def __init__(self, ctx: zmq.Context=None):
+    def __init__(self, ctx: zmq.Context=None, shm_size: int=0, transports: tuple=TRANSPORTS, sequence: bool=False):
         self.ctx = ctx if ctx else zmq.Context.instance()
         self.pub = self.ctx.socket(zmq.PUB)
         self.udp = starling.simpleudp.UDPBroadcaster(port=8899)
@@ -41,61 +102,191 @@ class NexusPublisher():
         self.poller.register(self.udp.sock, zmq.POLLIN)
         self.running = True
 
-        self.nexus = {}
+        self.tracker = NexusTracker(self.ctx, transports)
+        self.nexus = self.tracker.nexus # Every nexus heard from, only the home nexus (see `NexusTracker`) is connected to
+        self.endpoint = None
+        self.endpoints = [] # One per shard of the home nexus
+        self.pubs = [self.pub] # A socket per shard, the first being `pub`
+        # The recv thread moves `pubs` to a new home nexus while callers send on them, zmq sockets aren't thread-safe so
+        # every send and every change to `pubs`, `routes` and `shards` holds this lock
+        self.lock = threading.Lock()
+        self.shards = 1
+        self.routes = {} # raw topic -> the shard's socket, for a sharded nexus
         self.topics = set()
+        self.encoded_topics = {} # topic -> utf-8 bytes, for topics that have already been validated
 
-        self.myips = set(get_ips())
+        # Direct topics are published on a socket of our own rather than through the nexus (see `starling.direct`)
+        self.id = uuid.uuid4().hex[:8]
+        self.sequencer = Sequencer(self.id) if sequence else None
+        self.direct = None
+        self.direct_port = None
+        self.direct_topics = {} # raw topic -> topic
+        self.shm_size = shm_size if SHM_AVAILABLE else 0
+        self.ring = None
+        self.shm_pub = None
+        self.announce = self.ctx.socket(zmq.PUB) # Only used by the recv thread, to advertise the direct topics via the nexus
 
         self.running = True
         self.recv_thread = threading.Thread(target=self._recv_loop, daemon=True)
         self.recv_thread.start()
 
-        self.watchdog_thread = threading.Thread(target=self._watchdog_loop, daemon=True)
-        self.watchdog_thread.start()
-
         atexit.register(self.stop)
 
     def _recv_loop(self):
-        """The main loop that listens for UDP broadcasts from the Nexus."""
+        """The main loop that listens for UDP broadcasts from the Nexus, and advertises any direct topics."""
+        next_advert = time.monotonic()
         while self.running:
             socks = dict(self.poller.poll(500)) # Poll for events with a timeout of 500ms -> Allows for exit handlers to kill this thread
             if self.udp.sock.fileno() in socks:
                 message, addr = self.udp.recv()
-                # Check if we already know about this nexus
-                pub_port, sub_port, nexus_id = message.split(' ')
-                if nexus_id in self.nexus:
-                    self.nexus[nexus_id]['last_seen'] = time.monotonic()
-                    continue
-                self.nexus.update({nexus_id: {'addr': addr, 'sub_port': sub_port, 'pub_port': pub_port, 'last_seen': time.monotonic()}})
+                if self.tracker.heard(message, addr):
+                    self._connect_to_nexus()
+            # Stale nexuses are dropped here too, `_connect_to_nexus` only touches the sockets callers send on under `lock`
+            if self.tracker.expire():
                 self._connect_to_nexus()
-
-    def _watchdog_loop(self):
-        """Infrequently checks for stale nexus entries and removes them."""
-        while self.running:
-            time.sleep(1)
-            current_time = time.monotonic()
-            for nexus_id, info in list(self.nexus.items()):
-                if current_time - info['last_seen'] > NEXUS_TIMEOUT:
-                    del self.nexus[nexus_id]
+            if self.direct_topics and time.monotonic() >= next_advert:
+                next_advert = time.monotonic() + ADVERTISE_INTERVAL
+                topics = sorted(self.direct_topics.values())
+                ipc, shm = (self.shm_pub.last_endpoint.decode(), self.ring.name) if self.ring else (None, None)
+                self.announce.send_multipart([DIRECT_RAW, advertisement(self.id, self.direct_port, topics, ipc, shm)])
 
     def _connect_to_nexus(self):
-        for nexus_id in self.nexus:
-            addr = self.nexus[nexus_id]['addr']
-            con_addr = LOCALHOST if addr[0] in self.myips else addr[0]
-            self.pub.connect(f"tcp://{con_addr}:{self.nexus[nexus_id]['sub_port']}")
+        """Move the connection over to the current home nexus, if it has changed."""
+        endpoints = self.tracker.endpoints('sub_port')
+        if endpoints == self.endpoints: return
+        if self.endpoints:
+            self.announce.disconnect(self.endpoints[shard_of(DIRECT_RAW, len(self.endpoints))])
+        with self.lock:
+            for sock, endpoint in zip(self.pubs, self.endpoints):
+                sock.disconnect(endpoint)
+            while len(self.pubs) < len(endpoints):
+                self.pubs.append(self.ctx.socket(zmq.PUB))
+            for sock, endpoint in zip(self.pubs, endpoints):
+                sock.connect(endpoint)
+            self.routes = {}
+            self.shards = max(len(endpoints), 1)
+        if endpoints:
+            self.announce.connect(endpoints[shard_of(DIRECT_RAW, len(endpoints))])
+        self.endpoints = endpoints
+        self.endpoint = endpoints[0] if endpoints else None
 
-    def send(self, topic: str, message: bytes):
-        """Publish a message on a specific topic."""
-        if not validate_topic(topic):
-            raise ValueError(f"Invalid topic: {topic}")
-        self.pub.send_multipart([topic.encode('utf-8'), message])
+    def _encode_topic(self, topic: str) -> bytes:
+        """Validate and encode a topic, caching the result so repeated topics skip the regex."""
+        raw = self.encoded_topics.get(topic)
+        if raw is None:
+            if not validate_topic(topic):
+                raise ValueError(f"Invalid topic: {topic}")
+            if len(self.encoded_topics) >= TOPIC_CACHE_SIZE: # Publishing an unbounded set of topic names shouldn't grow this forever
+                self.encoded_topics.clear()
+            raw = self.encoded_topics[topic] = topic.encode('utf-8')
+        return raw
+
+    def _route(self, raw_topic: bytes) -> zmq.Socket:
+        """The socket for the shard that forwards `raw_topic`."""
+        sock = self.routes.get(raw_topic)
+        if sock is None:
+            if len(self.routes) >= TOPIC_CACHE_SIZE:
+                self.routes.clear()
+            sock = self.routes[raw_topic] = self.pubs[shard_of(raw_topic, self.shards)]
+        return sock
+
+    def _send_raw(self, raw_topic: bytes, message: bytes, copy: bool=True, track: bool=False, direct: bool=False):
+        with self.lock:
+            return self._send(raw_topic, message, copy, track, direct)
+
+    def _send(self, raw_topic: bytes, message: bytes, copy: bool, track: bool, direct: bool):
+        """`_send_raw` for a caller already holding `lock`."""
+        if track and copy:
+            raise ValueError("track=True requires copy=False, copied messages can be reused as soon as send returns")
+        header = self.sequencer.header(raw_topic) if self.sequencer is not None else None
+        if direct:
+            if self.ring is not None:
+                descriptor = self.ring.write(message)
+                self.shm_pub.send_multipart([raw_topic, descriptor] if header is None else [raw_topic, header, descriptor])
+            sock = self.direct
+        else:
+            sock = self.pub if self.shards == 1 else self._route(raw_topic)
+        if header is None:
+            return sock.send_multipart([raw_topic, message], copy=copy, track=track)
+        return sock.send_multipart([raw_topic, header, message], copy=copy, track=track)
+
+    def topic(self, topic: str, direct: bool=False) -> PublisherTopic:
+        """Return a pre-validated handle for publishing on `topic`, e.g. `imu = pub.topic("imu.thigh.data"); imu.send(msg)`.
+
+        With `direct=True` the topic bypasses the nexus: messages go from a socket owned by this publisher straight to each
+        subscriber, halving the hops for high bandwidth streams like camera frames. Every later send on the topic, by name
+        or by handle, goes direct. Only subscribers that can reach this host on a random TCP port will receive it.
+        """
+        handle = PublisherTopic(self, topic, direct)
+        if direct and handle.raw not in self.direct_topics:
+            if self.direct is None:
+                self.direct = self.ctx.socket(zmq.PUB)
+                self.direct_port = self.direct.bind_to_random_port("tcp://*")
+                if self.shm_size:
+                    self.ring = ShmRing(f"starling-{self.id}", self.shm_size)
+                    self.shm_pub = self.ctx.socket(zmq.PUB)
+                    self.shm_pub.bind(ipc_endpoint(self.ring.name))
+            self.direct_topics[handle.raw] = topic
+        return handle
+
+    def typed_topic(self, topic: str, schema: type, direct: bool=False) -> TypedPublisherTopic:
+        """Return a handle for publishing `schema` (a msgspec Struct) instances on `topic`, e.g.
+        `imu = pub.typed_topic("imu.thigh", Imu); imu.send(Imu(...))`. The schema is registered for the topic in this
+        process (see `starling.schema`), `direct` is as for `topic`."""
+        handle = TypedPublisherTopic(self, self.topic(topic, direct).name, schema, direct)
+        starling.schema.register(topic, schema)
+        return handle
+
+    def send(self, topic: Union[str, PublisherTopic], message: bytes, copy: bool=True, track: bool=False):
+        """Publish a message on a specific topic.
+
+        Args:
+            topic (str | PublisherTopic): The topic name, or a handle from `topic()`.
+            message (bytes): The payload, any object supporting the buffer protocol (bytes, bytearray, numpy arrays...) is accepted.
+            copy (bool, optional): If False the payload buffer is handed to zmq without copying. The buffer must then not be
+                modified until zmq is done with it. Defaults to True.
+            track (bool, optional): Only valid with copy=False. Returns a `zmq.MessageTracker` whose `done` property (or `wait()`)
+                tells you when the buffer is safe to reuse. Defaults to False.
+
+        Returns:
+            zmq.MessageTracker | None: The tracker if `track` was requested.
+        """
+        raw = topic.raw if isinstance(topic, PublisherTopic) else self._encode_topic(topic)
+        return self._send_raw(raw, message, copy, track, raw in self.direct_topics)
+
+    def send_many(self, messages: Iterable, copy: bool=True) -> int:
+        """Publish a batch of (topic, message) pairs in one call, where each topic is a str or a handle from `topic()`.
+        Returns the number of messages sent."""
+        send = self.pub.send
+        encode = self._encode_topic
+        direct_topics = self.direct_topics
+        count = 0
+        with self.lock:
+            routed = self.shards > 1 or self.sequencer is not None
+            for topic, message in messages:
+                raw = topic.raw if isinstance(topic, PublisherTopic) else encode(topic)
+                if routed or raw in direct_topics:
+                    self._send(raw, message, copy, False, raw in direct_topics)
+                    count += 1
+                    continue
+                send(raw, zmq.SNDMORE)
+                send(message, copy=copy)
+                count += 1
+        return count
 
     def stop(self):
         """Stop the publisher and clean up resources."""
         self.running = False
         self.recv_thread.join()
-        # self.watchdog_thread.join()
-        self.pub.close()
+        with self.lock:
+            for sock in self.pubs:
+                sock.close()
+        self.announce.close()
+        if self.direct is not None:
+            self.direct.close()
+        if self.ring is not None:
+            self.shm_pub.close()
+            self.ring.close()
         self.udp.sock.close()
         # self.ctx.term()
 
@@ -0,0 +1,91 @@
+import time
+
+__all__ = ["Rate", "PyRate", "COMPILED"]
+
+HIST_BUCKETS = 32
+
+
+class PyRate():
+    """Runs a loop at a fixed rate, sleeping until absolute deadlines so that time spent in the loop body doesn't add up to drift.
+    This is the pure Python fallback for the clock_nanosleep based `starling._rate.Rate`, with the same interface.
+
+    ```python
+    rate = Rate(100)  # Hz
+    while True:
+        do_work()
+        rate.sleep()
+    ```
+    """
+    def __init__(self, rate: float, tolerance: float=0.1, verbose: bool=True): # rate in Hz, tolerance as a fraction of the period
+        if rate <= 0: raise ValueError("Rate must be greater than 0")
+        self.rate = rate
+        self.tolerance = tolerance
+        self.verbose = verbose
+        self.period_ns = int(1e9 / self.rate)
+        self.tol_ns = int(self.tolerance * self.period_ns)
+        self.slow = False
+        self.reset_stats()
+        self.reset()
+
+    def reset(self): # Reset the loop to start at the current time
+        self.sched_ns = time.monotonic_ns()
+
+    def reset_stats(self):
+        self.iterations = 0
+        self.missed = 0
+        self.max_late_ns = 0
+        self.total_late_ns = 0
+        self.hist = [0] * HIST_BUCKETS
+
+    def _record(self, late_ns: int):
+        self.iterations += 1
+        self.total_late_ns += late_ns
+        if late_ns > self.max_late_ns:
+            self.max_late_ns = late_ns
+        # Bucket 0 holds lateness under 1us, bucket i holds [2^(i-1), 2^i) us
+        self.hist[min((late_ns // 1000).bit_length(), HIST_BUCKETS - 1)] += 1
+
+    def sleep(self) -> float:
+        """Sleep until the next deadline. Returns the time (seconds, time.monotonic clock) at which sleep was called."""
+        self.sched_ns += self.period_ns
+        sched_ns = self.sched_ns
+        now_ns = time.monotonic_ns()
+
+        if now_ns > sched_ns:
+            self.missed += 1
+            self._record(now_ns - sched_ns)
+            if (now_ns - sched_ns) > self.tol_ns: # If we're behind by more than the tolerance, we are slow
+                if self.verbose: print("WARNING: Loop slower than desired")
+                self.slow = True
+            if now_ns > (sched_ns + self.period_ns): # If we're behind by a full period, reset the schedule
+                self.reset()
+            return now_ns / 1e9 # No need to sleep, we're slow
+
+        self.slow = False
+        time.sleep((sched_ns - now_ns) / 1e9)
+        self._record(max(0, time.monotonic_ns() - sched_ns))
+        return now_ns / 1e9
+
+    def stats(self) -> dict:
+        """Overrun statistics since creation or the last `reset_stats()`. Lateness is how long after its deadline each
+        iteration was released, either because the loop body overran (a missed deadline) or from wake-up jitter.
+        The histogram is a list of (upper_bound_seconds, count) pairs with power of two microsecond bucket bounds."""
+        return {
+            'iterations': self.iterations,
+            'missed': self.missed,
+            'max_lateness': self.max_late_ns / 1e9,
+            'mean_lateness': (self.total_late_ns / self.iterations / 1e9) if self.iterations else 0.0,
+            'histogram': [((1 << i) / 1e6, count) for i, count in enumerate(self.hist)],
+        }
+
+    def __call__(self):
+        return self.sleep()
+
+
+# The compiled Rate is only built where clock_nanosleep is available (see setup.py)
+try:
+    from starling._rate import Rate
+    COMPILED = True
+except ImportError:
+    Rate = PyRate
+    COMPILED = False
@@ -0,0 +1,207 @@
+from starling.publication import NexusPublisher
+from starling.compression import codec_for_file
+from starling import bag
+from threading import Thread, Event
+from queue import Queue
+import queue
+import atexit
+import msgspec
+import time
+
+READ_AHEAD = 64 # batches decoded ahead of playback
+BATCH_SIZE = 1_000
+SPIN_NS = 200_000 # Below this the player spins rather than sleeping, the OS sleep overshoots by about this much
+
+
+class SnapshotReplay:
+    def __init__(self, file_name: str, speed: float = 1.0, start_offset: float = 0.0, topics: list = None, topic: str = None,
+                 rate: float = None, time_field: str = None, loop: bool = False, read_ahead: int = READ_AHEAD):
+        """Plays a snapshot file back through the nexus, keeping the original spacing between messages.
+
+        Bags (`starling-snapshot --format bag`) record every message's topic and receive time. JSON lines snapshots only hold the
+        messages, so they are published on `topic`, either at a fixed `rate` or using the timestamp (seconds) in `time_field`.
+
+        The file is read and decompressed on a background thread, `read_ahead` batches ahead of playback, so playback isn't
+        held up by I/O.
+
+        Args:
+            file_name (str): The .bag or .jsonl[.gz/.zst/.lz4] file to replay.
+            speed (float, optional): Playback speed relative to the recording, e.g. 0.1 or 10. 0 publishes as fast as possible,
+                which makes a replay usable as a load generator. Defaults to 1.0.
+            start_offset (float, optional): Seconds into the recording to start from. Defaults to 0.
+            topics (list[str], optional): Topic patterns to replay from a bag, wildcards allowed. Defaults to every topic.
+            topic (str, optional): The topic to publish JSON lines snapshots on. Required for them.
+            rate (float, optional): Rate (Hz) to publish JSON lines snapshots at, when they have no `time_field`. Defaults to 100.
+            time_field (str, optional): Top level key holding each JSON line's timestamp in seconds.
+            loop (bool, optional): Start over when the end of the file is reached. Defaults to False.
+            read_ahead (int, optional): Max batches buffered by the reader thread. Defaults to 64.
+        """
+        if speed < 0:
+            raise ValueError("Speed must be 0 (as fast as possible) or greater")
+        self.file_name = file_name
+        self.is_bag = file_name.endswith(".bag")
+        if not self.is_bag and topic is None:
+            raise ValueError("JSON lines snapshots don't record their topic, a topic to publish on is required")
+        if not self.is_bag and topics is not None:
+            raise ValueError("Topic filters only apply to bags")
+        self.speed = speed
+        self.start_offset = start_offset
+        self.topics = topics
+        self.topic = topic
+        self.rate = 100.0 if rate is None else rate
+        self.time_field = time_field
+        self.loop = loop
+        # Bag payloads are views into the reader's mapping, so it stays open until playback is done with them (see `stop`)
+        self.reader = bag.Reader(file_name) if self.is_bag else None
+        self.batches: Queue = Queue(maxsize=read_ahead)
+        self.stop_event = Event()
+        self.sent = 0
+        self.max_lateness_ns = 0
+        self.elapsed = 0.0
+        self.pub = NexusPublisher()
+        self.handles = {} # topic -> pre-validated publisher topic handle
+        self.readt = None
+        self.playt = None
+        atexit.register(self.stop)
+
+    def _bag_records(self):
+        reader = self.reader
+        if reader.start is None: return
+        # Seconds since the epoch lose sub microsecond precision, so only filter on time when asked to
+        start = reader.start / 1e9 + self.start_offset if self.start_offset else None
+        yield from reader.read(self.topics, start=start)
+
+    def _jsonl_records(self):
+        period_ns = int(1e9 / self.rate)
+        first_ns = None
+        decode = msgspec.json.decode
+        with codec_for_file(self.file_name).open(self.file_name) as fhandle:
+            for i, line in enumerate(fhandle):
+                line = line.rstrip(b'\n')
+                if not line: continue
+                t_ns = int(decode(line)[self.time_field] * 1e9) if self.time_field else i * period_ns
+                if first_ns is None: first_ns = t_ns
+                if t_ns - first_ns < self.start_offset * 1e9: continue
+                yield self.topic, t_ns, line
+
+    def read_thread(self):
+        while not self.stop_event.is_set():
+            batch = []
+            for record in (self._bag_records() if self.is_bag else self._jsonl_records()):
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    if not self._put(batch): return
+                    batch = []
+            if batch and not self._put(batch): return
+            if not self.loop: break
+            if not self._put("LOOP"): return
+        self._put(None)
+
+    def _put(self, item) -> bool:
+        """Hand a batch to the player, giving up if the replay is stopped while the queue is full."""
+        while not self.stop_event.is_set():
+            try:
+                self.batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _handle(self, topic: str):
+        handle = self.handles.get(topic)
+        if handle is None:
+            handle = self.handles[topic] = self.pub.topic(topic)
+        return handle
+
+    def play(self):
+        """Publish the file, blocking until it has all been sent (or the replay is stopped)."""
+        while not self.pub.nexus and not self.stop_event.is_set():
+            time.sleep(0.1)
+        if self.readt is None:
+            self.readt = Thread(target=self.read_thread, daemon=True)
+            self.readt.start()
+        scale = (1.0 / self.speed) if self.speed else 0.0
+        wall_start = time.monotonic()
+        base_ns = None # (recording time, wall time) pair playback is scheduled relative to
+        while not self.stop_event.is_set():
+            try:
+                batch = self.batches.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if batch is None: break
+            if batch == "LOOP":
+                base_ns = None
+                continue
+            for topic, t_ns, payload in batch:
+                if scale:
+                    now_ns = time.monotonic_ns()
+                    if base_ns is None:
+                        base_ns = (t_ns, now_ns)
+                    due_ns = base_ns[1] + int((t_ns - base_ns[0]) * scale)
+                    if due_ns - now_ns > SPIN_NS:
+                        time.sleep((due_ns - now_ns - SPIN_NS) / 1e9)
+                    while time.monotonic_ns() < due_ns:
+                        pass
+                    late_ns = time.monotonic_ns() - due_ns
+                    if late_ns > self.max_lateness_ns:
+                        self.max_lateness_ns = late_ns
+                self._handle(topic).send(payload)
+                self.sent += 1
+                if self.stop_event.is_set(): break
+        self.elapsed = time.monotonic() - wall_start
+
+    def start(self):
+        self.playt = Thread(target=self.play, daemon=True)
+        self.playt.start()
+
+    def join(self):
+        if self.playt:
+            self.playt.join()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.playt:
+            self.playt.join()
+            self.playt = None
+        if self.readt:
+            self.readt.join()
+            self.readt = None
+        if self.reader is not None:
+            self.batches.queue.clear() # Unplayed batches, after a stop, are the last references to the mapping
+            self.reader.close()
+        self.pub.stop()
+
+    def stats(self) -> dict:
+        """Messages sent, seconds spent playing and the furthest behind schedule a message was sent (seconds)."""
+        return {'sent': self.sent, 'elapsed': self.elapsed, 'max_lateness': self.max_lateness_ns / 1e9}
+
+
+def _main():
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description="Replay a snapshot file through the Nexus, keeping the original timing between messages.")
+    parser.add_argument("file", type=str, help="The .bag or .jsonl[.gz/.zst/.lz4] snapshot file to replay")
+    parser.add_argument("--speed", "-s", type=float, default=1.0, help="Playback speed relative to the recording, 0 plays as fast as possible")
+    parser.add_argument("--start", type=float, default=0.0, help="Seconds into the recording to start from")
+    parser.add_argument("--topics", nargs="+", default=None, help="Topic patterns to replay from a bag, wildcards allowed")
+    parser.add_argument("--topic", "-t", type=str, default=None, help="Topic to publish a JSON lines snapshot on")
+    parser.add_argument("--rate", type=float, default=None, help="Rate (Hz) to publish a JSON lines snapshot at, defaults to 100")
+    parser.add_argument("--time-field", type=str, default=None, help="Key of the timestamp (seconds) in each JSON line, used instead of --rate")
+    parser.add_argument("--loop", action="store_true", help="Start over at the end of the file")
+    args = parser.parse_args()
+
+    replay = SnapshotReplay(args.file, speed=args.speed, start_offset=args.start, topics=args.topics, topic=args.topic,
+                            rate=args.rate, time_field=args.time_field, loop=args.loop)
+    print(f"Replaying '{args.file}' at {'max' if args.speed == 0 else f'{args.speed}x'} speed. Press Ctrl+C to stop.")
+    replay.start()
+    try:
+        while replay.playt.is_alive():
+            replay.playt.join(0.5)
+    except KeyboardInterrupt:
+        pass
+    replay.stop()
+    stats = replay.stats()
+    rate = stats['sent'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    print(f"Sent {stats['sent']} messages in {stats['elapsed']:.2f} s ({rate:.0f} msg/s), at most {stats['max_lateness'] * 1e3:.2f} ms behind schedule.")
+
+if __name__ == "__main__":
+    _main()
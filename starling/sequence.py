@@ -0,0 +1,60 @@
+# Sequenced messages, for telling whether subscribers keep up. A publisher created with `sequence=True` sends every message
+# as three frames, [topic, header, payload], rather than the usual [topic, payload]. The header carries the publisher's id,
+# a sequence number counting that publisher's messages on the topic, and the send time. Subscribers accept both formats.
+# For sequenced topics they report:
+# - gaps: messages lost before reaching this process, e.g. dropped at a full queue in the nexus.
+# - drops: messages their own subscription queues dropped.
+# - one-way latency.
+#
+# Latency is measured against the wall clock (time.time_ns), so across hosts it is only as good as their clock sync.
+from typing import Optional
+import struct
+import time
+
+from starling.histogram import LogHistogram
+
+HEADER = struct.Struct("<8sQq") # publisher id, sequence number (per publisher and topic), send time (time.time_ns)
+
+
+class Sequencer():
+    """The publisher's side, numbering each topic's messages."""
+    def __init__(self, publisher_id: str):
+        self.id = publisher_id.encode('utf-8')[:8].ljust(8, b'\0')
+        self.counts = {} # raw topic -> next sequence number
+
+    def header(self, raw_topic: bytes) -> bytes:
+        seq = self.counts.get(raw_topic, 0)
+        self.counts[raw_topic] = seq + 1
+        return HEADER.pack(self.id, seq, time.time_ns())
+
+
+class SequenceStats():
+    """The subscriber's side: per concrete topic, messages received, gaps in each publisher's sequence and the messages they
+    lost, and a latency histogram. A publisher's first message on a topic only sets where its sequence is expected to go on."""
+    def __init__(self):
+        self.topics = {} # topic -> {'received', 'gaps', 'lost', 'publishers': {publisher id: next sequence number}, 'latency'}
+
+    def add(self, topic: str, header) -> Optional[dict]:
+        """Account for a message's header, returning its topic's counters, or None if the header is malformed."""
+        if len(header) != HEADER.size: return None
+        publisher, seq, sent = HEADER.unpack(header)
+        entry = self.topics.get(topic)
+        if entry is None:
+            entry = self.topics[topic] = {'received': 0, 'gaps': 0, 'lost': 0, 'publishers': {}, 'latency': LogHistogram()}
+        entry['received'] += 1
+        expected = entry['publishers'].get(publisher)
+        if expected is not None and seq > expected:
+            entry['gaps'] += 1
+            entry['lost'] += seq - expected
+        # A lower number than expected means the publisher restarted its count, follow it from there
+        entry['publishers'][publisher] = seq + 1
+        entry['latency'].record(time.time_ns() - sent)
+        return entry
+
+    def summary(self, topic: str) -> Optional[dict]:
+        entry = self.topics.get(topic)
+        if entry is None: return None
+        latency = entry['latency'].summary((50, 99, 99.9))
+        return {'received': entry['received'], 'gaps': entry['gaps'], 'lost': entry['lost'],
+                'publishers': len(entry['publishers']),
+                'latency_us': {key: value / 1e3 for key, value in latency.items() if key != 'count'}}
@@ -0,0 +1,121 @@
+# Shared memory transport for direct topics between processes on the same host. The publisher copies each payload into a
+# shared memory ring and sends subscribers on its host only a small descriptor over an ipc:// socket, so large payloads
+# (camera frames, point clouds) cross between processes with one memcpy and no trips through the kernel's TCP stack.
+#
+# Ring layout: a HEADER holding the absolute number of bytes ever written (the head), followed by `size` bytes of data.
+# A payload is written at absolute position `pos` (offset `pos % size`, never wrapping around the end of the ring), and the
+# descriptor carries `pos`, its length and the segment name. Readers use the head to tell whether it has been overwritten.
+from multiprocessing import shared_memory
+from typing import Optional
+import os
+import struct
+import sys
+import tempfile
+
+import zmq
+
+HEADER = struct.Struct("<Q") # head, absolute bytes written
+DESCRIPTOR = struct.Struct("<QI") # absolute position, length, followed by the segment name
+SHM_SIZE = 64 << 20 # bytes, at least a few of the largest payloads so readers have time to use them before they wrap
+SHM_AVAILABLE = zmq.has('ipc') and sys.platform != 'win32'
+
+_created = set() # Segments created by this process, whose resource tracker registration is the creator's to keep
+
+
+def ipc_endpoint(name: str) -> str:
+    return f"ipc://{os.path.join(tempfile.gettempdir(), name)}.ipc"
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Open an existing segment without registering it with this process's resource tracker, which would otherwise
+    unlink the publisher's segment when this process exits (Python < 3.13 has no way to opt out of that)."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    segment = shared_memory.SharedMemory(name=name)
+    if name in _created:
+        return segment
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+    return segment
+
+
+class ShmRing():
+    """The publisher's side: a shared memory segment payloads are copied into, see `write`."""
+    def __init__(self, name: str, size: int=SHM_SIZE):
+        self.size = size
+        self.segment = shared_memory.SharedMemory(name=name, create=True, size=HEADER.size + size)
+        self.name = self.segment.name
+        _created.add(self.name)
+        self.encoded_name = self.name.encode('utf-8')
+        self.buf = self.segment.buf
+        self.head = 0
+        HEADER.pack_into(self.buf, 0, 0)
+
+    def write(self, message) -> bytes:
+        """Copy a payload into the ring, returning the descriptor to send in its place."""
+        view = memoryview(message).cast('B')
+        length = view.nbytes
+        if length > self.size:
+            raise ValueError(f"A {length} byte message doesn't fit the {self.size} byte shared memory ring, create the publisher with a larger shm_size")
+        pos = self.head
+        offset = pos % self.size
+        if offset + length > self.size: # Payloads are kept contiguous, skip to the start of the ring
+            pos += self.size - offset
+            offset = 0
+        start = HEADER.size + offset
+        self.buf[start:start + length] = view
+        self.head = pos + length
+        HEADER.pack_into(self.buf, 0, self.head)
+        return DESCRIPTOR.pack(pos, length) + self.encoded_name
+
+    def close(self):
+        self.buf = None
+        self.segment.close()
+        self.segment.unlink()
+        _created.discard(self.name)
+
+
+class ShmRings():
+    """The subscriber's side: every ring that has been attached to, resolving descriptors to read-only memoryviews."""
+    def __init__(self):
+        self.rings = {} # segment name (bytes) -> (segment, read-only view of the data, data size)
+        self.overruns = 0 # Descriptors whose payload had already been overwritten when they arrived
+
+    def attach(self, name: str):
+        key = name.encode('utf-8')
+        if key in self.rings: return
+        segment = _attach(name)
+        buf = segment.buf.toreadonly()
+        self.rings[key] = (segment, buf, len(buf) - HEADER.size)
+
+    def detach(self, name: str):
+        ring = self.rings.pop(name.encode('utf-8'), None)
+        if ring is None: return
+        segment, buf, _ = ring
+        try:
+            buf.release()
+            segment.close()
+        except BufferError: # A callback still holds a view, the mapping goes away with the last of them
+            pass
+
+    def view(self, descriptor) -> Optional[memoryview]:
+        """The payload a descriptor points at, or None if it is for an unknown ring or has already been overwritten.
+
+        The view stays valid until the publisher has written another ring's worth of data, so callbacks that need the
+        payload for longer must copy it."""
+        pos, length = DESCRIPTOR.unpack_from(descriptor)
+        ring = self.rings.get(bytes(descriptor[DESCRIPTOR.size:]))
+        if ring is None: return None
+        _, buf, size = ring
+        if HEADER.unpack_from(buf)[0] - pos > size:
+            self.overruns += 1
+            return None
+        start = HEADER.size + pos % size
+        return buf[start:start + length]
+
+    def close(self):
+        for name in list(self.rings):
+            self.detach(name.decode('utf-8'))
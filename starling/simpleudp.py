@@ -11,6 +11,17 @@ def get_ips():
     hostname = socket.gethostname()
     return {*socket.gethostbyname_ex(hostname)[2], LOCALHOST}
 
+def primary_ip():
+    """The address of the interface holding the default route, which is the one other hosts are most likely to reach."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(('8.8.8.8', 80)) # Nothing is sent, this only picks a route
+        return s.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        s.close()
+
 def get_broadcast_addresses():
     broadcast_addresses = set()
 
@@ -1,60 +1,199 @@
 from starling import NexusSubscriber
+from starling.compression import get_codec, CODECS
+from starling import bag
+from starling import schema
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from threading import Thread
 from queue import Queue
+import queue
 import atexit
 import msgspec
 import datetime
 import time
-import gzip
+
+MEDIUM = 10_000
+BATCH_SIZE = 1_000
+FLUSH_INTERVAL = 0.5 # seconds, partial batches are written after this long
+STOP_TIMEOUT = 0.5 # seconds between checks that the writer is still alive, while stopping or blocked on a full queue
+_STOP = object() # Sentinel telling the writer thread to finish
 
 
 class SnapshotCollector:
-    def __init__(self, topic: str = "snapshot", decode_function: callable = msgspec.json.decode):
+    def __init__(self, topic: str = "snapshot", decode_function: callable = msgspec.json.decode, raw: bool = False,
+                 codec: str = "gzip", level: int = None, batch_size: int = BATCH_SIZE, max_queued: int = MEDIUM * 10,
+                 overflow: str = "drop", compress_workers: int = 2, format: str = "jsonl"):
         """A class to collect and store snapshots from a specific topic. The topic can be a wildcard
         as normal, however all topics MUST be able to be deserialized with the same function into a dict. Additionally,
         the snapshots are stored in a queue, and written sequentially. There is no guarantee that snapshots will be logically coherant
         if you mix different topics. Thus, it is recommended that the snapshots be exclusive to a single topic.
 
+        Messages are received on the subscriber's recv thread and only queued there. A writer thread gathers them into batches of
+        up to `batch_size` lines, and each batch is compressed as an independent block on a pool of `compress_workers` threads
+        (the codecs release the GIL) before being written out in order.
+
         Args:
             topic (str, optional): The topic to subscribe to for snapshots. Defaults to "snapshot".
             decode_function (callable, optional): The function to use for decoding messages. Defaults to msgspec.json.decode.
+            raw (bool, optional): Write received messages straight through as lines, without decoding and re-encoding them. Only
+                valid for single line payloads such as msgspec.json.encode output. Defaults to False.
+            codec (str, optional): Block compression, one of 'gzip', 'zstd', 'lz4' or 'none'. Defaults to "gzip".
+            level (int, optional): Compression level, defaults to the codec's default (6 for gzip).
+            batch_size (int, optional): Max lines per compressed block. Defaults to 1000.
+            max_queued (int, optional): Max messages waiting to be written, bounding memory use. Defaults to 100,000.
+            overflow (str, optional): What to do when `max_queued` is reached. "drop" drops (and counts) new messages, "block" stalls
+                the subscriber so the backpressure reaches zmq, which then drops at its HWM instead. While the writer isn't
+                running (before `start`, after `stop` or if it has died) a full queue drops either way. Defaults to "drop".
+            compress_workers (int, optional): Number of compression threads. Defaults to 2.
+            format (str, optional): "jsonl" for a compressed JSON lines file, or "bag" for a `starling.bag` file, which keeps the
+                topic and receive time of every message, accepts any payload and is indexed for seeking. Defaults to "jsonl".
         """
+        if overflow not in ("drop", "block"):
+            raise ValueError(f"Unknown overflow policy: {overflow}, expected 'drop' or 'block'")
+        if format not in ("jsonl", "bag"):
+            raise ValueError(f"Unknown format: {format}, expected 'jsonl' or 'bag'")
+        self.format = format
         self.snapshot_topic: str = topic
-        self.snapshots: Queue[dict] = Queue()
-        self.sub = NexusSubscriber()
+        self.decode_function = decode_function
+        self.raw = raw
+        self.codec = get_codec(codec, level)
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.compress_workers = compress_workers
+        self.snapshots: Queue[bytes] = Queue(maxsize=max_queued)
         self.encoder = msgspec.json.Encoder()
-        self.sub.subscribe(self.snapshot_topic, lambda msg, topic: self.snapshots.put(decode_function(msg)))
+        self.received = 0
+        self.dropped = 0
+        self.invalid = 0 # Messages skipped because they couldn't be decoded
+        self.written = 0
+        self.bytes_written = 0
+        # The callback only queues the message, so it runs on the recv thread instead of a dedicated callback thread
+        self.sub = NexusSubscriber(dispatch="inline")
+        if format == "bag":
+            self.sub.subscribe(self.snapshot_topic, lambda msg, topic: self._enqueue((topic, time.time_ns(), msg)))
+        else:
+            self.sub.subscribe(self.snapshot_topic, lambda msg, topic: self._enqueue(msg))
         self.fhandle = None
+        self.bag_writer = None
         self.writet = None
+        self.stopping = False
         atexit.register(self.stop)
 
-    def put(self, snapshot: dict):
-        self.snapshots.put(snapshot)
+    def _enqueue(self, line: bytes):
+        self.received += 1
+        if self.overflow == "block":
+            # Bounded waits, so the recv thread (which also applies subscription changes) isn't stuck forever behind a dead
+            # or stopped writer
+            while True:
+                try:
+                    self.snapshots.put(line, timeout=STOP_TIMEOUT)
+                    return
+                except queue.Full:
+                    if self.stopping or self.writet is None or not self.writet.is_alive():
+                        self.dropped += 1
+                        return
+        try:
+            self.snapshots.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def put(self, snapshot: dict, topic: str = None):
+        encoded = self.encoder.encode(snapshot)
+        self._enqueue((topic or self.snapshot_topic, time.time_ns(), encoded) if self.format == "bag" else encoded)
+
+    def _encode_batch(self, batch: list):
+        if self.format == "bag":
+            return bag.encode_records(batch)
+        if self.raw:
+            return b'\n'.join(batch) + b'\n'
+        encode, decode = self.encoder.encode, self.decode_function
+        lines = []
+        for msg in batch:
+            try:
+                lines.append(encode(decode(msg)))
+            except Exception: # One bad message mustn't take the writer thread down, skip and count it
+                self.invalid += 1
+        return b'\n'.join(lines) + b'\n' if lines else None
 
     def writer_thread(self):
-        while True and self.fhandle:
-            entry = self.snapshots.get()
-            if entry == "STOPWRITE":
-                return
-            self.fhandle.write(self.encoder.encode(entry) + b'\n')
+        pending = deque() # Compression futures, written out in the order they were submitted
+        with ThreadPoolExecutor(max_workers=self.compress_workers) as pool:
+            stopping = False
+            while not stopping:
+                batch = []
+                try:
+                    entry = self.snapshots.get(timeout=FLUSH_INTERVAL)
+                    while True:
+                        if entry is _STOP:
+                            stopping = True
+                            break
+                        batch.append(entry)
+                        if len(batch) >= self.batch_size: break
+                        entry = self.snapshots.get_nowait()
+                except queue.Empty:
+                    pass
+                invalid = self.invalid
+                encoded = self._encode_batch(batch) if batch else None
+                if encoded is not None:
+                    body = encoded[0] if self.format == "bag" else encoded
+                    pending.append((pool.submit(self.codec.compress, body), encoded, len(batch) - (self.invalid - invalid)))
+                # Write whatever has finished, only waiting when too many blocks are in flight (bounding memory)
+                while pending and (pending[0][0].done() or len(pending) > 2 * self.compress_workers or stopping):
+                    future, encoded, count = pending.popleft()
+                    block = future.result()
+                    if self.format == "bag":
+                        body, topics, records, start, end = encoded
+                        self.bag_writer.write_chunk(block, len(body), topics, records, start, end)
+                    else:
+                        self.fhandle.write(block)
+                    self.written += count
+                    self.bytes_written += len(block)
+        if self.format == "bag":
+            self.bag_writer.close()
+        else:
+            self.fhandle.flush()
+
+    @property
+    def file_extension(self) -> str:
+        return ".bag" if self.format == "bag" else f".jsonl{self.codec.extension}"
+
+    def stats(self) -> dict:
+        """Messages received, dropped because the queue was full, skipped because they couldn't be decoded, waiting to be written
+        and written, plus compressed bytes written."""
+        return {'received': self.received, 'dropped': self.dropped, 'invalid': self.invalid, 'queued': self.snapshots.qsize(),
+                'written': self.written, 'bytes_written': self.bytes_written}
 
     def start(self, file_name: str = None):
         while not self.sub.nexus:
             time.sleep(0.1)
         if file_name is None:
-            file_name = f"{datetime.datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}_snapshot.jsonl.gz"
+            file_name = f"{datetime.datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}_snapshot{self.file_extension}"
         self.snapshots.queue.clear()
-        self.fhandle = gzip.open(file_name, "ab", compresslevel=6)
+        self.stopping = False
+        if self.format == "bag": # Chunks are compressed individually, the bag records the codec of each
+            self.bag_writer = bag.Writer(file_name, codec=self.codec.name, level=self.codec.level)
+        else:
+            self.fhandle = open(file_name, "ab")
         self.writet = Thread(target=self.writer_thread, daemon=True)
         self.writet.start()
 
     def stop(self):
         if self.writet is None:
             return
-        self.snapshots.put("STOPWRITE")
+        self.stopping = True
+        # A full queue only drains while the writer runs, so give up on the sentinel if the writer has died
+        while self.writet.is_alive():
+            try:
+                self.snapshots.put(_STOP, timeout=STOP_TIMEOUT)
+                break
+            except queue.Full:
+                pass
         self.writet.join()
+        self.writet = None
         if self.fhandle:
             self.fhandle.close()
+        if self.invalid:
+            print(f"Skipped {self.invalid} messages that couldn't be decoded.")
 
 
 def _main():
@@ -63,12 +202,25 @@ def _main():
     parser.add_argument("--topic", "-t", type=str, default="snapshot", help="The topic to subscribe to for snapshots")
     parser.add_argument("--file", "-f", type=str, default=None, help="The file to write snapshots to")
     parser.add_argument("--duration", "-d", type=float, default=None, help="The duration to run the snapshot logger")
+    parser.add_argument("--raw", action="store_true", help="Write messages straight through without decoding and re-encoding them (single line JSON payloads only)")
+    parser.add_argument("--codec", "-c", type=str, default="gzip", choices=CODECS, help="Compression codec, zstd and lz4 need the zstandard/lz4 packages")
+    parser.add_argument("--level", type=int, default=None, help="Compression level, defaults to the codec's default")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Max messages per compressed block")
+    parser.add_argument("--max-queued", type=int, default=MEDIUM * 10, help="Max messages waiting to be written before new ones are dropped")
+    parser.add_argument("--block", action="store_true", help="Apply backpressure instead of dropping when the queue is full")
+    parser.add_argument("--format", type=str, default="jsonl", choices=["jsonl", "bag"], help="jsonl writes the (JSON) messages as lines, bag writes an indexed multi-topic file with the topic and receive time of every message")
+    parser.add_argument("--schema", type=str, default=None, help="A msgspec Struct as 'module:Class' to decode typed (msgpack) messages with, so they can be written as JSON lines")
     args = parser.parse_args()
 
-    collection = SnapshotCollector(topic=args.topic)
+    decode_function = msgspec.json.decode
+    if args.schema:
+        decode_function = schema.decoder(schema.load(args.schema)).decode
+    collection = SnapshotCollector(topic=args.topic, decode_function=decode_function, raw=args.raw, codec=args.codec, level=args.level, batch_size=args.batch_size,
+                                   max_queued=args.max_queued, overflow="block" if args.block else "drop", format=args.format)
     file_name = args.file
-    if file_name and not file_name.endswith(".jsonl.gz"):
-        file_name += ".jsonl.gz"
+    extension = collection.file_extension
+    if file_name and not file_name.endswith(extension):
+        file_name += extension
     collection.start(file_name=file_name)
     print(f"Logging snapshots from topic '{args.topic}' to file '{file_name or 'timestamped file'}'. Press Ctrl+C to stop.")
     if args.duration:
@@ -80,6 +232,8 @@ def _main():
         except KeyboardInterrupt:
             pass
     collection.stop()
+    stats = collection.stats()
+    print(f"Wrote {stats['written']} of {stats['received']} messages ({stats['dropped']} dropped, {stats['invalid']} invalid), {stats['bytes_written']} bytes.")
 
 if __name__ == "__main__":
     _main()
@@ -2,17 +2,28 @@ import zmq
 import socket
 import time
 import starling.simpleudp
+from starling.discovery import NexusTracker, TRANSPORTS
+from starling.direct import DIRECT_TOPIC, DIRECT_RAW, DirectPeers
+from starling.shm import SHM_AVAILABLE, ShmRings
+from starling.sequence import SequenceStats
+import starling.schema
+from starling.matching import TopicMatcher
+from starling.dispatch import Dispatcher, make_dispatcher
 import threading
 import atexit
-from queue import Queue
-import queue
+from typing import List, Union
 import re
+import uuid
 
 TINY=10
 SMALL=1_000
 MEDIUM=10_000
 LARGE=100_000_000_000
 
+MAX_BATCH = 1_000 # Default max messages per callback for batching subscriptions
+BURST = 1_000 # Messages drained from one socket before the others get a turn
+ROUTE_CACHE_SIZE = 10_000
+
 NEXUS_TIMEOUT = 5
 
 LOCALHOST = '127.0.0.1'
@@ -39,16 +50,18 @@ def validate_topic(topic: str):
 
 
 def to_regex(topic: str):
-    """Convert a topic string with wildcards to a regex pattern."""
-    escaped = re.escape(topic)  # Escape all special characters
-    # * represents 1 or more groups of characters
-    escaped = escaped.replace(r'\*', r'[^.]+')  # Replace * with [^.]+
-
-    escaped = escaped.replace(r'\.\#', r'(?:\.[^.]+)*')  # Replace # with (?:\.[^.]+)*
-    escaped = escaped.replace(r'\#\.', r'(?:[^.]+\.)*')  # Replace # with [^.]+(\.|$)*
-    escaped = escaped.replace(r'\#', r'.*')
-
-    return re.compile(f'^{escaped}$')
+    """Convert a topic string with wildcards to a regex pattern, with the same rules as `starling.matching.TopicMatcher`:
+    `*` is exactly one topic name and `#` any number of them, including none. Each segment brings its own separator, a '.'
+    or the start of the topic, so consecutive `#`s (`#.#.a`) can all match nothing and still match `a`."""
+    parts = []
+    for seg in topic.split('.'):
+        if seg == '#':
+            parts.append(r'(?:(?:^|\.)[^.]+)*')
+        elif seg == '*':
+            parts.append(r'(?:^|\.)[^.]+')
+        else:
+            parts.append(r'(?:^|\.)' + re.escape(seg))
+    return re.compile(f"^{''.join(parts)}$")
 
 # For the nexus subscriber, we assume that there is one or more nexuses that is aggregating messages from multiple publishers. We will connect to the nexus's XPUB socket and listen for messages on subscribed topics. The nexus will also broadcast its presence via UDP.
 class NexusSubscriber():
@@ -57,101 +70,227 @@ class NexusSubscriber():
     unknown to the subscriber, but they are expected to publish messages to the nexus's XPUB socket. These are then routed out to the
     subscriber and the subscriber can process them via callbacks. Each topic can be registered with a callback function that will be called
     whenever a message is received on that topic. The subscriber also listens for UDP broadcasts from the nexus.
+
+    With `zero_copy=True` messages are received without copying them into Python bytes. Callbacks are then handed a read-only
+    memoryview over the zmq frame instead of bytes, which stays valid for as long as the callback holds on to it.
+
+    `dispatch` selects where callbacks run: 'thread' (default, one thread and queue per subscription), 'inline' (on the recv thread),
+    'pool' (`workers` threads shared by all subscriptions) or 'process' (`workers` processes, for CPU heavy picklable callbacks).
+    Callbacks for a single subscription are always called in order. A `starling.dispatch.Dispatcher` instance can also be passed.
+
+    Topics published with `direct=True` (see `NexusPublisher.topic`) are received straight from their publishers on a second
+    socket, which is connected to each direct publisher advertising a subscribed topic. Direct publishers on the same host
+    with a shared memory ring are read from that ring instead, and their messages are always read-only memoryviews.
+
+    `transports` orders the transports the nexus may be reached over, see `NexusPublisher`.
     """
-    def __init__(self, ctx: zmq.Context=None, queue_size: int=MEDIUM):
+    def __init__(self, ctx: zmq.Context=None, queue_size: int=MEDIUM, zero_copy: bool=False, dispatch: Union[str, Dispatcher]='thread', workers: int=4,
+                 transports: tuple=TRANSPORTS):
         self.ctx = ctx if ctx else zmq.Context.instance()
         self.sub = self.ctx.socket(zmq.SUB)
         self.udp = starling.simpleudp.UDPBroadcaster(port=8899)
         self.poller = zmq.Poller()
         self.poller.register(self.sub, zmq.POLLIN)
-        self.poller.register(self.udp.sock, zmq.POLLIN)
-
-        self.nexus = {}
+        # The recv thread owns the sockets. Discovery (home nexus changes) and subscribe/unsubscribe (socket subscriptions) run
+        # on other threads, and hand their changes to it over this pair, as [kind, argument] messages (see `_control`)
+        home_addr = f"inproc://starling-home-{uuid.uuid4().hex}"
+        self.home_rx = self.ctx.socket(zmq.PAIR)
+        self.home_rx.bind(home_addr)
+        self.home_tx = self.ctx.socket(zmq.PAIR)
+        self.home_tx.connect(home_addr)
+        self.home_lock = threading.Lock() # home_tx is shared by the discovery thread and the callers of subscribe
+        self.poller.register(self.home_rx, zmq.POLLIN)
+        self.direct = self.ctx.socket(zmq.SUB)
+        self.poller.register(self.direct, zmq.POLLIN)
+        self.shm = self.ctx.socket(zmq.SUB) # Descriptors from direct publishers' shared memory rings on this host
+        self.poller.register(self.shm, zmq.POLLIN)
+        self.rings = ShmRings()
+        self.direct_peers = DirectPeers(shm=SHM_AVAILABLE)
+        self.sub.setsockopt_string(zmq.SUBSCRIBE, DIRECT_TOPIC)
+
+        self.tracker = NexusTracker(self.ctx, transports)
+        self.nexus = self.tracker.nexus # Every nexus heard from, only the home nexus (see `NexusTracker`) is connected to
+        self.endpoint = None
+        self.endpoints = [] # One per shard of the home nexus
         self.subscriptions = {}
-        self.wildcard_subs = [] # list of tuples (topic, regex) for wildcard subscriptions -> used to iterate through a smaller subset of subscriptions
-
-        self.myips = set(get_ips())
+        self.matcher = TopicMatcher() # Resolves a concrete topic to every subscription (exact or wildcard) that wants it
+        self.sequences = SequenceStats() # Gaps and latency of topics from publishers that send sequence headers
+        self.routes = {} # raw topic -> (topic, subscription infos), replaced whenever the subscriptions change
 
         self.running = True
         self.queue_size = queue_size
-        # kick off the recv loop thread, which will handle incoming messages and UDP broadcasts.
+        self.zero_copy = zero_copy
+        self.dispatcher = dispatch if isinstance(dispatch, Dispatcher) else make_dispatcher(dispatch, queue_size, workers)
+        # kick off the recv loop thread, which will handle incoming messages, and the discovery thread for UDP broadcasts.
         self.recv_thread = threading.Thread(target=self._recv_loop, daemon=True)
         self.recv_thread.start()
-
-        self.watchdog_thread = threading.Thread(target=self._watchdog_loop, daemon=True)
-        self.watchdog_thread.start()
+        self.discovery_thread = threading.Thread(target=self._discovery_loop, daemon=True)
+        self.discovery_thread.start()
 
         atexit.register(self.stop)
 
-    def _recv_loop(self):
-        """The main loop that listens for messages on the subscribed topics and UDP broadcasts from the nexus."""
+    def _discovery_loop(self):
+        """Listens for the nexus's UDP broadcasts and drops nexuses that go quiet, sending the recv thread the home nexus's
+        endpoints whenever they change."""
+        self.udp.sock.settimeout(0.5) # Allows for exit handlers to kill this thread
         while self.running:
-            socks = dict(self.poller.poll(500)) # Poll for events with a timeout of 500ms -> Allows for exit handlers to kill this thread
-            if self.sub in socks: # Check if there are messages on the subscriber socket
-                try:
-                    message = self.sub.recv_multipart(flags=zmq.NOBLOCK)
-                    if not message or len(message) != 2: continue  # Skip if the message is empty or malformed
-                    topic: str = message[0].decode('utf-8')
-                    data: bytes = message[1]
-
-                    if topic in self.subscriptions:
-                        try:
-                            assert data!=None, "Received None data from the publisher"
-                            self.subscriptions[topic]['queue'].put_nowait((data, topic))
-                        except queue.Full: pass
-
-                    for wc, regex in self.wildcard_subs:
-                        if regex.match(topic):
-                            try:
-                                assert data!=None, "Received None data from the publisher"
-                                self.subscriptions[wc]['queue'].put_nowait((data, topic))
-                            except queue.Full: pass
-                except zmq.Again:
-                    pass
-
-            if self.udp.sock.fileno() in socks: # Check if there are UDP broadcasts from the nexus
+            try:
                 message, addr = self.udp.recv()
-                pub_port, sub_port, nexus_id = message.split(' ')
-                # Check if we already know about this nexus
-                if nexus_id in self.nexus:
-                    self.nexus[nexus_id]['last_seen'] = time.monotonic()
-                    continue
-                self.nexus.update({nexus_id: {'addr': addr, 'sub_port': sub_port, 'pub_port': pub_port, 'last_seen': time.monotonic()}})
-                self._connect_to_nexus()
-
-    def _watchdog_loop(self):
-        """Infrequently checks for stale nexus entries and removes them."""
-        while self.running:
-            time.sleep(1)
-            current_time = time.monotonic()
-            for nexus_id, info in self.nexus.items():
-                if current_time - info['last_seen'] > NEXUS_TIMEOUT:
-                    del self.nexus[nexus_id]
-
-    def _connect_to_nexus(self):
-        for nexus_id in self.nexus:
-            addr = self.nexus[nexus_id]['addr']
-            con_addr = LOCALHOST if addr[0] in self.myips else addr[0]
-            self.sub.connect(f"tcp://{con_addr}:{self.nexus[nexus_id]['pub_port']}")
-
-    def _topic_listen(self, topic: str):
-        """Thread function to handle messages for a specific topic via a callback"""
-        cb: callable = self.subscriptions[topic]['cb']
-        q: Queue = self.subscriptions[topic]['queue']
-        while self.running:
-            msg, recv_topic = q.get()
-            if msg is None: return  # Exit if None is put in the queue
-            cb(msg, recv_topic)
+                changed = self.tracker.heard(message, addr)
+            except socket.timeout:
+                changed = False
+            except OSError:
+                break
+            if self.tracker.expire() or changed:
+                self._control(b"home", " ".join(self.tracker.endpoints('pub_port')))
+
+    def _control(self, kind: bytes, argument: str):
+        """Hand a change to the recv thread: b"home" with the home nexus's endpoints, or b"sub"/b"unsub" with a zmq topic."""
+        with self.home_lock:
+            self.home_tx.send_multipart([kind, argument.encode('utf-8')])
+
+    def _apply_control(self):
+        """Apply a change sent by `_control`, on the recv thread."""
+        kind, argument = self.home_rx.recv_multipart()
+        if kind == b"home":
+            self._connect_to_nexus(argument.decode('utf-8').split())
+        else:
+            option = zmq.SUBSCRIBE if kind == b"sub" else zmq.UNSUBSCRIBE
+            for sock in (self.sub, self.direct, self.shm):
+                sock.setsockopt(option, argument)
 
-    def subscribe(self, topic: str, callback: callable):
+    def _recv_loop(self):
+        """The main loop that listens for messages on the subscribed topics, from the nexus and direct publishers."""
+        poll = self.poller.poll
+        while self.running:
+            for sock, _ in poll(500): # Poll for events with a timeout of 500ms -> Allows for exit handlers to kill this thread
+                if sock is self.home_rx:
+                    self._apply_control()
+                else:
+                    self._receive(sock)
+            for peer in self.direct_peers.expire():
+                if peer['shm']:
+                    self.shm.disconnect(peer['endpoint'])
+                    self.rings.detach(peer['shm'])
+                else:
+                    self.direct.disconnect(peer['endpoint'])
+
+    def _receive(self, sock: zmq.Socket):
+        """Drain up to BURST messages from a socket without blocking. Raw topics are resolved through `routes`, so a
+        repeated topic costs one dict lookup, without decoding it or taking the matcher's lock."""
+        recv = sock.recv_multipart
+        copy = not self.zero_copy
+        put = self.dispatcher.put
+        from_sub, from_shm = sock is self.sub, sock is self.shm
+        for _ in range(BURST):
+            try:
+                message = recv(zmq.NOBLOCK, copy=copy)
+            except zmq.Again:
+                return
+            frames = len(message)
+            if frames != 2 and frames != 3: continue  # Skip if the message is empty or malformed
+            # [topic, payload], or [topic, sequence header, payload] from a sequencing publisher
+            if copy:
+                raw_topic, data = message[0], message[-1]
+            else:
+                raw_topic: bytes = message[0].bytes
+                data: memoryview = message[-1].buffer
+            if from_shm:
+                data = self.rings.view(data)
+            elif from_sub and raw_topic == DIRECT_RAW:
+                self._direct_advertised(data)
+            route = self.routes.get(raw_topic)
+            if route is None:
+                route = self._route(raw_topic)
+            topic, infos = route
+            if frames == 3:
+                self._dispatch_sequenced(topic, message[1], data, infos)
+                continue
+            if data is None: continue # Overwritten in shared memory before we got to it
+
+            for info in infos:
+                info['received'] += 1
+                if info['latest'] is not None:
+                    info['latest'][topic] = data
+                if info['cb'] is not None:
+                    put(info, data, topic)
+
+    def _route(self, raw_topic: bytes) -> tuple:
+        """Resolve a raw topic to its decoded name and the infos of every subscription matching it, and cache that."""
+        routes = self.routes # Taken first, a route resolved while the subscriptions change then lands in the discarded cache
+        topic, sub_topics = self.matcher.resolve(raw_topic)
+        infos = [info for info in map(self.subscriptions.get, sub_topics) if info is not None]
+        if len(routes) >= ROUTE_CACHE_SIZE:
+            routes.clear()
+        route = routes[raw_topic] = (topic, infos)
+        return route
+
+    def _dispatch_sequenced(self, topic: str, header, data, infos: list):
+        """Dispatch a message that came with a sequence header, accounting for it in `sequences` and counting the drops."""
+        sequenced = self.sequences.add(topic, header)
+        if data is None: return
+        for info in infos:
+            info['received'] += 1
+            if info['latest'] is not None:
+                info['latest'][topic] = data
+            dropped = info['dropped']
+            if info['cb'] is not None:
+                self.dispatcher.put(info, data, topic)
+            if sequenced is not None:
+                info['sequenced'][topic] = info['sequenced'].get(topic, 0) + info['dropped'] - dropped
+
+    def _direct_advertised(self, data):
+        peer = self.direct_peers.heard(data, self.matcher)
+        if peer is None: return
+        if not peer['shm']:
+            self.direct.connect(peer['endpoint'])
+            return
+        try:
+            self.rings.attach(peer['shm'])
+        except FileNotFoundError: # Already gone, the publisher is shutting down
+            peer['connected'] = False
+            return
+        self.shm.connect(peer['endpoint'])
+
+    def _connect_to_nexus(self, endpoints: List[str]):
+        """Move the connection over to the home nexus's `endpoints`, if they have changed."""
+        if endpoints == self.endpoints: return
+        for endpoint in self.endpoints:
+            self.sub.disconnect(endpoint)
+        for endpoint in endpoints: # Every shard of a sharded nexus
+            self.sub.connect(endpoint)
+        self.endpoints = endpoints
+        self.endpoint = endpoints[0] if endpoints else None
+
+    def subscribe(self, topic: str, callback: callable=None, conflate: bool=False, schema: type=None, batch: Union[bool, int]=False,
+                  dtype=None):
+        """Subscribe to a topic (wildcards allowed), calling `callback(msg, topic)` for every message received on it.
+
+        With `conflate=True` only the newest message per concrete topic is kept. A callback that falls behind skips the stale
+        messages and is always handed the latest one, and `latest(topic)` returns the newest message without needing a callback
+        at all (`callback` may then be None).
+
+        With a `schema` (a msgspec Struct, see `starling.schema`), messages are msgpack decoded into it on the callback's
+        thread and the callback receives the Struct. `latest` still returns raw messages.
+
+        With `batch` (True, or the max batch size) the callback is called as `callback(msgs, topics)` with every message
+        queued for the subscription, so bursts cost one Python call instead of one per message. A `schema` then decodes the
+        whole batch in one call into a list of Structs, and a NumPy `dtype` turns it into a structured array instead.
+        """
         if not validate_topic(topic):
             err_msg = f"Invalid topic name: {topic}, please ensure it does not start or end with a '.', doesn't contain consecutive '.' characters, and does not contain wildcards in invalid contexts."
             raise ValueError(err_msg)
+        if callback is None and not conflate:
+            raise ValueError(f"A callback is required for topic {topic}, unless subscribing with conflate=True and polling latest()")
+        if batch and conflate:
+            raise ValueError("A subscription can't both batch and conflate")
+        batch = MAX_BATCH if batch is True else int(batch)
+        if batch and callback is not None and (schema is not None or dtype is not None):
+            callback = starling.schema.BatchCallback(callback, schema, dtype)
+        elif schema is not None and callback is not None:
+            callback = starling.schema.TypedCallback(callback, schema)
 
-        q = Queue(maxsize=self.queue_size)
-        t = threading.Thread(target=self._topic_listen, args=(topic,), daemon=True)
         if ('*' in topic) or ('#' in topic):
-            r = to_regex(topic)
             # Subscribe to the topic, making sure to subscribe to the highest level namespace before the wildcard
             first_single_wildcard = topic.find('*')
             first_multi_wildcard = topic.find('#')
@@ -162,34 +301,67 @@ class NexusSubscriber():
                 print("Specially subscribing to all topics for wildcard subscription")
                 zmq_topic = ''
         else:
-            r = None
             zmq_topic = topic
 
-        self.sub.setsockopt_string(zmq.SUBSCRIBE, zmq_topic)
-        subscription_info = {'cb': callback, 'queue': q, 'thread': t, 'regex': r}
+        self._control(b"sub", zmq_topic)
+        subscription_info = {'cb': callback, 'zmq_topic': zmq_topic, 'received': 0, 'dropped': 0, 'conflated': 0,
+                             'latest': {} if conflate else None, 'batch': batch,
+                             'sequenced': {}} # sequenced topic -> messages of it dropped by this subscription
+        if conflate:
+            subscription_info.update({'mailbox': {}, 'lock': threading.Lock()})
+        if callback is not None:
+            self.dispatcher.add(subscription_info)
         self.subscriptions[topic] = subscription_info
-        if r is not None:
-            self.wildcard_subs.append((topic, r))
-        t.start()
+        self.matcher.add(topic)
+        self.routes = {}
 
     def unsubscribe(self, topic: str):
         if topic in self.subscriptions:
-            self.sub.setsockopt_string(zmq.UNSUBSCRIBE, topic)
-            self.subscriptions[topic]['queue'].put((None, None))
-            self.subscriptions[topic]['thread'].join()
+            self.matcher.remove(topic)
+            self._control(b"unsub", self.subscriptions[topic]['zmq_topic'])
+            if self.subscriptions[topic]['cb'] is not None:
+                self.dispatcher.remove(self.subscriptions[topic])
             del self.subscriptions[topic]
-            for wc, regex in self.wildcard_subs:
-                if wc == topic:
-                    self.wildcard_subs.remove((wc, regex))
-                    break
+            self.routes = {}
+
+    def latest(self, topic: str, default=None):
+        """The newest message received on a concrete topic, from any conflating subscription matching it, or `default`."""
+        for sub_topic in self.matcher.match(topic):
+            info = self.subscriptions.get(sub_topic)
+            if info is not None and info['latest'] is not None and topic in info['latest']:
+                return info['latest'][topic]
+        return default
+
+    def stats(self) -> dict:
+        """Per subscription dispatch counters: messages matched ('received'), messages waiting for the callback ('queued'),
+        messages dropped because the subscription's queue was full ('dropped') and, for conflating subscriptions, messages
+        replaced by a newer one before the callback got to them ('conflated').
+
+        Topics from publishers that send sequence headers (`NexusPublisher(sequence=True)`) are also listed under
+        'topics': messages received, gaps in the sequence and the messages 'lost' before reaching this process (e.g. at a
+        full nexus queue), the messages the subscription 'dropped', and percentiles of the one-way latency in microseconds."""
+        stats = {}
+        for sub_topic, info in list(self.subscriptions.items()):
+            stats[sub_topic] = {'received': info['received'], 'queued': self.dispatcher.depth(info), 'dropped': info['dropped'],
+                                'conflated': info['conflated']}
+            if info['sequenced']:
+                stats[sub_topic]['topics'] = {topic: dict(self.sequences.summary(topic), dropped=dropped)
+                                              for topic, dropped in list(info['sequenced'].items())}
+        return stats
 
     def stop(self):
         for topic in list(self.subscriptions.keys()):
             self.unsubscribe(topic)
         self.running = False
         self.recv_thread.join()
-        # self.watchdog_thread.join()
+        self.discovery_thread.join()
+        self.dispatcher.stop()
+        self.home_tx.close()
+        self.home_rx.close()
         self.sub.close()
+        self.direct.close()
+        self.shm.close()
+        self.rings.close()
         self.udp.sock.close()
         # self.ctx.term()
 
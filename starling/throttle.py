@@ -1,55 +1,90 @@
 from starling.subscription import NexusSubscriber
 from starling.publication import NexusPublisher
+from starling.rate import Rate
 from threading import Thread, Event
 import atexit
 import time
 
 class NexusThrottle:
-    def __init__(self, topic_in: str, topic_out: str, rate_out: float):
-        raise NotImplementedError("NexusThrottle is not yet implemented.")
-        self.sub = NexusSubscriber(topic_in)
-        self.sub.subscribe(topic_in, self.set_latest_msg)
-        self.pub = NexusPublisher(topic_out)
+    def __init__(self, topic_in: str, topic_out: str, rate_out: float, skip_duplicates: bool=False):
+        """Republishes messages from `topic_in` at (most) `rate_out` Hz for every concrete topic it matches. Only the newest message
+        per topic is kept between ticks, so a high rate stream is downsampled without queueing up stale messages.
+
+        An exact `topic_in` is republished on `topic_out`. A wildcard `topic_in` is republished per concrete topic under the
+        `topic_out` namespace, i.e. `imu.thigh.data` heard on `imu.#` is sent on `{topic_out}.imu.thigh.data`.
+
+        Args:
+            topic_in (str): The topic to throttle, wildcards allowed.
+            topic_out (str): The output topic, or output namespace for wildcard inputs.
+            rate_out (float): Rate (Hz) to republish at.
+            skip_duplicates (bool, optional): Only republish a topic when a new message arrived since the last tick, rather than
+                repeating the latest one when the input is slower than `rate_out`. Defaults to False.
+        """
+        self.topic_in = topic_in
+        self.topic_out = topic_out
+        self.wildcard = ('*' in topic_in) or ('#' in topic_in)
+        self.skip_duplicates = skip_duplicates
         self.rate_out = rate_out
-        self.timer = TimedLoop(rate_out)
         self.latest_msgs = {}
+        self.out_topics = {} # concrete input topic -> pre-validated output topic handle
         self.thread = None
         self.stop_event = Event()
+        self.pub = NexusPublisher()
+        # Callbacks only store the message, so run them on the recv thread rather than paying for a queue and a thread
+        self.sub = NexusSubscriber(dispatch='inline')
+        self.sub.subscribe(topic_in, self.set_latest_msg)
         atexit.register(self.stop)
 
     def set_latest_msg(self, msg, topic):
+        if topic == self.topic_out or topic.startswith(self.topic_out + '.'):
+            return # Our own output, matched by a wildcard input
         self.latest_msgs[topic] = msg
 
+    def _out_topic(self, topic: str):
+        handle = self.out_topics.get(topic)
+        if handle is None:
+            handle = self.out_topics[topic] = self.pub.topic(f"{self.topic_out}.{topic}" if self.wildcard else self.topic_out)
+        return handle
+
     def start(self):
-        self.thread = Thread(target=self.loop)
+        self.thread = Thread(target=self.loop, daemon=True)
         self.thread.start()
 
     def stop(self):
         self.stop_event.set()
         if self.thread:
             self.thread.join()
+            self.thread = None
+        self.sub.stop()
+        self.pub.stop()
 
     def loop(self):
-        while self.timer.sleep() and not self.stop_event.is_set():
-            for topic, msg in self.latest_msgs.items():
-                self.pub.send(topic, msg)
+        timer = Rate(self.rate_out, verbose=False)
+        while not self.stop_event.is_set():
+            for topic in list(self.latest_msgs):
+                # Taking the message out means it's only sent once, a newer one arriving meanwhile is kept for the next tick
+                msg = self.latest_msgs.pop(topic, None) if self.skip_duplicates else self.latest_msgs.get(topic)
+                if msg is not None:
+                    self._out_topic(topic).send(msg)
+            timer.sleep()
 
 
 def _main():
     from argparse import ArgumentParser
-    parser = ArgumentParser(description="Throttle messages from one Nexus topic to another at a specified rate. If the specified rate is higher than the incoming message rate, messages will result in duplicates.")
-    parser.add_argument("topic_in", type=str, help="Input topic to subscribe to.")
-    parser.add_argument("topic_out", type=str, help="Output topic to publish to.")
+    parser = ArgumentParser(description="Throttle messages from one Nexus topic to another at a specified rate. Wildcard input topics are throttled per concrete topic, and republished under the output topic as a prefix. If the specified rate is higher than the incoming message rate, messages will result in duplicates unless --skip-duplicates is given.")
+    parser.add_argument("topic_in", type=str, help="Input topic to subscribe to, wildcards allowed.")
+    parser.add_argument("topic_out", type=str, help="Output topic to publish to (the output prefix for wildcard inputs).")
     parser.add_argument("--rate_out", type=float, default=10.0, help="Rate (Hz) to publish messages to the output topic.")
+    parser.add_argument("--skip-duplicates", action="store_true", help="Only republish a topic when a new message has arrived since the last publish.")
     args = parser.parse_args()
 
     print(f"Throttling messages from '{args.topic_in}' to '{args.topic_out}' at {args.rate_out} Hz.")
 
-    throttle = NexusThrottle(args.topic_in, args.topic_out, args.rate_out)
+    throttle = NexusThrottle(args.topic_in, args.topic_out, args.rate_out, skip_duplicates=args.skip_duplicates)
     throttle.start()
     while True:
         try:
             time.sleep(1)
         except KeyboardInterrupt:
             break
-    throttle.stop()
\ No newline at end of file
+    throttle.stop()
@@ -0,0 +1,74 @@
+# One-way latency from publisher to a coroutine: the threaded NexusPublisher/NexusSubscriber handing messages into an event loop
+# (the pattern asyncio applications have to use today), against AsyncNexusPublisher/AsyncNexusSubscriber.
+# Requires starling to be importable (pip install -e .). A nexus is started for the duration of the benchmark.
+import asyncio
+import struct
+import subprocess
+import sys
+import time
+import numpy as np
+from starling import NexusPublisher, NexusSubscriber, AsyncNexusPublisher, AsyncNexusSubscriber
+
+COUNT = 5_000
+RATE = 1_000 # Hz
+DISCOVERY_WAIT = 2.5
+STAMP = struct.Struct('<q')
+
+def report(name, latencies_ns):
+    lat = np.asarray(latencies_ns) / 1e3
+    print(f"{name:10} | n={len(lat):>5} | p50 {np.percentile(lat, 50):8.1f} us | p99 {np.percentile(lat, 99):8.1f} us | "
+          f"p99.9 {np.percentile(lat, 99.9):8.1f} us | max {lat.max():8.1f} us")
+
+async def threaded():
+    loop = asyncio.get_running_loop()
+    inbox = asyncio.Queue()
+    sub = NexusSubscriber()
+    sub.subscribe("bench.latency.threaded", lambda msg, topic: loop.call_soon_threadsafe(inbox.put_nowait, msg))
+    pub = NexusPublisher()
+    await asyncio.sleep(DISCOVERY_WAIT)
+
+    async def consume():
+        latencies = []
+        while len(latencies) < COUNT:
+            msg = await inbox.get()
+            latencies.append(time.perf_counter_ns() - STAMP.unpack(msg)[0])
+        return latencies
+    consumer = asyncio.create_task(consume())
+    for _ in range(COUNT):
+        pub.send("bench.latency.threaded", STAMP.pack(time.perf_counter_ns()))
+        await asyncio.sleep(1 / RATE)
+    latencies = await asyncio.wait_for(consumer, timeout=10)
+    sub.stop()
+    pub.stop()
+    return latencies
+
+async def native():
+    sub = AsyncNexusSubscriber()
+    pub = AsyncNexusPublisher()
+    await asyncio.sleep(DISCOVERY_WAIT)
+
+    async def consume():
+        latencies = []
+        async for msg, topic in sub.stream("bench.latency.async"):
+            latencies.append(time.perf_counter_ns() - STAMP.unpack(msg)[0])
+            if len(latencies) == COUNT: break
+        return latencies
+    consumer = asyncio.create_task(consume())
+    await asyncio.sleep(0.5) # Let the stream's subscription reach the nexus
+    for _ in range(COUNT):
+        await pub.send("bench.latency.async", STAMP.pack(time.perf_counter_ns()))
+        await asyncio.sleep(1 / RATE)
+    latencies = await asyncio.wait_for(consumer, timeout=10)
+    sub.close()
+    pub.close()
+    return latencies
+
+
+if __name__ == "__main__":
+    nexus = subprocess.Popen([sys.executable, "-c", "from starling.nexus import _main; _main()"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        report("threaded", asyncio.run(threaded()))
+        report("asyncio", asyncio.run(native()))
+    finally:
+        nexus.terminate()
+        nexus.wait()
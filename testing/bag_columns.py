@@ -0,0 +1,48 @@
+# Pulling one signal out of a recording: bag.Reader.columns (mmap + batched typed decode) against parsing every line of
+# the equivalent gzipped JSON lines snapshot in Python.
+# Requires starling to be importable (pip install -e .).
+import gzip
+import json
+import os
+import tempfile
+import time
+import msgspec
+import numpy as np
+from starling import bag
+
+MSGCNT = 1_000_000
+TOPICS = ["imu.thigh.data", "imu.shank.data", "emg.data"]
+
+def message(i):
+    return {"ts": i / 1000, "acc": {"x": float(i), "y": 0.5, "z": 9.81}, "gyro": [0.1, 0.2, 0.3], "status": "ok"}
+
+if __name__ == "__main__":
+    tmp = tempfile.mkdtemp()
+    bag_name = os.path.join(tmp, "bench.bag")
+    jsonl_name = os.path.join(tmp, "bench.jsonl.gz")
+    encode = msgspec.json.encode
+    with bag.Writer(bag_name, codec="zstd") as writer, gzip.open(jsonl_name, "wb", compresslevel=6) as jsonl:
+        for i in range(MSGCNT):
+            payload = encode(message(i))
+            writer.write(TOPICS[i % len(TOPICS)], payload, 10**18 + i * 10**6)
+            if i % len(TOPICS) == 0: # The snapshot only holds the one topic
+                jsonl.write(payload + b"\n")
+    print(f"{MSGCNT} messages, bag {os.path.getsize(bag_name) / 1e6:.1f} MB, jsonl.gz {os.path.getsize(jsonl_name) / 1e6:.1f} MB")
+
+    start = time.perf_counter()
+    with bag.Reader(bag_name) as reader:
+        columns = reader.columns(["ts", "acc.x"], topics=[TOPICS[0]])
+    elapsed = time.perf_counter() - start
+    print(f"bag.Reader.columns     | {len(columns['ts'])} rows | {elapsed:6.2f} s")
+
+    start = time.perf_counter()
+    ts, acc_x = [], []
+    with gzip.open(jsonl_name, "rb") as jsonl:
+        for line in jsonl:
+            msg = json.loads(line)
+            ts.append(msg["ts"])
+            acc_x.append(msg["acc"]["x"])
+    ts, acc_x = np.array(ts), np.array(acc_x)
+    elapsed = time.perf_counter() - start
+    print(f"gzip + json.loads      | {len(ts)} rows | {elapsed:6.2f} s")
+    assert np.array_equal(ts, columns["ts"]) and np.array_equal(acc_x, columns["acc.x"])
@@ -0,0 +1,62 @@
+# Draining a backlog of typed IMU messages from a subscription's queue on its callback thread (starling.dispatch.ThreadDispatcher,
+# as used by NexusSubscriber), handled one message per callback against batching subscriptions that get everything queued
+# in one callback: decoded into a list of Structs in one call, or as a NumPy structured array of fixed layout records.
+# Requires starling to be importable (pip install -e .).
+import threading
+import time
+import msgspec
+import numpy as np
+from starling import schema
+from starling.dispatch import ThreadDispatcher
+
+MSGCNT = 200_000
+
+class Imu(msgspec.Struct):
+    ts: float
+    acc: list
+    gyro: list
+    idx: int
+
+DTYPE = np.dtype([("ts", "<f8"), ("acc", "<f8", 3), ("gyro", "<f8", 3), ("idx", "<i8")])
+
+def run(name, msgs, callback, batch=0):
+    # The callback thread is held up until every message is queued, so only the draining side is timed
+    done, gate = threading.Event(), threading.Event()
+    seen = [0]
+    def counted(msg, topic):
+        gate.wait()
+        callback(msg, topic)
+        seen[0] += len(topic) if batch else 1
+        if seen[0] == MSGCNT: done.set()
+    dispatcher = ThreadDispatcher(queue_size=MSGCNT + 1)
+    info = {'cb': counted, 'dropped': 0, 'batch': batch}
+    dispatcher.add(info)
+    dispatcher.put(info, msgs[0], "imu.thigh")
+    time.sleep(0.1)
+    for msg in msgs[1:]:
+        dispatcher.put(info, msg, "imu.thigh")
+    start = time.perf_counter()
+    gate.set()
+    done.wait()
+    elapsed = time.perf_counter() - start
+    dispatcher.remove(info)
+    print(f"{name:28} | {MSGCNT / elapsed:10.0f} msgs/s | {elapsed / MSGCNT * 1e9:6.0f} ns/msg")
+
+if __name__ == "__main__":
+    msgs = [schema.ENCODER.encode(Imu(ts=i / 1000, acc=[0.1, 0.2, 9.81], gyro=[0.0, 0.1, 0.2], idx=i)) for i in range(MSGCNT)]
+    records = [np.array([(i / 1000, (0.1, 0.2, 9.81), (0.0, 0.1, 0.2), i)], dtype=DTYPE).tobytes() for i in range(MSGCNT)]
+    decode = schema.decoder(Imu).decode
+    assert schema.decode_batch(msgs[:1000], Imu) == [decode(m) for m in msgs[:1000]]
+
+    total = [0.0]
+    def per_message(msg, topic):
+        total[0] += decode(msg).acc[2]
+    def per_batch(imus, topics):
+        for imu in imus:
+            total[0] += imu.acc[2]
+    def per_array(array, topics):
+        total[0] += array["acc"][:, 2].sum()
+
+    run("per message", msgs, per_message)
+    run("batch of Structs", msgs, schema.BatchCallback(per_batch, schema=Imu), batch=1000)
+    run("batch as structured array", records, schema.BatchCallback(per_array, dtype=DTYPE), batch=1000)
@@ -0,0 +1,36 @@
+# Wake-up jitter of a 1 kHz loop: the compiled clock_nanosleep Rate, its pure Python fallback, and a naive time.sleep(period) loop.
+# Requires starling to be importable (pip install -e ., which builds starling._rate where possible).
+import time
+import numpy as np
+from starling.rate import Rate, PyRate, COMPILED
+
+RATE = 1_000 # Hz
+ITERCNT = 5_000
+PERIOD = 1 / RATE
+
+def measure(sleep):
+    """Wake-up times relative to the ideal schedule, in microseconds"""
+    stamps = np.empty(ITERCNT, dtype=np.int64)
+    for i in range(ITERCNT):
+        sleep()
+        stamps[i] = time.monotonic_ns()
+    periods = np.diff(stamps) / 1e3
+    return periods - PERIOD * 1e6
+
+def report(name, errors, stats=None):
+    abs_err = np.abs(errors)
+    line = (f"{name:16} | mean period error {errors.mean():8.2f} us | jitter (std) {errors.std():8.2f} us | "
+            f"p99 |err| {np.percentile(abs_err, 99):8.2f} us | max |err| {abs_err.max():9.2f} us")
+    if stats is not None:
+        line += f" | missed {stats['missed']} | max lateness {stats['max_lateness'] * 1e6:8.2f} us"
+    print(line)
+
+if __name__ == "__main__":
+    if COMPILED:
+        rate = Rate(RATE, verbose=False)
+        report("Rate (compiled)", measure(rate.sleep), rate.stats())
+    else:
+        print("starling._rate is not compiled, skipping the compiled Rate")
+    pyrate = PyRate(RATE, verbose=False)
+    report("PyRate", measure(pyrate.sleep), pyrate.stats())
+    report("time.sleep", measure(lambda: time.sleep(PERIOD)))
@@ -0,0 +1,72 @@
+# Receive throughput of a single NexusSubscriber on one topic of small messages, for each dispatch mode. A publisher process
+# floods the topic through a nexus process (both with unlimited HWMs, so nothing is dropped before the subscriber), and
+# the rate is taken between the first and last message received. With inline dispatch the callbacks run on the receive
+# thread, so its CPU time over the run gives the rate the receive loop alone can sustain on one core, whatever the publisher
+# and nexus are taking from the machine. That capacity should be at least TARGET msgs/s on a desktop class CPU.
+# Requires starling to be importable (pip install -e .). A nexus is started for the duration of the benchmark.
+import subprocess
+import sys
+import threading
+import time
+from starling import NexusSubscriber
+
+MSGCNT = 1_000_000
+PAYLOAD = 64
+TARGET = 250_000 # msgs/s, of receive loop capacity
+DISCOVERY_WAIT = 2.5
+PUBLISHER = f"""
+import time
+from starling import NexusPublisher
+pub = NexusPublisher()
+pub.pub.sndhwm = 0
+time.sleep({DISCOVERY_WAIT})
+topic, payload = pub.topic("bench.rx"), bytes({PAYLOAD})
+for _ in range({MSGCNT} // 1000):
+    pub.send_many([(topic, payload)] * 1000)
+time.sleep(5)
+"""
+
+def run(dispatch: str):
+    received = 0
+    done = threading.Event()
+    first = last = first_cpu = last_cpu = 0.0
+
+    def cb(msg, topic):
+        nonlocal received, first, last, first_cpu, last_cpu
+        if received == 0:
+            first, first_cpu = time.perf_counter(), time.thread_time()
+        received += 1
+        if received == MSGCNT:
+            last, last_cpu = time.perf_counter(), time.thread_time()
+            done.set()
+
+    sub = NexusSubscriber(dispatch=dispatch, queue_size=MSGCNT)
+    sub.sub.rcvhwm = 0 # Before discovery connects it to the nexus
+    sub.subscribe("bench.rx", cb)
+    publisher = subprocess.Popen([sys.executable, "-c", PUBLISHER])
+    deadline = time.monotonic() + 10
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.1)
+    seen = -1
+    while not done.wait(timeout=1.0) and seen != received: # Stop once the stream goes quiet, if messages were lost
+        seen = received
+        last = time.perf_counter() - 1.0
+    publisher.terminate()
+    publisher.wait()
+    sub.stop()
+    elapsed, cpu = last - first, last_cpu - first_cpu
+    return (received - 1) / elapsed if elapsed > 0 else 0.0, (received - 1) / cpu if cpu > 0 else 0.0, MSGCNT - received
+
+
+if __name__ == "__main__":
+    nexus = subprocess.Popen([sys.executable, "-c", "from starling.nexus import _main; _main()", "--hwm", "0", "--stats-interval", "0"],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(DISCOVERY_WAIT)
+        for dispatch in ("inline", "thread", "pool"):
+            rate, capacity, lost = run(dispatch)
+            capacity = f"{capacity:>10.0f} msgs/s" if dispatch == "inline" else f"{'-':>17}"
+            print(f"{dispatch:6} | {rate:>10.0f} msgs/s | receive loop capacity {capacity} (target {TARGET}) | {PAYLOAD} B | {lost} lost")
+    finally:
+        nexus.terminate()
+        nexus.wait()
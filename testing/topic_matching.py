@@ -0,0 +1,52 @@
+# Compares per-message dispatch cost of the old regex scan (one to_regex per wildcard subscription) against the TopicMatcher trie.
+# Requires starling to be importable (pip install -e .), then: python testing/topic_matching.py
+import time
+import random
+from starling.subscription import to_regex
+from starling.matching import TopicMatcher
+
+ITERCNT = 200_000
+TOPIC_COUNT = 200
+random.seed(0)
+
+NAMES = ['imu', 'thigh', 'shank', 'foot', 'data', 'raw', 'filtered', 'motor', 'left', 'right', 'camera', 'depth']
+
+def random_topic(depth):
+    return '.'.join(random.choice(NAMES) for _ in range(depth))
+
+def random_wildcard():
+    segs = [random.choice(NAMES) for _ in range(random.randint(2, 4))]
+    segs[random.randrange(len(segs))] = random.choice(['*', '#'])
+    return '.'.join(segs)
+
+topics = [random_topic(random.randint(2, 4)) for _ in range(TOPIC_COUNT)]
+stream = [random.choice(topics) for _ in range(ITERCNT)]
+
+for wildcard_count in (1, 10, 50, 100, 500):
+    wildcards = list({random_wildcard() for _ in range(wildcard_count)})
+    exact = {t: None for t in topics[:TOPIC_COUNT // 2]}
+
+    # Regex scan, as done by the previous NexusSubscriber._recv_loop
+    regexes = [(wc, to_regex(wc)) for wc in wildcards]
+    t0 = time.perf_counter()
+    hits = 0
+    for topic in stream:
+        if topic in exact:
+            hits += 1
+        for wc, regex in regexes:
+            if regex.match(topic):
+                hits += 1
+    t1 = time.perf_counter()
+    regex_rate = ITERCNT / (t1 - t0)
+
+    matcher = TopicMatcher()
+    for sub in [*exact, *wildcards]:
+        matcher.add(sub)
+    t0 = time.perf_counter()
+    trie_hits = 0
+    for topic in stream:
+        trie_hits += len(matcher.match(topic))
+    t1 = time.perf_counter()
+    trie_rate = ITERCNT / (t1 - t0)
+
+    print(f"{len(wildcards):>4} wildcards | regex: {regex_rate:>12.2f} msgs/sec | trie: {trie_rate:>12.2f} msgs/sec | speedup: {trie_rate / regex_rate:6.2f}x | hits {hits}/{trie_hits}")
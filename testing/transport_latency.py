@@ -0,0 +1,50 @@
+# One-way latency through the nexus over each transport a client can reach it with: inproc (nexus in the same process and
+# context), ipc (same host) and tcp. The nexus runs inside this process so inproc is available, and each message is only
+# sent once the previous one has arrived, so the numbers are unloaded latency rather than throughput.
+# Requires starling to be importable (pip install -e .).
+import os
+import time
+import numpy as np
+from starling.nexus import StarlingNexus
+from starling.publication import NexusPublisher
+from starling.subscription import NexusSubscriber
+
+MSGCNT = 5_000
+PAYLOADS = [64, 65536]
+TRANSPORTS = ["inproc", "ipc", "tcp"]
+
+def measure(transport, payload):
+    sub = NexusSubscriber(dispatch="inline", transports=(transport,))
+    pub = NexusPublisher(transports=(transport,))
+    arrivals = []
+    sub.subscribe("latency", lambda msg, topic: arrivals.append(time.perf_counter_ns()))
+    while not (sub.endpoint and pub.endpoint):
+        time.sleep(0.1)
+    message = bytes(payload)
+    while not arrivals: # Until the subscription has reached the publisher
+        pub.send("latency", message)
+        time.sleep(0.05)
+    time.sleep(0.2)
+    arrivals.clear()
+    latencies = np.empty(MSGCNT)
+    for i in range(MSGCNT):
+        start = time.perf_counter_ns()
+        pub.send("latency", message)
+        while len(arrivals) <= i:
+            time.sleep(0) # Spin, but let the subscriber's receive thread have the GIL
+        latencies[i] = (arrivals[i] - start) / 1e3
+    endpoint = sub.endpoint
+    pub.stop()
+    sub.stop()
+    return endpoint, latencies
+
+if __name__ == "__main__":
+    nexus = StarlingNexus(stats_interval=0, ipc=True)
+    nexus.start()
+    for payload in PAYLOADS:
+        for transport in TRANSPORTS:
+            endpoint, latencies = measure(transport, payload)
+            p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9])
+            print(f"{transport:6} | {payload:6d} B | p50 {p50:7.1f} us | p99 {p99:7.1f} us | p99.9 {p999:7.1f} us | {endpoint}")
+    nexus.stop()
+    os._exit(0)
@@ -0,0 +1,55 @@
+# Receive throughput of NexusSubscriber with and without zero_copy, sweeping payload sizes from 1 KB to 16 MB.
+# Requires starling to be importable (pip install -e .). A nexus is started for the duration of the benchmark.
+import os
+import subprocess
+import sys
+import threading
+import time
+from starling import NexusPublisher, NexusSubscriber
+
+SIZES = [1 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20]
+BYTES_PER_RUN = 512 << 20
+DISCOVERY_WAIT = 2.5
+
+def run(publisher: NexusPublisher, size: int, zero_copy: bool):
+    count = max(200, min(20_000, BYTES_PER_RUN // size))
+    payload = os.urandom(size)
+    received = 0
+    done = threading.Event()
+    first = last = 0.0
+
+    def cb(msg, topic):
+        nonlocal received, first, last
+        if received == 0: first = time.perf_counter()
+        received += 1
+        len(msg) # Touch the payload the way a real callback would
+        last = time.perf_counter()
+        if received == count: done.set()
+
+    sub = NexusSubscriber(zero_copy=zero_copy)
+    sub.subscribe(f"bench.zerocopy.{size}", cb)
+    time.sleep(DISCOVERY_WAIT)
+    for _ in range(count):
+        publisher.send(f"bench.zerocopy.{size}", payload)
+    # Messages dropped at the HWM or a full queue never arrive, so stop once the stream goes quiet
+    seen = -1
+    while not done.wait(timeout=1.0) and seen != received:
+        seen = received
+    sub.stop()
+    elapsed = last - first
+    rate = (received - 1) / elapsed if elapsed > 0 else 0.0
+    return rate, rate * size / 1e6, count - received
+
+
+if __name__ == "__main__":
+    nexus = subprocess.Popen([sys.executable, "-c", "from starling.nexus import _main; _main()"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        publisher = NexusPublisher()
+        time.sleep(DISCOVERY_WAIT)
+        for size in SIZES:
+            for zero_copy in (False, True):
+                rate, mbps, lost = run(publisher, size, zero_copy)
+                print(f"{size // 1024:>6} KB | zero_copy={zero_copy!s:5} | {rate:>10.2f} msgs/sec | {mbps:>9.2f} MB/sec | {lost} lost")
+    finally:
+        nexus.terminate()
+        nexus.wait()
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from starling.aio import AsyncNexusPublisher, AsyncNexusSubscriber
+
+
+def test_callback_errors_dont_end_the_subscription(capsys):
+    async def main():
+        sub = AsyncNexusSubscriber()
+        got = []
+        async def callback(msg, topic):
+            if msg == b"bad": raise RuntimeError("callback failed")
+            got.append(msg)
+        sub.subscribe("imu.a", callback)
+        sink = sub.subscriptions["imu.a"]['sinks'][0]
+        for msg in (b"bad", b"good"): # As the receive loop would queue them
+            sink['queue'].put_nowait((msg, "imu.a"))
+        for _ in range(100):
+            if got: break
+            await asyncio.sleep(0.01)
+        sub.close()
+        return got
+    assert asyncio.run(main()) == [b"good"]
+    assert "callback failed" in capsys.readouterr().err
+
+
+def test_topic_handles_are_awaited():
+    async def main():
+        pub = AsyncNexusPublisher()
+        handle = pub.topic("imu.a")
+        sent = handle.send(b"x")
+        assert asyncio.iscoroutine(sent)
+        await sent # Nothing is connected, the PUB socket just drops it
+        with pytest.raises(TypeError):
+            pub.topic("imu.a", direct=True)
+        pub.close()
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from starling import bag
+
+
+def _records(count=500):
+    t0 = 1_700_000_000 * 10**9
+    return [(("imu.thigh" if i % 3 else "cam.rgb"), t0 + i * 10**6, b"x" * (i % 50) + str(i).encode()) for i in range(count)]
+
+
+def _write(path, records, codec):
+    with bag.Writer(path, codec=codec, chunk_size=4096) as writer: # Small chunks, so the bag has several
+        for topic, t_ns, payload in records:
+            writer.write(topic, payload, t_ns)
+
+
+@pytest.mark.parametrize("codec", ["none", "gzip"])
+def test_round_trip(tmp_path, codec):
+    path = os.fspath(tmp_path / "run.bag")
+    records = _records()
+    _write(path, records, codec)
+    with bag.Reader(path) as reader:
+        assert len(reader.index.chunks) > 1
+        assert [(t, ns, bytes(p)) for t, ns, p in reader.read()] == records
+        assert reader.topics["cam.rgb"].count == sum(t == "cam.rgb" for t, _, _ in records)
+        assert [bytes(p) for _, _, p in reader.read(topics=["cam.#"])] == [p for t, _, p in records if t == "cam.rgb"]
+        start, end = records[100][1] / 1e9, records[199][1] / 1e9
+        assert [ns for _, ns, _ in reader.read(start=start, end=end)] == [ns for _, ns, _ in records[100:200]]
+
+
+def test_unindexed_bag_is_recovered(tmp_path):
+    path = os.fspath(tmp_path / "killed.bag")
+    records = _records()
+    _write(path, records, "gzip")
+    with bag.Reader(path) as reader:
+        last_chunk = reader.index.chunks[-1].offset
+    with open(path, "r+b") as f: # Drop the last chunk, the index and the trailer, as if the recorder was killed mid-write
+        f.truncate(last_chunk + bag.CHUNK_HEADER.size + 10)
+    with bag.Reader(path) as reader:
+        recovered = [(t, ns, bytes(p)) for t, ns, p in reader.read()]
+    assert recovered and recovered == records[:len(recovered)]
+
+
+def test_not_a_bag(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a bag file at all")
+    with pytest.raises(ValueError):
+        bag.Reader(os.fspath(path))
+
+
+def test_close_refuses_while_payloads_are_referenced(tmp_path):
+    path = os.fspath(tmp_path / "run.bag")
+    _write(path, _records(), "none")
+    reader = bag.Reader(path)
+    payload = next(reader.read())[2] # A view into the mapping
+    with pytest.raises(BufferError):
+        reader.close()
+    del payload
+    reader.close()
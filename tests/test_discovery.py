@@ -0,0 +1,26 @@
+from starling.discovery import NexusTracker, format_heartbeat
+
+
+def tracker_on(host: str) -> NexusTracker:
+    tracker = NexusTracker()
+    tracker.myips = {host}
+    return tracker
+
+
+def test_plain_nexuses_share_one_home_across_hosts():
+    # One non-federated nexus per host: every client must pick the same one, or the bus splits in two
+    homes = []
+    for host in ("10.0.0.1", "10.0.0.2"):
+        tracker = tracker_on(host)
+        tracker.heard(format_heartbeat(8989, 9898, "bbbb"), ("10.0.0.1", 8899))
+        tracker.heard(format_heartbeat(8989, 9898, "aaaa"), ("10.0.0.2", 8899))
+        homes.append(tracker.home)
+    assert homes == ["aaaa", "aaaa"]
+
+
+def test_federated_nexus_on_this_host_is_preferred():
+    tracker = tracker_on("10.0.0.1")
+    tracker.heard(format_heartbeat(8989, 9898, "aaaa", fed=8998), ("10.0.0.2", 8899))
+    tracker.heard(format_heartbeat(8989, 9898, "bbbb", fed=8998), ("10.0.0.1", 8899))
+    assert tracker.home == "bbbb"
+    assert tracker.endpoint('pub_port') == "tcp://127.0.0.1:8989"
@@ -0,0 +1,25 @@
+import threading
+
+import pytest
+
+from starling.dispatch import ThreadDispatcher
+
+
+@pytest.mark.parametrize("batch", [0, 10])
+def test_thread_dispatcher_survives_a_raising_callback(batch):
+    received = []
+    done = threading.Event()
+    def callback(msg, topic):
+        msgs = msg if batch else [msg]
+        if b"bad" in msgs: raise RuntimeError("callback failed")
+        received.extend(msgs)
+        if b"after" in msgs: done.set()
+    dispatcher = ThreadDispatcher()
+    info = {'cb': callback, 'dropped': 0, 'batch': batch}
+    dispatcher.add(info)
+    dispatcher.put(info, b"bad", "topic")
+    assert not done.wait(0.2)
+    dispatcher.put(info, b"after", "topic")
+    assert done.wait(5)
+    assert received == [b"after"]
+    dispatcher.remove(info)
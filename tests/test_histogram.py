@@ -0,0 +1,30 @@
+import numpy as np
+
+from starling.histogram import LogHistogram, SUB_BITS
+
+
+def test_quantiles_within_bucket_error():
+    values = np.random.default_rng(0).lognormal(mean=12, sigma=1.5, size=50_000).astype(np.int64)
+    hist = LogHistogram()
+    for value in values:
+        hist.record(value)
+    qs = [1, 50, 90, 99, 99.9]
+    for q, got in zip(qs, hist.percentiles(qs)):
+        exact = np.percentile(values, q, method="inverted_cdf")
+        assert abs(got - exact) <= exact / 2 ** (SUB_BITS - 1), q
+    assert hist.count == len(values)
+    assert hist.min == values.min() and hist.max == values.max()
+
+
+def test_small_values_are_exact():
+    hist = LogHistogram()
+    for value in range(1, 101):
+        hist.record(value)
+    assert hist.percentiles([1, 50, 100]) == [1, 50, 100]
+    assert hist.mean == 50.5
+
+
+def test_empty():
+    hist = LogHistogram()
+    assert hist.percentiles([50, 99]) == [0.0, 0.0]
+    assert hist.summary()['count'] == 0
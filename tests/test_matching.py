@@ -0,0 +1,48 @@
+import itertools
+
+import pytest
+
+from starling.matching import TopicMatcher
+from starling.subscription import to_regex, validate_topic
+
+
+def test_reserved_topics_need_an_explicit_pattern():
+    matcher = TopicMatcher()
+    for pattern in ("#", "*.stats", "#.direct", "_starling.#", "_starling.stats"):
+        matcher.add(pattern)
+    assert sorted(matcher.match("_starling.stats")) == ["_starling.#", "_starling.stats"]
+    assert matcher.match("_starling.direct") == ["_starling.#"]
+    assert sorted(matcher.match("imu.stats")) == ["#", "*.stats"]
+    assert sorted(matcher.match("_starlingx.stats")) == ["#", "*.stats"] # Only a first segment of exactly '_starling'
+
+
+@pytest.mark.parametrize("pattern, topic, matches", [
+    ("imu.*", "imu.thigh", True),
+    ("imu.*", "imu.thigh.data", False),
+    ("imu.#", "imu", True), # '#' may match no topic names at all
+    ("imu.#", "imu.thigh.data", True),
+    ("#.data", "data", True),
+    ("imu.#.data", "imu.data", True),
+    ("#.#.data", "data", True), # Every '#' of a chain may match nothing
+    ("#.#.*", "imu", True),
+    ("*.#.*", "imu", False), # Each '*' still needs a topic name of its own
+    ("*.#.*", "imu.data", True),
+])
+def test_wildcard_semantics(pattern, topic, matches):
+    matcher = TopicMatcher()
+    matcher.add(pattern)
+    assert bool(matcher.match(topic)) == matches
+    assert bool(to_regex(pattern).match(topic)) == matches
+
+
+def test_matcher_agrees_with_to_regex():
+    """Every valid pattern of up to four segments against every topic of up to five, both built from two names."""
+    topics = [".".join(p) for n in range(1, 6) for p in itertools.product("ab", repeat=n)]
+    for n in range(1, 5):
+        for segs in itertools.product(("a", "b", "*", "#"), repeat=n):
+            pattern = ".".join(segs)
+            if not validate_topic(pattern): continue
+            matcher, regex = TopicMatcher(), to_regex(pattern)
+            matcher.add(pattern)
+            for topic in topics:
+                assert bool(matcher.match(topic)) == bool(regex.match(topic)), (pattern, topic)
@@ -0,0 +1,50 @@
+import time
+
+import msgspec
+import zmq
+
+from starling.discovery import inproc_endpoint
+from starling.nexus import StarlingNexus, STATS_TOPIC
+from starling.sequence import Sequencer
+
+
+def test_sequenced_messages_are_counted_in_stats():
+    nexus = StarlingNexus(stats_interval=0.2)
+    nexus.start()
+    sub = nexus.ctx.socket(zmq.SUB)
+    sub.linger = 0
+    sub.rcvtimeo = 200
+    sub.setsockopt(zmq.SUBSCRIBE, b'')
+    sub.connect(inproc_endpoint(nexus.myid, 'pub'))
+    pub = nexus.ctx.socket(zmq.PUB)
+    pub.linger = 0
+    pub.connect(inproc_endpoint(nexus.myid, 'sub'))
+    sequencer = Sequencer("test")
+    try:
+        topic = None
+        deadline = time.monotonic() + 10
+        while topic is None and time.monotonic() < deadline:
+            pub.send_multipart([b"imu.seq", sequencer.header(b"imu.seq"), b"x" * 10])
+            try:
+                frames = sub.recv_multipart()
+            except zmq.Again:
+                continue
+            if frames[0] == STATS_TOPIC.encode():
+                topic = msgspec.json.decode(frames[1])['topics'].get("imu.seq")
+        assert topic is not None
+        assert topic['messages'] > 0
+        assert topic['bytes'] == 10 * topic['messages'] # The payload's size, not the header's
+    finally:
+        sub.close()
+        pub.close()
+        nexus.stop()
+
+
+def test_default_heartbeat_is_readable_by_older_clients():
+    nexus = StarlingNexus()
+    nexus.start()
+    try:
+        pub_port, sub_port, nexus_id = nexus._heartbeat_message().split(' ') # How clients before heartbeat extras parse it
+        assert nexus_id == nexus.myid
+    finally:
+        nexus.stop()
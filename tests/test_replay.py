@@ -0,0 +1,19 @@
+import os
+
+from starling import bag
+from starling.replay import SnapshotReplay
+
+
+def test_bag_replay_closes_its_reader(tmp_path):
+    path = os.fspath(tmp_path / "run.bag")
+    with bag.Writer(path, codec="none", chunk_size=4096) as writer: # Uncompressed, so payloads are views into the mapping
+        for i in range(3000):
+            writer.write("imu.thigh", b"x" * 32, 10**18 + i * 10**6)
+    replay = SnapshotReplay(path, speed=0)
+    replay.pub.nexus = {'test': {}} # play() waits for a nexus, the messages are just dropped without one
+    sent = []
+    replay.pub._send_raw = lambda raw, message, *args: sent.append(bytes(message))
+    replay.play()
+    replay.stop()
+    assert len(sent) == 3000 and sent[0] == b"x" * 32
+    assert replay.reader.fhandle.closed
@@ -0,0 +1,38 @@
+import os
+import threading
+import time
+
+from starling.snapshot_logger import SnapshotCollector, STOP_TIMEOUT
+
+
+def test_blocking_enqueue_gives_up_without_a_writer():
+    collector = SnapshotCollector(overflow="block", max_queued=1)
+    try:
+        collector.writet = threading.Thread(target=lambda: None)
+        collector.writet.start()
+        collector.writet.join() # A writer that has died
+        collector._enqueue(b"{}")
+        started = time.monotonic()
+        collector._enqueue(b"{}")
+        assert time.monotonic() - started < 4 * STOP_TIMEOUT
+        assert collector.dropped == 1
+    finally:
+        collector.writet = None
+        collector.sub.stop()
+
+
+def test_undecodable_messages_are_skipped(tmp_path):
+    collector = SnapshotCollector(codec="none")
+    collector.sub.nexus = {'fake': {}} # start() waits for a nexus, the tracker's own table is left alone
+    path = os.fspath(tmp_path / "snap.jsonl")
+    try:
+        collector.start(path)
+        for msg in (b'{"a": 1}', b'not json', b'{"a": 2}'):
+            collector._enqueue(msg)
+        collector.stop()
+    finally:
+        collector.sub.stop()
+    assert collector.stats()['invalid'] == 1
+    assert collector.stats()['written'] == 2
+    with open(path, "rb") as f:
+        assert f.read().splitlines() == [b'{"a":1}', b'{"a":2}']
@@ -0,0 +1,41 @@
+import threading
+import time
+
+from starling.nexus import StarlingNexus
+from starling.publication import NexusPublisher
+from starling.subscription import NexusSubscriber
+
+
+def _wait(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_subscription_changes_from_other_threads_apply():
+    nexus = StarlingNexus(stats_interval=0)
+    nexus.start()
+    sub = NexusSubscriber(dispatch="inline", transports=("inproc",))
+    pub = NexusPublisher(transports=("inproc",))
+    got = {}
+    record = lambda msg, topic: got.__setitem__(topic, got.get(topic, 0) + 1)
+    try:
+        # subscribe and unsubscribe only queue their socket changes, the recv thread applies them
+        worker = threading.Thread(target=sub.subscribe, args=("imu.a", record))
+        worker.start()
+        worker.join()
+        assert _wait(lambda: sub.endpoint and pub.endpoint)
+        assert _wait(lambda: pub.send("imu.a", b"x") is None and got.get("imu.a", 0) > 0)
+
+        sub.unsubscribe("imu.a")
+        sub.subscribe("imu.b", record)
+        assert _wait(lambda: pub.send("imu.b", b"x") is None and got.get("imu.b", 0) > 0)
+        before = got["imu.a"]
+        pub.send("imu.a", b"x")
+        time.sleep(0.2)
+        assert got["imu.a"] == before
+    finally:
+        pub.stop()
+        sub.stop()
+        nexus.stop()